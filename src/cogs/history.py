@@ -1,71 +1,126 @@
 import discord
 from discord.ext import commands
 from discord import app_commands
-import sqlite3  # Import SQLite
 import time
 from datetime import datetime
 from typing import Dict, Any, Set
 import asyncio
+from src.modlog import get_moderation_log
 
 class History(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
-        self.db_file = "data/moderation.db"  # Define o arquivo do banco de dados
-        self.conn = sqlite3.connect(self.db_file) # Conecta ao banco
-        self.cursor = self.conn.cursor() # Cria um cursor
-        self.create_table() # Chama a função para criar a tabela
-    def create_table(self):
-        self.cursor.execute("""
-            CREATE TABLE IF NOT EXISTS moderation_log (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
-                moderator_id INTEGER,
-                action TEXT,
-                reason TEXT,
-                timestamp INTEGER
+        # Log de moderação compartilhado com as outras cogs (o schema fica em src/modlog.py)
+        self.moderation_log = get_moderation_log(bot)
+
+    async def build_history_embed(self, member: discord.Member, rows, counts: Dict[str, int], page: int, per_page: int) -> discord.Embed:
+        embed = discord.Embed(
+            title=f"Histórico de Moderação de {member.display_name}",
+            color=discord.Color.dark_red()
+        )
+        embed.set_thumbnail(url=member.display_avatar.url if member.display_avatar else None)
+
+        total = sum(counts.values())
+        summary = " • ".join(f"**{action.capitalize()}:** {count}" for action, count in sorted(counts.items(), key=lambda item: -item[1]))
+        embed.description = f"Total de registros: **{total}**\n{summary}" if summary else f"Total de registros: **{total}**"
+
+        for action_id, moderator_id, action, reason, timestamp in rows:
+            timestamp_str = datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d %H:%M:%S")
+            embed.add_field(
+                name=f"#{action_id} - {(action or '').capitalize()} em {timestamp_str}",
+                value=f"**Moderador:** <@{moderator_id}>\n**Razão:** {reason}"[:1024],
+                inline=False
             )
-        """)
-        self.conn.commit()
-    def log_action(self, user_id: int, moderator_id: int, action: str, reason: str):
-        timestamp = int(time.time())
-        self.cursor.execute("INSERT INTO moderation_log (user_id, moderator_id, action, reason, timestamp) VALUES (?, ?, ?, ?, ?)",
-                            (user_id, moderator_id, action, reason, timestamp))
-        self.conn.commit()
+
+        total_pages = max(1, -(-total // per_page))
+        embed.set_footer(text=f"Página {page + 1}/{total_pages} • Histórico de moderação de {member.display_name}", icon_url=self.bot.user.display_avatar.url)
+        return embed
 
     @app_commands.command(name="history", description="Mostra o histórico de moderação de um usuário")
     @app_commands.describe(member="Membro para ver o histórico")
     async def history(self, interaction: discord.Interaction, member: discord.Member):
-        user_id = member.id
-
-        # Busca o histórico do usuário no banco de dados
-        self.cursor.execute("SELECT * FROM moderation_log WHERE user_id = ? ORDER BY timestamp DESC", (user_id,))
-        history_data = self.cursor.fetchall()
+        if not interaction.guild:
+            await interaction.response.send_message("Este comando só pode ser usado em um servidor.", ephemeral=True)
+            return
 
-        if not history_data:
+        view = HistoryView(self, interaction.user.id, interaction.guild.id, member)
+        # Busca só a primeira página e a contagem por ação (pool de leitura, fora do event loop)
+        if not await view.load_first():
             await interaction.response.send_message(f"Não há histórico de moderação para {member.display_name}.", ephemeral=True)
             return
 
-        embed = discord.Embed(
-            title=f"Histórico de Moderação de {member.display_name}",
-            color=discord.Color.dark_red()
+        embed = await view.build_embed()
+        await interaction.response.send_message(embed=embed, view=view)
+
+
+class HistoryView(discord.ui.View):
+    """Paginação do /history: cada botão busca só a página seguinte/anterior a partir da chave (timestamp, id) da atual."""
+
+    per_page = 10
+
+    def __init__(self, cog: History, author_id: int, guild_id: int, member: discord.Member):
+        super().__init__(timeout=180)
+        self.cog = cog
+        self.author_id = author_id
+        self.guild_id = guild_id
+        self.member = member
+        self.rows = []
+        self.counts: Dict[str, int] = {}
+        self.page = 0
+        self.has_newer = False
+        self.has_older = False
+
+    async def load_first(self) -> bool:
+        moderation_log = self.cog.moderation_log
+        rows, self.counts = await asyncio.gather(
+            moderation_log.history_page(self.guild_id, self.member.id, self.per_page + 1),
+            moderation_log.action_counts(self.guild_id, self.member.id)
         )
-        embed.set_thumbnail(url=member.display_avatar.url if member.display_avatar else None)
+        self.set_rows(rows, newer=False, older=len(rows) > self.per_page)
+        return bool(self.rows)
 
-        for entry in history_data:
-            action_id, user_id, moderator_id, action, reason, timestamp = entry
-            moderator = self.bot.get_user(moderator_id)
-            moderator_name = moderator.display_name if moderator else "Desconhecido"
-            timestamp_str = datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d %H:%M:%S")
+    def set_rows(self, rows, newer: bool, older: bool):
+        self.rows = rows[:self.per_page]
+        self.has_newer = newer
+        self.has_older = older
+        self.previous_page.disabled = not self.has_newer
+        self.next_page.disabled = not self.has_older
 
-            embed.add_field(
-                name=f"#{action_id} - {action.capitalize()} em {timestamp_str}",
-                value=f"**Moderador:** {moderator_name}\n**Razão:** {reason}",
-                inline=False
-            )
+    async def build_embed(self) -> discord.Embed:
+        return await self.cog.build_history_embed(self.member, self.rows, self.counts, self.page, self.per_page)
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        if interaction.user.id != self.author_id:
+            await interaction.response.send_message("Só quem usou o comando pode trocar de página.", ephemeral=True)
+            return False
+        return True
 
-        embed.set_footer(text=f"Histórico de moderação de {member.display_name}", icon_url=self.bot.user.display_avatar.url)
+    @discord.ui.button(label="Anterior", style=discord.ButtonStyle.secondary, emoji="◀️")
+    async def previous_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        first_id, _, _, _, first_timestamp = self.rows[0]
+        rows = await self.cog.moderation_log.history_page(self.guild_id, self.member.id, self.per_page + 1, after=(first_timestamp, first_id))
+        if not rows:
+            self.set_rows(self.rows, newer=False, older=self.has_older)
+            await interaction.response.edit_message(view=self)
+            return
+        # history_page devolve os mais recentes primeiro; o registro extra indica que ainda há páginas mais novas
+        newer = len(rows) > self.per_page
+        self.page = max(0, self.page - 1) if newer else 0
+        self.set_rows(rows[-self.per_page:], newer=newer, older=True)
+        await interaction.response.edit_message(embed=await self.build_embed(), view=self)
+
+    @discord.ui.button(label="Próxima", style=discord.ButtonStyle.secondary, emoji="▶️")
+    async def next_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        last_id, _, _, _, last_timestamp = self.rows[-1]
+        rows = await self.cog.moderation_log.history_page(self.guild_id, self.member.id, self.per_page + 1, before=(last_timestamp, last_id))
+        if not rows:
+            self.set_rows(self.rows, newer=self.has_newer, older=False)
+            await interaction.response.edit_message(view=self)
+            return
+        self.page += 1
+        self.set_rows(rows, newer=True, older=len(rows) > self.per_page)
+        await interaction.response.edit_message(embed=await self.build_embed(), view=self)
 
-        await interaction.response.send_message(embed=embed)
 
 async def setup(bot: commands.Bot):
-    await bot.add_cog(History(bot))
\ No newline at end of file
+    await bot.add_cog(History(bot))
@@ -3,173 +3,1190 @@ from discord.ext import commands
 from discord import app_commands
 import json
 import os
+import io
+import csv
+import math
+import tempfile
 import time
+import sqlite3
+from bisect import bisect_left, bisect_right, insort
+import heapq
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import Dict, Any, Set
+from typing import Dict, Any, Set, List, Tuple, Optional, Callable, Awaitable
 import asyncio
 
+# Pillow é opcional: sem ele o /level continua usando a barra de progresso em texto
+try:
+    from PIL import Image, ImageDraw, ImageFont
+except ImportError:
+    Image = None
+
 # Define the leveladmin command group globally
 #leveladmin = app_commands.Group(name="leveladmin", description="Comandos administrativos para o sistema de níveis")
 
+
+class LevelsStore:
+    """Armazenamento SQLite do sistema de níveis.
+
+    Todos os métodos são bloqueantes e devem rodar no executor de I/O da cog,
+    nunca diretamente no event loop.
+    """
+
+    def __init__(self, db_file: str):
+        self.db_file = db_file
+        self.conn: Optional[sqlite3.Connection] = None
+
+    def connect(self) -> sqlite3.Connection:
+        if self.conn is None:
+            self.conn = sqlite3.connect(self.db_file, check_same_thread=False)
+            # auto_vacuum só tem efeito em bancos novos; precisa vir antes da primeira tabela
+            self.conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            self.conn.execute("PRAGMA journal_mode = WAL")
+            self.conn.execute("PRAGMA synchronous = NORMAL")
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS users (
+                    user_id TEXT PRIMARY KEY,
+                    xp INTEGER NOT NULL DEFAULT 0,
+                    level INTEGER NOT NULL DEFAULT 0,
+                    buff TEXT
+                )
+            """)
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS settings (
+                    key TEXT PRIMARY KEY,
+                    value TEXT
+                )
+            """)
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS profiles (
+                    user_id TEXT PRIMARY KEY,
+                    display_name TEXT,
+                    avatar_key TEXT,
+                    avatar_url TEXT,
+                    updated_at REAL
+                )
+            """)
+            self.conn.commit()
+        return self.conn
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+    def load(self) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        conn = self.connect()
+        users = {
+            user_id: {"xp": xp, "level": level, "buff": json.loads(buff) if buff else None}
+            for user_id, xp, level, buff in conn.execute("SELECT user_id, xp, level, buff FROM users")
+        }
+        settings = {key: json.loads(value) for key, value in conn.execute("SELECT key, value FROM settings")}
+        return users, settings
+
+    def load_profiles(self) -> Dict[str, Dict[str, Any]]:
+        conn = self.connect()
+        return {
+            user_id: {"display_name": display_name, "avatar_key": avatar_key, "avatar_url": avatar_url, "updated_at": updated_at}
+            for user_id, display_name, avatar_key, avatar_url, updated_at in conn.execute(
+                "SELECT user_id, display_name, avatar_key, avatar_url, updated_at FROM profiles"
+            )
+        }
+
+    def write_changes(self, user_rows: List[Tuple[str, int, int, Optional[str]]], settings: Optional[Dict[str, Any]] = None, profile_rows: Optional[List[Tuple[str, str, Optional[str], Optional[str], float]]] = None):
+        # Upsert apenas dos usuários alterados desde o último flush, em uma única transação
+        conn = self.connect()
+        with conn:
+            conn.executemany(
+                "INSERT INTO users (user_id, xp, level, buff) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(user_id) DO UPDATE SET xp = excluded.xp, level = excluded.level, buff = excluded.buff",
+                user_rows,
+            )
+            if profile_rows:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO profiles (user_id, display_name, avatar_key, avatar_url, updated_at) VALUES (?, ?, ?, ?, ?)",
+                    profile_rows,
+                )
+            if settings:
+                conn.executemany(
+                    "INSERT INTO settings (key, value) VALUES (?, ?) "
+                    "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+                    [(key, json.dumps(value, ensure_ascii=False)) for key, value in settings.items()],
+                )
+
+    def export(self, fmt: str) -> str:
+        """Exporta os usuários do shard em CSV ou JSONL para um arquivo temporário, em blocos.
+
+        Retorna o caminho do arquivo; quem chama envia e apaga. Nem o banco nem o arquivo ficam inteiros na memória.
+        """
+        conn = self.connect()
+        rows = conn.execute("SELECT user_id, xp, level FROM users WHERE xp > 0 ORDER BY xp DESC")
+        with tempfile.NamedTemporaryFile("w", encoding="utf-8", newline="", suffix=f".{fmt}", delete=False) as f:
+            try:
+                writer = csv.writer(f) if fmt == "csv" else None
+                if writer:
+                    writer.writerow(["user_id", "xp", "level"])
+                while True:
+                    chunk = rows.fetchmany(EXPORT_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    if writer:
+                        writer.writerows(chunk)
+                    else:
+                        f.writelines(json.dumps({"user_id": user_id, "xp": xp, "level": level}) + "\n" for user_id, xp, level in chunk)
+            except BaseException:
+                f.close()
+                os.remove(f.name)
+                raise
+        return f.name
+
+    def compact(self):
+        # Remove usuários sem XP nem buff, devolve páginas livres e trunca o WAL
+        conn = self.connect()
+        with conn:
+            conn.execute("DELETE FROM users WHERE xp <= 0 AND buff IS NULL")
+            conn.execute("DELETE FROM profiles WHERE user_id NOT IN (SELECT user_id FROM users)")
+        conn.execute("PRAGMA incremental_vacuum")
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def import_legacy_json(self, json_file: str) -> bool:
+        """Importa o antigo data/levels.json para o banco, apenas se o banco ainda estiver vazio."""
+        conn = self.connect()
+        if not os.path.exists(json_file) or conn.execute("SELECT 1 FROM users LIMIT 1").fetchone():
+            return False
+        with open(json_file, "r", encoding="utf-8") as f:
+            try:
+                data = json.load(f)
+            except json.JSONDecodeError:
+                return False
+
+        rows = [
+            (user_id, user_data.get("xp", 0), user_data.get("level", 0), json.dumps(user_data["buff"]) if user_data.get("buff") else None)
+            for user_id, user_data in data.get("users", {}).items()
+        ]
+        self.write_changes(rows, {
+            "disabled_channels": data.get("disabled_channels", []),
+            "role_buffs": data.get("role_buffs", {}),
+        })
+        return True
+
+    def seed_from_legacy(self, legacy_db_file: str, member_ids: List[str], channel_ids: Set[int], role_ids: Set[str]):
+        """Copia para este shard os dados do antigo armazenamento global que pertencem ao servidor."""
+        if not os.path.exists(legacy_db_file):
+            return
+        conn = self.connect()
+        conn.execute("ATTACH DATABASE ? AS legacy", (legacy_db_file,))
+        try:
+            with conn:
+                conn.execute("CREATE TEMP TABLE IF NOT EXISTS seed_members (user_id TEXT PRIMARY KEY)")
+                conn.execute("DELETE FROM seed_members")
+                conn.executemany("INSERT OR IGNORE INTO seed_members (user_id) VALUES (?)", [(user_id,) for user_id in member_ids])
+                conn.execute("""
+                    INSERT OR IGNORE INTO users (user_id, xp, level, buff)
+                    SELECT u.user_id, u.xp, u.level, u.buff FROM legacy.users u
+                    JOIN seed_members m ON m.user_id = u.user_id
+                """)
+                conn.execute("DROP TABLE seed_members")
+            legacy_settings = {key: json.loads(value) for key, value in conn.execute("SELECT key, value FROM legacy.settings")}
+        finally:
+            conn.execute("DETACH DATABASE legacy")
+
+        self.write_changes([], {
+            "disabled_channels": [c for c in legacy_settings.get("disabled_channels", []) if c in channel_ids],
+            "role_buffs": {r: b for r, b in legacy_settings.get("role_buffs", {}).items() if r in role_ids},
+        })
+
+
+# Largest level kept in a curve's threshold table; higher levels are found by searching threshold()
+CURVE_TABLE_MAX_LEVEL = 4096
+# Largest XP accepted from imports and /addxp (exact in floats and far below SQLite's INTEGER limit)
+MAX_XP = 2 ** 53
+# Returned by threshold() when the curve overflows a float: higher than any storable XP
+THRESHOLD_OVERFLOW = 2 ** 1024
+
+
+class LevelCurve:
+    """Curva de níveis com tabela de thresholds pré-calculada.
+
+    `thresholds[level]` é o XP total necessário para alcançar `level`; descobrir o nível de um
+    XP é um bisect na tabela, sem sqrt nem alocação no caminho quente. A tabela tem tamanho
+    fixo: acima dela, curvas sem teto fazem uma busca binária em threshold().
+    """
+
+    type_name = ""
+    unbounded = True
+
+    def __init__(self):
+        self.thresholds: List[int] = [0]
+        self.extend_to(CURVE_TABLE_MAX_LEVEL)
+
+    def threshold(self, level: int) -> int:
+        raise NotImplementedError
+
+    def to_settings(self) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    def describe(self) -> str:
+        raise NotImplementedError
+
+    def extend_to(self, level: int):
+        # Only called at construction; stops early once thresholds pass any storable XP
+        for next_level in range(len(self.thresholds), min(level, CURVE_TABLE_MAX_LEVEL) + 1):
+            self.thresholds.append(self.threshold(next_level))
+            if self.thresholds[-1] > MAX_XP:
+                break
+
+    def level_for_xp(self, xp: int) -> int:
+        thresholds = self.thresholds
+        if self.unbounded and xp >= thresholds[-1]:
+            return self.level_beyond_table(xp)
+        return bisect_right(thresholds, xp) - 1
+
+    def level_beyond_table(self, xp: int) -> int:
+        # Exponential then binary search on threshold(): O(log level) calls, nothing is cached
+        low = len(self.thresholds) - 1
+        high = low * 2
+        while self.threshold(high) <= xp and self.threshold(high) < THRESHOLD_OVERFLOW:
+            low, high = high, high * 2
+        while high - low > 1:
+            middle = (low + high) // 2
+            if self.threshold(middle) <= xp:
+                low = middle
+            else:
+                high = middle
+        return low
+
+    def xp_for_level(self, level: int) -> int:
+        if level >= len(self.thresholds):
+            if not self.unbounded:
+                return self.thresholds[-1]
+            return self.threshold(level)
+        return self.thresholds[level]
+
+
+class QuadraticCurve(LevelCurve):
+    """XP para o nível N = (factor * N)²; com factor 10 é a fórmula original floor(0.1 * sqrt(xp))."""
+
+    type_name = "quadratic"
+
+    def __init__(self, factor: float = 10):
+        # factor < 1 would put several levels at 0 XP
+        if not 1 <= factor <= 10000:
+            raise ValueError("O fator da curva quadrática deve estar entre 1 e 10000.")
+        self.factor = factor
+        super().__init__()
+
+    def threshold(self, level: int) -> int:
+        try:
+            return int((self.factor * level) ** 2)
+        except OverflowError:
+            return THRESHOLD_OVERFLOW
+
+    def to_settings(self) -> Dict[str, Any]:
+        return {"type": self.type_name, "factor": self.factor}
+
+    def describe(self) -> str:
+        return f"Quadrática (XP = ({self.factor} × nível)²)"
+
+
+class ExponentialCurve(LevelCurve):
+    """Cada nível custa `growth` vezes o anterior, começando em `base` XP para o nível 1."""
+
+    type_name = "exponential"
+
+    def __init__(self, base: int = 100, growth: float = 1.2):
+        if not 1 <= base <= 10 ** 9 or not 1.01 <= growth <= 10:
+            raise ValueError("A curva exponencial precisa de base entre 1 e 1000000000 e crescimento entre 1.01 e 10.")
+        self.base = base
+        self.growth = growth
+        super().__init__()
+
+    def threshold(self, level: int) -> int:
+        # Soma geométrica base * (1 + g + ... + g^(level-1))
+        try:
+            return int(self.base * (self.growth ** level - 1) / (self.growth - 1))
+        except OverflowError:
+            return THRESHOLD_OVERFLOW
+
+    def to_settings(self) -> Dict[str, Any]:
+        return {"type": self.type_name, "base": self.base, "growth": self.growth}
+
+    def describe(self) -> str:
+        return f"Exponencial (base {self.base} XP, crescimento {self.growth}x por nível)"
+
+
+class TableCurve(LevelCurve):
+    """Thresholds definidos manualmente; o último valor é o nível máximo."""
+
+    type_name = "table"
+    unbounded = False
+
+    def __init__(self, table: List[int]):
+        if not table or any(b <= a for a, b in zip([0] + table, table)):
+            raise ValueError("A tabela deve ter valores positivos e estritamente crescentes.")
+        self.table = list(table)
+        self.thresholds = [0] + self.table
+
+    def to_settings(self) -> Dict[str, Any]:
+        return {"type": self.type_name, "table": self.table}
+
+    def describe(self) -> str:
+        return f"Tabela ({len(self.table)} níveis)"
+
+
+LEVEL_CURVES = {curve.type_name: curve for curve in (QuadraticCurve, ExponentialCurve, TableCurve)}
+DEFAULT_LEVEL_CURVE = {"type": "quadratic", "factor": 10}
+
+# Users applied per event loop iteration by the bulk XP pipeline
+BULK_CHUNK_SIZE = 1000
+# Rows fetched from the shard per write when exporting
+EXPORT_CHUNK_SIZE = 1000
+
+
+def parse_xp_import(data: bytes, filename: str) -> Tuple[List[Tuple[str, int]], int]:
+    """Lê um arquivo de importação (CSV com colunas user_id,xp ou JSONL com essas chaves).
+
+    Retorna ([(user_id, xp), ...], linhas_invalidas). Roda fora do event loop.
+    """
+    text = data.decode("utf-8-sig")
+    is_json = filename.lower().endswith(".jsonl") or filename.lower().endswith(".json")
+    if is_json:
+        records = (line for line in text.splitlines() if line.strip())
+    else:
+        records = csv.DictReader(io.StringIO(text))
+
+    entries = []
+    invalid = 0
+    for record in records:
+        try:
+            # A malformed JSONL line only invalidates itself, like a bad CSV row
+            if is_json:
+                record = json.loads(record)
+            user_id = str(int(record["user_id"]))
+            xp = parse_xp_value(record["xp"])
+        except (KeyError, TypeError, ValueError, OverflowError):
+            invalid += 1
+            continue
+        entries.append((user_id, max(0, xp)))
+    return entries, invalid
+
+
+def parse_xp_value(value) -> int:
+    """XP de uma linha importada: inteiro (ou decimal finito) até MAX_XP; qualquer outra coisa é ValueError."""
+    try:
+        xp = int(value)
+    except ValueError:
+        number = float(value)
+        if not math.isfinite(number):
+            raise ValueError(f"XP não finito: {value!r}")
+        xp = int(number)
+    if xp > MAX_XP:
+        raise ValueError(f"XP acima do limite de {MAX_XP}: {value!r}")
+    return xp
+
+
+# Number of steps of the rank card progress bar; XP changes inside one step reuse the cached card
+RANK_CARD_PROGRESS_STEPS = 50
+
+
+def load_card_font(size: int):
+    try:
+        return ImageFont.truetype("DejaVuSans-Bold.ttf", size)
+    except OSError:
+        return ImageFont.load_default()
+
+
+def render_rank_card_base(avatar_bytes: Optional[bytes], level: int, progress_step: int) -> bytes:
+    """Desenha a parte cacheável do cartão (avatar, nível e barra) em PNG. Função pura, executada no pool de renderização."""
+    width, height = 640, 180
+    card = Image.new("RGB", (width, height), (40, 0, 0))
+    draw = ImageDraw.Draw(card)
+
+    if avatar_bytes:
+        avatar = Image.open(io.BytesIO(avatar_bytes)).convert("RGBA").resize((128, 128))
+        mask = Image.new("L", (128, 128), 0)
+        ImageDraw.Draw(mask).ellipse((0, 0, 128, 128), fill=255)
+        card.paste(avatar, (26, 26), mask)
+
+    draw.text((180, 78), f"Nível {level}", font=load_card_font(22), fill=(230, 200, 200))
+
+    bar_left, bar_top, bar_right, bar_bottom = 180, 120, 610, 148
+    draw.rounded_rectangle((bar_left, bar_top, bar_right, bar_bottom), radius=14, fill=(90, 20, 20))
+    filled_right = bar_left + (bar_right - bar_left) * progress_step // RANK_CARD_PROGRESS_STEPS
+    if filled_right > bar_left + 28:
+        draw.rounded_rectangle((bar_left, bar_top, filled_right, bar_bottom), radius=14, fill=(200, 30, 30))
+
+    output = io.BytesIO()
+    card.save(output, format="PNG")
+    return output.getvalue()
+
+
+def render_rank_card(base: bytes, display_name: str, rank: Optional[int]) -> bytes:
+    """Escreve nome e posição (que mudam o tempo todo) sobre o cartão base em cache."""
+    card = Image.open(io.BytesIO(base)).convert("RGB")
+    draw = ImageDraw.Draw(card)
+    draw.text((180, 30), display_name[:24], font=load_card_font(30), fill=(255, 255, 255))
+    if rank:
+        draw.text((480, 78), f"#{rank}", font=load_card_font(22), fill=(255, 215, 0))
+
+    output = io.BytesIO()
+    card.save(output, format="PNG")
+    return output.getvalue()
+
+
+class RankCardCache:
+    """LRU das bases já renderizadas dos cartões de nível (sem nome e posição), limitado pelo total de bytes."""
+
+    def __init__(self, max_bytes: int = 16 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self.entries: "OrderedDict[Tuple, bytes]" = OrderedDict()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def get(self, key: Tuple) -> Optional[bytes]:
+        data = self.entries.get(key)
+        if data is None:
+            self.stats["misses"] += 1
+            return None
+        self.entries.move_to_end(key)
+        self.stats["hits"] += 1
+        return data
+
+    def put(self, key: Tuple, data: bytes):
+        if len(data) > self.max_bytes:
+            return
+        old = self.entries.pop(key, None)
+        if old is not None:
+            self.total_bytes -= len(old)
+        self.entries[key] = data
+        self.total_bytes += len(data)
+        while self.total_bytes > self.max_bytes:
+            _, evicted = self.entries.popitem(last=False)
+            self.total_bytes -= len(evicted)
+            self.stats["evictions"] += 1
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return self.stats["hits"] / lookups if lookups else 0.0
+
+
+class RankingIndex:
+    """Ranking de XP de um servidor, mantido incrementalmente.
+
+    Guarda uma lista ordenada de chaves (-xp, user_id): a posição de um usuário sai de um
+    bisect em O(log n) e o top-N / uma página do ranking é uma fatia da lista, sem reordenar.
+    """
+
+    def __init__(self):
+        self.keys: List[Tuple[int, int]] = []
+        self.xp_by_user: Dict[int, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def rebuild(self, users: Dict[str, Any]):
+        # Only used when a partition is loaded; afterwards every change goes through update()
+        self.xp_by_user = {int(user_id): data.get("xp", 0) for user_id, data in users.items() if data.get("xp", 0) > 0}
+        self.keys = sorted((-xp, user_id) for user_id, xp in self.xp_by_user.items())
+
+    def update(self, user_id: int, xp: int):
+        old_xp = self.xp_by_user.get(user_id)
+        if old_xp == xp:
+            return
+        if old_xp is not None:
+            del self.keys[bisect_left(self.keys, (-old_xp, user_id))]
+        if xp > 0:
+            insort(self.keys, (-xp, user_id))
+            self.xp_by_user[user_id] = xp
+        else:
+            self.xp_by_user.pop(user_id, None)
+
+    def rank(self, user_id: int) -> Optional[int]:
+        xp = self.xp_by_user.get(user_id)
+        if xp is None:
+            return None
+        return bisect_left(self.keys, (-xp, user_id)) + 1
+
+    def page(self, offset: int, limit: int) -> List[Tuple[int, int]]:
+        # Returns [(user_id, xp), ...] already in ranking order
+        return [(user_id, -neg_xp) for neg_xp, user_id in self.keys[offset:offset + limit]]
+
+
+class CooldownTable:
+    """Cooldowns de ganho de XP guardados em duas gerações de dicionários.
+
+    Uma entrada só precisa viver `window` segundos: a cada janela a geração atual vira a
+    anterior e a anterior é descartada inteira, então a memória fica limitada aos usuários
+    que falaram nas duas últimas janelas e cada consulta continua O(1).
+    """
+
+    def __init__(self, window: float):
+        self.window = window
+        self.current: Dict[str, float] = {}
+        self.previous: Dict[str, float] = {}
+        self.generation_started = time.time()
+
+    def __len__(self) -> int:
+        return len(self.current) + len(self.previous)
+
+    def rotate(self, current_time: float):
+        elapsed = current_time - self.generation_started
+        if elapsed < self.window:
+            return
+        # After two full windows of silence nothing in either generation can still be on cooldown
+        self.previous = self.current if elapsed < 2 * self.window else {}
+        self.current = {}
+        self.generation_started = current_time
+
+    def try_acquire(self, user_id: str, current_time: float) -> bool:
+        """Retorna True e inicia o cooldown se o usuário puder ganhar XP agora."""
+        self.rotate(current_time)
+        last_message = self.current.get(user_id)
+        if last_message is None:
+            last_message = self.previous.get(user_id)
+        if last_message is not None and current_time - last_message < self.window:
+            return False
+        self.current[user_id] = current_time
+        return True
+
+
+class TokenBucket:
+    """Token bucket simples: `capacity` envios em rajada, recarregando `rate` tokens por segundo."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+
+    def refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def wait_time(self) -> float:
+        # Seconds until one token is available (0 if one is available now)
+        self.refill(time.monotonic())
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def consume(self):
+        self.refill(time.monotonic())
+        self.tokens -= 1
+
+    def is_full(self, now: float) -> bool:
+        return self.tokens + (now - self.updated_at) * self.rate >= self.capacity
+
+
+class LevelUpAnnouncer:
+    """Fila de anúncios de level up agrupados por canal.
+
+    Level ups que chegam no mesmo canal dentro de `batch_window` segundos viram uma única
+    mensagem, e cada canal tem um token bucket que limita o ritmo de envio para não cair
+    nos rate limits (429) da API.
+    """
+
+    def __init__(self, batch_window: float = 3.0, rate: float = 0.5, burst: int = 3, max_batch: int = 20):
+        self.batch_window = batch_window
+        self.rate = rate
+        self.burst = burst
+        self.max_batch = max_batch
+        self.pending: Dict[int, Dict[int, Tuple[str, int]]] = {}  # {channel_id: {member_id: (mention, level)}}
+        self.overflow: Dict[int, int] = {}  # {channel_id: level ups left out of the pending batch}
+        self.buckets: Dict[int, TokenBucket] = {}
+        self.tasks: Dict[int, asyncio.Task] = {}
+        self.stats = {"queued": 0, "merged": 0, "dropped": 0, "sent": 0}
+
+    def announce(self, channel: discord.abc.Messageable, member: discord.Member, level: int):
+        self.stats["queued"] += 1
+        batch = self.pending.setdefault(channel.id, {})
+        if member.id in batch:
+            # Same member leveled twice before the flush: keep only the latest level
+            self.stats["merged"] += 1
+            batch[member.id] = (member.mention, level)
+        elif len(batch) < self.max_batch:
+            batch[member.id] = (member.mention, level)
+        else:
+            # Batch is full: the member only shows up in the "e mais N membro(s)" suffix
+            self.overflow[channel.id] = self.overflow.get(channel.id, 0) + 1
+            self.stats["merged"] += 1
+
+        if channel.id not in self.tasks:
+            self.tasks[channel.id] = asyncio.create_task(self.flush_channel(channel))
+
+    async def flush_channel(self, channel: discord.abc.Messageable):
+        cancelled = False
+        try:
+            await asyncio.sleep(self.batch_window)
+            bucket = self.buckets.setdefault(channel.id, TokenBucket(self.rate, self.burst))
+            delay = bucket.wait_time()
+            if delay:
+                # Keep collecting level ups while waiting for the channel's bucket
+                await asyncio.sleep(delay)
+            bucket.consume()
+
+            batch = self.pending.pop(channel.id, {})
+            overflow = self.overflow.pop(channel.id, 0)
+            if not batch:
+                return
+            self.stats["merged"] += len(batch) - 1
+            try:
+                await channel.send(self.format_batch(list(batch.values()), overflow), delete_after=10)
+                self.stats["sent"] += 1
+            except (discord.errors.NotFound, discord.errors.Forbidden):
+                # Channel gone or no permission: nothing to retry
+                self.stats["dropped"] += len(batch) + overflow
+            except discord.HTTPException as e:
+                print(f"Erro ao enviar anúncio de level up no canal {channel.id}: {e}")
+                self.stats["dropped"] += len(batch) + overflow
+        except asyncio.CancelledError:
+            cancelled = True
+            raise
+        finally:
+            if self.tasks.get(channel.id) is asyncio.current_task():
+                self.tasks.pop(channel.id, None)
+            if not cancelled and channel.id in self.pending:
+                # Level ups that arrived after the batch was taken get their own flush
+                self.tasks[channel.id] = asyncio.create_task(self.flush_channel(channel))
+
+    def format_batch(self, entries: List[Tuple[str, int]], overflow: int) -> str:
+        if len(entries) == 1 and not overflow:
+            mention, level = entries[0]
+            return f"🎉 Parabéns, {mention}! Você alcançou o Nível {level}! 🎉"
+        names = [f"{mention} (Nível {level})" for mention, level in entries]
+        if overflow:
+            names.append(f"mais {overflow} membro(s)")
+        listed = ", ".join(names[:-1]) + f" e {names[-1]}"
+        return f"🎉 Parabéns, {listed}! Vocês subiram de nível! 🎉"
+
+    def sweep(self):
+        # Drop token buckets of channels that are idle and fully refilled
+        now = time.monotonic()
+        for channel_id in [c for c, b in self.buckets.items() if c not in self.tasks and b.is_full(now)]:
+            del self.buckets[channel_id]
+
+    def cancel(self):
+        # Unloading drops queued announcements too, so nothing is sent after the cog is gone
+        for task in self.tasks.values():
+            task.cancel()
+        self.tasks.clear()
+        self.pending.clear()
+        self.overflow.clear()
+
+
+class GuildLevels:
+    """Partição de níveis de um único servidor: XP, canais desativados e buffs de cargo.
+
+    Cada partição tem seu próprio arquivo SQLite em data/levels/<guild_id>.db, é carregada
+    na primeira mensagem do servidor e descarregada após um período de inatividade.
+    """
+
+    def __init__(self, guild_id: int, store: LevelsStore, cooldown_seconds: float, xp_per_message: int):
+        self.guild_id = guild_id
+        self.store = store
+        self.xp_per_message = xp_per_message
+        self.curve_settings: Dict[str, Any] = DEFAULT_LEVEL_CURVE
+        self.curve: Optional[LevelCurve] = None  # Set by the cog from curve_settings
+        self.users: Dict[str, Any] = {}
+        self.disabled_channels: Set[int] = set()  # Channel IDs where XP is disabled
+        self.role_buffs: Dict[str, Dict[str, float]] = {}  # {role_id: {"multiplier": float, "expires_at": float}}
+        self.role_multipliers: Dict[int, float] = {}  # Live role buffs only {role_id: multiplier}, read on every message
+        self.buffed_users: Set[str] = set()  # Users with a live personal buff
+        self.cooldowns = CooldownTable(cooldown_seconds)
+        self.ranking = RankingIndex()
+        self.bulk_running = False  # Only one import/recompute per guild at a time
+        self.profiles: Dict[str, Dict[str, Any]] = {}  # {user_id: {"display_name", "avatar_key", "avatar_url", "updated_at"}}
+        self.dirty_profiles: Set[str] = set()
+        self.dirty_users: Set[str] = set()
+        self.settings_dirty = False
+        self.last_active = time.time()
+
+    def apply_loaded(self, users: Dict[str, Any], settings: Dict[str, Any]) -> List[Tuple[float, str, str]]:
+        """Aplica os dados carregados e retorna os buffs ainda ativos como (expires_at, kind, target_id)."""
+        self.users = users
+        self.disabled_channels = set(settings.get("disabled_channels", []))
+        self.cooldowns.window = settings.get("cooldown_seconds", self.cooldowns.window)
+        self.xp_per_message = settings.get("xp_per_message", self.xp_per_message)
+        self.curve_settings = settings.get("level_curve", self.curve_settings)
+        self.ranking.rebuild(users)
+
+        # Buffs that expired while the partition was unloaded are dropped here instead of by the scheduler
+        current_time = time.time()
+        live_buffs = []
+        for role_id, buff_data in settings.get("role_buffs", {}).items():
+            if buff_data.get("expires_at", 0) > current_time:
+                self.set_role_buff(role_id, buff_data.get("multiplier", 1.0), buff_data["expires_at"])
+                live_buffs.append((buff_data["expires_at"], "role", role_id))
+            else:
+                self.settings_dirty = True
+        for user_id, user_data in users.items():
+            user_buff = user_data.get("buff")
+            if not user_buff:
+                continue
+            if user_buff.get("expires_at", 0) > current_time:
+                self.buffed_users.add(user_id)
+                live_buffs.append((user_buff["expires_at"], "user", user_id))
+            else:
+                user_data["buff"] = None
+                self.mark_dirty(user_id)
+        return live_buffs
+
+    def set_role_buff(self, role_id: str, multiplier: float, expires_at: float):
+        self.role_buffs[role_id] = {"multiplier": multiplier, "expires_at": expires_at}
+        self.role_multipliers[int(role_id)] = multiplier
+        self.settings_dirty = True
+
+    def remove_role_buff(self, role_id: str) -> bool:
+        if self.role_buffs.pop(role_id, None) is None:
+            return False
+        self.role_multipliers.pop(int(role_id), None)
+        self.settings_dirty = True
+        return True
+
+    def set_user_buff(self, user_id: str, multiplier: float, expires_at: float):
+        self.get_user(user_id)["buff"] = {"multiplier": multiplier, "expires_at": expires_at}
+        self.buffed_users.add(user_id)
+        self.mark_dirty(user_id)
+
+    def expire_buff(self, kind: str, target_id: str, current_time: float) -> bool:
+        # Heap entries can be stale (buff removed or renewed), so only expire what is really due
+        if kind == "role":
+            buff_data = self.role_buffs.get(target_id)
+            if buff_data and buff_data.get("expires_at", 0) <= current_time:
+                return self.remove_role_buff(target_id)
+            return False
+        user_data = self.users.get(target_id)
+        user_buff = user_data.get("buff") if user_data else None
+        if user_buff and user_buff.get("expires_at", 0) <= current_time:
+            user_data["buff"] = None
+            self.buffed_users.discard(target_id)
+            self.mark_dirty(target_id)
+            return True
+        return False
+
+    def get_user(self, user_id: str) -> Dict[str, Any]:
+        # Ensure user exists in data with default values if not
+        user_data = self.users.get(user_id)
+        if user_data is None:
+            user_data = self.users[user_id] = {"xp": 0, "level": 0, "buff": None}
+        return user_data
+
+    def mark_dirty(self, user_id: str):
+        self.dirty_users.add(user_id)
+
+    def set_xp(self, user_id: str, xp: int) -> Dict[str, Any]:
+        # Single entry point for XP changes, keeps the ranking index and the dirty set in sync
+        user_data = self.get_user(user_id)
+        user_data["xp"] = xp
+        self.ranking.update(int(user_id), xp)
+        self.mark_dirty(user_id)
+        return user_data
+
+    def remember_profile(self, member: discord.abc.User):
+        """Atualiza o perfil em cache do membro; só marca para salvar se algo mudou."""
+        user_id = str(member.id)
+        avatar = member.display_avatar
+        avatar_key = avatar.key if avatar else None
+        profile = self.profiles.get(user_id)
+        if profile and profile["display_name"] == member.display_name and profile["avatar_key"] == avatar_key:
+            return
+        self.profiles[user_id] = {
+            "display_name": member.display_name,
+            "avatar_key": avatar_key,
+            "avatar_url": avatar.url if avatar else None,
+            "updated_at": time.time(),
+        }
+        self.dirty_profiles.add(user_id)
+
+    def take_profile_rows(self) -> Tuple[Set[str], List[Tuple[str, str, Optional[str], Optional[str], float]]]:
+        dirty_profiles, self.dirty_profiles = self.dirty_profiles, set()
+        rows = []
+        for user_id in dirty_profiles:
+            profile = self.profiles.get(user_id)
+            if profile:
+                rows.append((user_id, profile["display_name"], profile["avatar_key"], profile["avatar_url"], profile["updated_at"]))
+        return dirty_profiles, rows
+
+    @property
+    def is_dirty(self) -> bool:
+        return bool(self.dirty_users) or self.settings_dirty or bool(self.dirty_profiles)
+
+    def take_changes(self) -> Tuple[Set[str], List[Tuple[str, int, int, Optional[str]]], Optional[Dict[str, Any]]]:
+        # Swap the dirty set out before yielding, so changes made during the write land in the next flush
+        dirty_users, self.dirty_users = self.dirty_users, set()
+        user_rows = []
+        for user_id in dirty_users:
+            user_data = self.users.get(user_id)
+            if user_data is None:
+                continue
+            buff = user_data.get("buff")
+            user_rows.append((user_id, user_data.get("xp", 0), user_data.get("level", 0), json.dumps(buff) if buff else None))
+
+        settings = None
+        if self.settings_dirty:
+            self.settings_dirty = False
+            current_time = time.time()
+            settings = {
+                "disabled_channels": list(self.disabled_channels),
+                "role_buffs": {k: v for k, v in self.role_buffs.items() if v.get("expires_at", 0) > current_time},
+                "cooldown_seconds": self.cooldowns.window,
+                "xp_per_message": self.xp_per_message,
+                "level_curve": self.curve_settings,
+            }
+        return dirty_users, user_rows, settings
+
+    def restore_changes(self, dirty_users: Set[str], settings: Optional[Dict[str, Any]]):
+        # Keep the changes pending so the next flush retries them
+        self.dirty_users |= dirty_users
+        if settings is not None:
+            self.settings_dirty = True
+
+
 class Levels(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
-        self.levels_file = "data/levels.json"
-        self.levels_data: Dict[str, Any] = {} # Use type hinting
-        self.xp_per_message = 15
-        self.cooldown_seconds = 60
-        self.user_message_cooldowns: Dict[str, float] = {} # {user_id: last_message_timestamp}
-        self.disabled_channels: Set[int] = set()  # Store channel IDs where XP is disabled
-        self.role_buffs: Dict[str, Dict[str, float]] = {}  # Store active role buffs {role_id: {"multiplier": float, "expires_at": float}}
+        self.levels_file = "data/levels.json"  # Legacy file, only read once to migrate into legacy_db_file
+        self.legacy_db_file = "data/levels.db"  # Legacy global store, only used to seed new guild shards
+        self.levels_dir = "data/levels"
+        self.guilds: Dict[int, GuildLevels] = {}  # Loaded partitions {guild_id: GuildLevels}
+        self.guild_load_locks: Dict[int, asyncio.Lock] = {}
+        self.profile_max_age = 7 * 86400  # Cached profiles older than this are refreshed in the background
+        self.profile_refresh_tasks: Set[asyncio.Task] = set()
+        self.xp_per_message = 15  # Default for guilds that never ran /levelconfig setxppermessage
+        self.curves: Dict[str, LevelCurve] = {}  # Shared curve tables, keyed by their settings
+        self.cooldown_seconds = 60  # Default for guilds that never ran /levelconfig setcooldown
         self.save_interval = 60
+        self.guild_idle_timeout = 1800  # Seconds without activity before a guild partition is unloaded
+        self.compact_interval = 3600  # Seconds between store compactions
+        self.last_compact = time.time()
+
+        # Min-heap of (expires_at, guild_id, kind, target_id) for personal and role buffs
+        self.buff_expirations: List[Tuple[float, int, str, str]] = []
+        self.buff_wakeup = asyncio.Event()
+
+        # Level up messages are coalesced per channel and rate limited
+        self.announcer = LevelUpAnnouncer()
+
+        # Rank cards are rendered off the event loop and cached as PNG bytes
+        self.rank_cards = RankCardCache()
+        self.render_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="levels-render") if Image else None
 
         # Ensure data directory exists
-        os.makedirs("data", exist_ok=True)
+        os.makedirs(self.levels_dir, exist_ok=True)
 
-        # Load levels data, disabled channels, and role buffs
-        self.load_levels_data()
+        # All disk I/O runs on a single worker thread, which also keeps writes ordered
+        self.io_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="levels-io")
 
         # Start the background task to save levels data
         self.save_task = self.bot.loop.create_task(self.save_levels_loop())
+        self.buff_task = self.bot.loop.create_task(self.buff_expiry_loop())
 
-    def cog_unload(self):
-        # Cancel the save task when the cog is unloaded
+    async def cog_unload(self):
+        # Cancel the background tasks when the cog is unloaded and flush whatever is still pending
         self.save_task.cancel()
+        self.buff_task.cancel()
+        self.announcer.cancel()
+        for task in self.profile_refresh_tasks:
+            task.cancel()
+        await self.save_levels_data()
+        for guild_levels in self.guilds.values():
+            await self.bot.loop.run_in_executor(self.io_executor, guild_levels.store.close)
+        self.guilds.clear()
+        self.io_executor.shutdown(wait=False)
+        if self.render_executor:
+            self.render_executor.shutdown(wait=False)
 
     async def save_levels_loop(self):
         await self.bot.wait_until_ready()
         while not self.bot.is_closed():
             await asyncio.sleep(self.save_interval)
             await self.save_levels_data()
+            current_time = time.time()
+            for guild_levels in self.guilds.values():
+                guild_levels.cooldowns.rotate(current_time)
+            self.announcer.sweep()
+            await self.evict_idle_guilds()
+            if time.time() - self.last_compact >= self.compact_interval:
+                self.last_compact = time.time()
+                for guild_levels in list(self.guilds.values()):
+                    try:
+                        await self.bot.loop.run_in_executor(self.io_executor, guild_levels.store.compact)
+                    except Exception as e:
+                        print(f"Error compacting levels store for guild {guild_levels.guild_id}: {e}")
 
-    def load_levels_data(self):
-        if os.path.exists(self.levels_file):
-            with open(self.levels_file, "r", encoding="utf-8") as f:
-                try:
-                    data = json.load(f)
-                    self.levels_data = data.get("users", {})
-                    self.disabled_channels = set(data.get("disabled_channels", []))
-                    self.role_buffs = data.get("role_buffs", {})
-
-                    # Ensure all users in loaded data have a 'buff' key, default to None
-                    for user_data in self.levels_data.values():
-                        user_data.setdefault("buff", None)
-
-                except json.JSONDecodeError:
-                    self.levels_data = {}
-                    self.disabled_channels = set()
-                    self.role_buffs = {}
-        else:
-            self.levels_data = {}
-            self.disabled_channels = set()
-            self.role_buffs = {}
-
-    async def save_levels_data(self):
-        # Before saving, remove 'buff': None entries from users and expired role buffs to keep the file cleaner
-        users_to_save = {k: v for k, v in self.levels_data.items() if v.get("buff") is not None or v.get("xp") > 0}
-
+    def load_guild_shard(self, store: LevelsStore, seed: Optional[Tuple[List[str], Set[int], Set[str]]]) -> Tuple[Dict[str, Any], Dict[str, Any], Dict[str, Any]]:
+        # Runs on the I/O thread
+        if seed is not None:
+            legacy_store = LevelsStore(self.legacy_db_file)
+            try:
+                if legacy_store.import_legacy_json(self.levels_file):
+                    print(f"Dados de níveis migrados de {self.levels_file} para {self.legacy_db_file}.")
+            finally:
+                legacy_store.close()
+            store.seed_from_legacy(self.legacy_db_file, *seed)
+        users, settings = store.load()
+        return users, settings, store.load_profiles()
+
+    async def get_guild_levels(self, guild: discord.Guild) -> GuildLevels:
+        guild_levels = self.guilds.get(guild.id)
+        if guild_levels is None:
+            lock = self.guild_load_locks.setdefault(guild.id, asyncio.Lock())
+            async with lock:
+                guild_levels = self.guilds.get(guild.id)
+                if guild_levels is None:
+                    db_file = os.path.join(self.levels_dir, f"{guild.id}.db")
+                    seed = None
+                    if not os.path.exists(db_file):
+                        # New shard: pull this guild's members out of the old global store, if there is one
+                        seed = (
+                            [str(m.id) for m in guild.members],
+                            {c.id for c in guild.channels},
+                            {str(r.id) for r in guild.roles},
+                        )
+                    guild_levels = GuildLevels(guild.id, LevelsStore(db_file), self.cooldown_seconds, self.xp_per_message)
+                    try:
+                        users, settings, profiles = await self.bot.loop.run_in_executor(self.io_executor, self.load_guild_shard, guild_levels.store, seed)
+                    except sqlite3.Error as e:
+                        print(f"Error loading levels data for guild {guild.id}: {e}")
+                        users, settings, profiles = {}, {}, {}
+                    guild_levels.profiles = profiles
+                    for expires_at, kind, target_id in guild_levels.apply_loaded(users, settings):
+                        self.schedule_buff_expiry(guild.id, kind, target_id, expires_at)
+                    try:
+                        guild_levels.curve = self.get_curve(guild_levels.curve_settings)
+                    except (KeyError, TypeError, ValueError) as e:
+                        print(f"Curva de níveis inválida no servidor {guild.id}, usando a padrão: {e}")
+                        guild_levels.curve = self.get_curve(DEFAULT_LEVEL_CURVE)
+                    self.guilds[guild.id] = guild_levels
+            self.guild_load_locks.pop(guild.id, None)
+        guild_levels.last_active = time.time()
+        return guild_levels
+
+    def schedule_buff_expiry(self, guild_id: int, kind: str, target_id: str, expires_at: float):
+        heapq.heappush(self.buff_expirations, (expires_at, guild_id, kind, target_id))
+        if self.buff_expirations[0][0] == expires_at:
+            # New earliest deadline, wake the scheduler so it can re-arm its timer
+            self.buff_wakeup.set()
+
+    async def buff_expiry_loop(self):
+        await self.bot.wait_until_ready()
+        while not self.bot.is_closed():
+            current_time = time.time()
+            while self.buff_expirations and self.buff_expirations[0][0] <= current_time:
+                _, guild_id, kind, target_id = heapq.heappop(self.buff_expirations)
+                guild_levels = self.guilds.get(guild_id)
+                # Unloaded guilds drop their expired buffs on the next load
+                if guild_levels and guild_levels.expire_buff(kind, target_id, current_time):
+                    if kind == "role":
+                        print(f"Buff de XP para o cargo {target_id} expirado e removido.")  # Log for debugging
+                    else:
+                        print(f"Buff de XP pessoal expirado para o usuário {target_id}.")  # Log for debugging
+
+            timeout = self.buff_expirations[0][0] - current_time if self.buff_expirations else None
+            self.buff_wakeup.clear()
+            try:
+                await asyncio.wait_for(self.buff_wakeup.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def resolve_profiles(self, guild: discord.Guild, guild_levels: GuildLevels, user_ids: List[int]) -> Dict[int, Dict[str, Any]]:
+        """Resolve nome e avatar de vários usuários sem chamadas REST.
+
+        Usa o cache de membros quando disponível e, fora dele, os perfis persistidos no shard.
+        Usuários sem perfil são buscados juntos em uma única requisição pelo gateway; perfis
+        antigos são atualizados em segundo plano.
+        """
+        profiles = {}
+        missing = []
+        stale = []
         current_time = time.time()
-        active_role_buffs = {k: v for k, v in self.role_buffs.items() if v.get("expires_at", 0) > current_time}
-
-        data_to_save = {
-            "users": users_to_save,
-            "disabled_channels": list(self.disabled_channels),
-            "role_buffs": active_role_buffs,
-        }
-        try:
-            with open(self.levels_file, "w", encoding="utf-8") as f:
-                json.dump(data_to_save, f, ensure_ascii=False, indent=4)
-        except Exception as e:
-            print(f"Error saving levels data: {e}")
-
-    def get_user_xp(self, user_id: int) -> int:
-        return self.levels_data.get(str(user_id), {}).get("xp", 0)
+        for user_id in user_ids:
+            user = guild.get_member(user_id) or self.bot.get_user(user_id)
+            if user:
+                guild_levels.remember_profile(user)
+            profile = guild_levels.profiles.get(str(user_id))
+            if profile is None:
+                missing.append(user_id)
+                continue
+            profiles[user_id] = profile
+            if not user and current_time - (profile["updated_at"] or 0) > self.profile_max_age:
+                stale.append(user_id)
+
+        if missing:
+            try:
+                # Bounded so an interaction can still be answered within Discord's 3 seconds
+                await asyncio.wait_for(self.refresh_profiles(guild, guild_levels, missing), timeout=2)
+            except asyncio.TimeoutError:
+                pass
+            for user_id in missing:
+                profile = guild_levels.profiles.get(str(user_id))
+                if profile:
+                    profiles[user_id] = profile
+        if stale:
+            task = asyncio.create_task(self.refresh_profiles(guild, guild_levels, stale))
+            self.profile_refresh_tasks.add(task)
+            task.add_done_callback(self.profile_refresh_tasks.discard)
+        return profiles
+
+    async def refresh_profiles(self, guild: discord.Guild, guild_levels: GuildLevels, user_ids: List[int]):
+        # A single gateway member request covers up to 100 users
+        for start in range(0, len(user_ids), 100):
+            try:
+                members = await guild.query_members(user_ids=user_ids[start:start + 100], cache=False)
+            except (asyncio.TimeoutError, discord.ClientException) as e:
+                print(f"Não foi possível atualizar perfis no servidor {guild.id}: {e}")
+                return
+            for member in members:
+                guild_levels.remember_profile(member)
+
+    async def evict_idle_guilds(self):
+        current_time = time.time()
+        idle = [g for g in self.guilds.values() if current_time - g.last_active >= self.guild_idle_timeout and not g.is_dirty]
+        for guild_levels in idle:
+            del self.guilds[guild_levels.guild_id]
+            await self.bot.loop.run_in_executor(self.io_executor, guild_levels.store.close)
 
-    def get_user_level(self, user_id: int) -> int:
-        xp = self.get_user_xp(user_id)
-        # Simple leveling formula: level = floor(0.1 * sqrt(xp))
-        # Ensure result is non-negative
-        return max(0, int(0.1 * (xp ** 0.5)))
+    async def save_levels_data(self):
+        for guild_levels in list(self.guilds.values()):
+            if not guild_levels.is_dirty:
+                continue
+            dirty_users, user_rows, settings = guild_levels.take_changes()
+            dirty_profiles, profile_rows = guild_levels.take_profile_rows()
+            try:
+                await self.bot.loop.run_in_executor(self.io_executor, guild_levels.store.write_changes, user_rows, settings, profile_rows)
+            except Exception as e:
+                print(f"Error saving levels data for guild {guild_levels.guild_id}: {e}")
+                guild_levels.restore_changes(dirty_users, settings)
+                guild_levels.dirty_profiles |= dirty_profiles
+
+    def get_user_xp(self, guild_levels: GuildLevels, user_id: int) -> int:
+        return guild_levels.users.get(str(user_id), {}).get("xp", 0)
+
+    def get_user_level(self, guild_levels: GuildLevels, user_id: int) -> int:
+        return guild_levels.curve.level_for_xp(self.get_user_xp(guild_levels, user_id))
+
+    def get_curve(self, curve_settings: Dict[str, Any]) -> LevelCurve:
+        # Guilds with the same curve share one precomputed threshold table
+        key = json.dumps(curve_settings, sort_keys=True)
+        curve = self.curves.get(key)
+        if curve is None:
+            params = {k: v for k, v in curve_settings.items() if k != "type"}
+            curve = self.curves[key] = LEVEL_CURVES[curve_settings["type"]](**params)
+        return curve
+
+    async def bulk_update_xp(self, guild_levels: GuildLevels, updates: List[Tuple[str, int]], progress: Optional[Callable[[int, int], Awaitable[None]]] = None) -> int:
+        """Aplica [(user_id, xp)] ao servidor em blocos, cedendo o event loop entre eles.
+
+        Os níveis são recalculados com a curva atual e o ranking é reconstruído uma única vez
+        no final, em vez de um insort por usuário. Retorna quantos usuários mudaram.
+        """
+        curve = guild_levels.curve
+        total = len(updates)
+        changed = 0
+        for start in range(0, total, BULK_CHUNK_SIZE):
+            for user_id, xp in updates[start:start + BULK_CHUNK_SIZE]:
+                user_data = guild_levels.get_user(user_id)
+                level = curve.level_for_xp(xp)
+                if user_data["xp"] != xp or user_data.get("level") != level:
+                    user_data["xp"] = xp
+                    user_data["level"] = level
+                    guild_levels.mark_dirty(user_id)
+                    changed += 1
+            if progress:
+                await progress(min(start + BULK_CHUNK_SIZE, total), total)
+            await asyncio.sleep(0)
+        guild_levels.ranking.rebuild(guild_levels.users)
+        return changed
+
+    def make_progress_reporter(self, interaction: discord.Interaction, label: str) -> Callable[[int, int], Awaitable[None]]:
+        last_report = 0.0
+
+        async def report(done: int, total: int):
+            nonlocal last_report
+            # Edit at most every 2 seconds to stay clear of rate limits
+            if done < total and time.monotonic() - last_report < 2:
+                return
+            last_report = time.monotonic()
+            try:
+                await interaction.edit_original_response(content=f"🔄 {label}: {done}/{total} membros processados...")
+            except discord.HTTPException:
+                pass
 
-    def get_xp_for_next_level(self, level: int) -> int:
-        # Inverse of the leveling formula to find XP needed for the next level
-        # xp = (level / 0.1)^2 = (level * 10)^2
-        next_level = level + 1
-        return (next_level * 10) ** 2
+        return report
 
     # --- Listeners ---
     @commands.Cog.listener()
     async def on_message(self, message: discord.Message):
         # Ignore bot messages, messages in DMs, or messages in disabled channels
-        if message.author.bot or not message.guild or message.channel.id in self.disabled_channels:
+        if message.author.bot or not message.guild:
+            return
+
+        guild_levels = await self.get_guild_levels(message.guild)
+        if message.channel.id in guild_levels.disabled_channels:
             return
 
         user_id = str(message.author.id)
         current_time = time.time()
+        guild_levels.remember_profile(message.author)
 
-        # Check cooldown
-        if user_id in self.user_message_cooldowns and current_time - self.user_message_cooldowns[user_id] < self.cooldown_seconds:
+        # Check cooldown (also starts it for the user)
+        if not guild_levels.cooldowns.try_acquire(user_id, current_time):
             return  # User is on cooldown
 
-        # Update cooldown for the user
-        self.user_message_cooldowns[user_id] = current_time
-
-        # Ensure user exists in data with default values if not
-        if user_id not in self.levels_data:
-            self.levels_data[user_id] = {"xp": 0, "level": 0, "buff": None}
+        user_data = guild_levels.get_user(user_id)
 
         # --- Buff Logic ---
         effective_multiplier = 1.0
 
-        # Check personal buff
-        user_buff = self.levels_data[user_id].get("buff")
+        # Expired buffs are removed by `buff_expiry_loop`, so anything still here is live
+        user_buff = user_data.get("buff")
         if user_buff:
-            if current_time < user_buff.get("expires_at", 0):
-                effective_multiplier = max(effective_multiplier, user_buff.get("multiplier", 1.0))
-            else:
-                # Buff has expired, remove it
-                self.levels_data[user_id]["buff"] = None
-                print(f"Buff de XP pessoal expirado para {message.author.display_name}.")  # Log for debugging
-                # Consider sending a message to the user informing them their buff expired
-
-        # Check role buffs
-        # Clean up expired role buffs first
-        expired_role_ids = [role_id for role_id, buff_data in self.role_buffs.items() if buff_data.get("expires_at", 0) < current_time]
-        for role_id in expired_role_ids:
-            del self.role_buffs[role_id]
-            print(f"Buff de XP para o cargo {role_id} expirado e removido.")  # Log for debugging
-            # Consider logging this event or sending a message to admins
-
-        # Check if the user has any role with an active buff
-        if message.author.roles:
+            effective_multiplier = max(effective_multiplier, user_buff.get("multiplier", 1.0))
+
+        # Check if the user has any role with an active buff (skipped entirely when the guild has none)
+        role_multipliers = guild_levels.role_multipliers
+        if role_multipliers:
             for role in message.author.roles:
-                role_buff = self.role_buffs.get(str(role.id))
-                if role_buff and current_time < role_buff.get("expires_at", 0):
-                    effective_multiplier = max(effective_multiplier, role_buff.get("multiplier", 1.0))
+                multiplier = role_multipliers.get(role.id)
+                if multiplier:
+                    effective_multiplier = max(effective_multiplier, multiplier)
 
         # Calculate XP to add based on the effective multiplier
-        xp_to_add = int(self.xp_per_message * effective_multiplier)
+        xp_to_add = int(guild_levels.xp_per_message * effective_multiplier)
         if effective_multiplier > 1.0:
             print(f"Aplicando multiplicador de XP ({effective_multiplier}x) para {message.author.display_name}. XP a adicionar: {xp_to_add}")  # Log for debugging when buff is applied
 
         # Add XP
-        current_level = self.get_user_level(int(user_id))
-        self.levels_data[user_id]["xp"] += xp_to_add
-        new_level = self.get_user_level(int(user_id))
+        curve = guild_levels.curve
+        current_level = curve.level_for_xp(user_data["xp"])
+        guild_levels.set_xp(user_id, user_data["xp"] + xp_to_add)
+        new_level = curve.level_for_xp(user_data["xp"])
 
         # Level up message
         if new_level > current_level:
-            self.levels_data[user_id]["level"] = new_level
-            try:
-                await message.channel.send(f"🎉 Parabéns, {message.author.mention}! Você alcançou o Nível {new_level}! 🎉", delete_after=10)
-            except discord.errors.NotFound:
-                pass  # Message might have been deleted before the bot could send the response
+            user_data["level"] = new_level
+            self.announcer.announce(message.channel, message.author, new_level)
+
+        # Saving is handled by the background task `save_levels_loop`, which only writes dirty users.
 
-        # Save data (consider saving less frequently for performance on very active servers)
-        # Saving is handled by the background task `save_levels_loop` now.
+    @commands.Cog.listener()
+    async def on_member_update(self, before: discord.Member, after: discord.Member):
+        # Only keep profiles fresh for loaded guilds and members that have XP
+        guild_levels = self.guilds.get(after.guild.id)
+        if guild_levels and str(after.id) in guild_levels.users:
+            guild_levels.remember_profile(after)
+
+    @commands.Cog.listener()
+    async def on_user_update(self, before: discord.User, after: discord.User):
+        user_id = str(after.id)
+        for guild_levels in self.guilds.values():
+            if user_id in guild_levels.profiles:
+                guild = self.bot.get_guild(guild_levels.guild_id)
+                member = guild.get_member(after.id) if guild else None
+                guild_levels.remember_profile(member or after)
 
     # --- Admin Level Config Group ---
-    levelconfig = app_commands.Group(name="levelconfig", description="Comandos de configuração do sistema de níveis")
+    levelconfig = app_commands.Group(name="levelconfig", description="Comandos de configuração do sistema de níveis", guild_only=True)
 
     @levelconfig.command(name="setxppermessage", description="Define a quantidade de XP ganha por mensagem enviada")
     @app_commands.describe(amount="A quantidade de XP para cada mensagem")
@@ -179,13 +1196,165 @@ class Levels(commands.Cog):
             await interaction.response.send_message("A quantidade de XP por mensagem não pode ser negativa.", ephemeral=True)
             return
 
-        self.xp_per_message = amount
-        # Since xp_per_message is a setting, we should save it.
-        # For now, it's only in memory. A more robust solution would save settings to the data file.
-        # await self.save_levels_data() # Need to add settings to save data
+        guild_levels = await self.get_guild_levels(interaction.guild)
+        guild_levels.xp_per_message = amount
+        guild_levels.settings_dirty = True  # Persisted with the guild settings on the next flush
 
         await interaction.response.send_message(f"✅ Quantidade de XP por mensagem definida para {amount}.", ephemeral=True)
 
+    @levelconfig.command(name="setcooldown", description="Define o intervalo mínimo entre mensagens que dão XP")
+    @app_commands.describe(seconds="Intervalo em segundos (0 para desativar)")
+    @app_commands.checks.has_permissions(administrator=True)
+    async def setcooldown(self, interaction: discord.Interaction, seconds: int):
+        if seconds < 0:
+            await interaction.response.send_message("O cooldown não pode ser negativo.", ephemeral=True)
+            return
+
+        guild_levels = await self.get_guild_levels(interaction.guild)
+        guild_levels.cooldowns.window = seconds
+        guild_levels.settings_dirty = True
+
+        await interaction.response.send_message(f"✅ Cooldown de XP definido para {seconds} segundos.", ephemeral=True)
+
+    @levelconfig.command(name="setcurve", description="Define a curva de XP necessária para cada nível")
+    @app_commands.describe(
+        curve="Tipo de curva",
+        factor="Quadrática: XP do nível N = (fator × N)² (padrão 10)",
+        base="Exponencial: XP para o nível 1 (padrão 100)",
+        growth="Exponencial: quanto cada nível custa a mais que o anterior (padrão 1.2)",
+        table="Tabela: XP total de cada nível separado por vírgulas (ex: 100,300,700)",
+    )
+    @app_commands.choices(curve=[
+        app_commands.Choice(name="Quadrática", value="quadratic"),
+        app_commands.Choice(name="Exponencial", value="exponential"),
+        app_commands.Choice(name="Tabela", value="table"),
+    ])
+    @app_commands.checks.has_permissions(administrator=True)
+    async def setcurve(self, interaction: discord.Interaction, curve: str, factor: float = 10.0, base: int = 100, growth: float = 1.2, table: str = ""):
+        if curve == "quadratic":
+            curve_settings = {"type": curve, "factor": factor}
+        elif curve == "exponential":
+            curve_settings = {"type": curve, "base": base, "growth": growth}
+        else:
+            try:
+                curve_settings = {"type": curve, "table": [int(v) for v in table.replace(" ", "").split(",") if v]}
+            except ValueError:
+                await interaction.response.send_message("A tabela deve conter apenas números inteiros separados por vírgulas.", ephemeral=True)
+                return
+
+        try:
+            level_curve = self.get_curve(curve_settings)
+        except ValueError as e:
+            await interaction.response.send_message(f"❌ {e}", ephemeral=True)
+            return
+
+        guild_levels = await self.get_guild_levels(interaction.guild)
+        if guild_levels.bulk_running:
+            await interaction.response.send_message("Já existe uma importação ou recálculo em andamento neste servidor.", ephemeral=True)
+            return
+
+        await interaction.response.defer(ephemeral=True)
+        guild_levels.bulk_running = True
+        try:
+            guild_levels.curve_settings = level_curve.to_settings()
+            guild_levels.curve = level_curve
+            guild_levels.settings_dirty = True
+
+            # Stored levels follow the new curve
+            updates = [(user_id, user_data.get("xp", 0)) for user_id, user_data in guild_levels.users.items()]
+            await self.bulk_update_xp(guild_levels, updates, self.make_progress_reporter(interaction, "Recalculando níveis"))
+        finally:
+            guild_levels.bulk_running = False
+
+        await interaction.edit_original_response(content=f"✅ Curva de níveis definida: {level_curve.describe()}.")
+
+    @levelconfig.command(name="recompute", description="Multiplica o XP de todos os membros e recalcula os níveis")
+    @app_commands.describe(multiplier="Multiplicador aplicado ao XP de todos (ex: 0.5 para metade, 0 para zerar)")
+    @app_commands.checks.has_permissions(administrator=True)
+    async def recompute(self, interaction: discord.Interaction, multiplier: float = 1.0):
+        if multiplier < 0:
+            await interaction.response.send_message("O multiplicador não pode ser negativo.", ephemeral=True)
+            return
+
+        guild_levels = await self.get_guild_levels(interaction.guild)
+        if guild_levels.bulk_running:
+            await interaction.response.send_message("Já existe uma importação ou recálculo em andamento neste servidor.", ephemeral=True)
+            return
+
+        await interaction.response.defer(ephemeral=True)
+        guild_levels.bulk_running = True
+        try:
+            updates = [(user_id, int(user_data.get("xp", 0) * multiplier)) for user_id, user_data in guild_levels.users.items()]
+            changed = await self.bulk_update_xp(guild_levels, updates, self.make_progress_reporter(interaction, "Recalculando XP"))
+        finally:
+            guild_levels.bulk_running = False
+
+        await interaction.edit_original_response(content=f"✅ XP multiplicado por {multiplier} e níveis recalculados. {changed} membros alterados.")
+
+    @levelconfig.command(name="exportxp", description="Exporta o XP de todos os membros em CSV ou JSONL")
+    @app_commands.describe(format="Formato do arquivo")
+    @app_commands.choices(format=[
+        app_commands.Choice(name="CSV", value="csv"),
+        app_commands.Choice(name="JSONL", value="jsonl"),
+    ])
+    @app_commands.checks.has_permissions(administrator=True)
+    async def exportxp(self, interaction: discord.Interaction, format: str = "csv"):
+        await interaction.response.defer(ephemeral=True)
+        guild_levels = await self.get_guild_levels(interaction.guild)
+
+        # Flush first so the export, read straight from the shard on the I/O thread, is up to date
+        await self.save_levels_data()
+        try:
+            path = await self.bot.loop.run_in_executor(self.io_executor, guild_levels.store.export, format)
+        except (sqlite3.Error, OSError) as e:
+            await interaction.followup.send(f"❌ Erro ao exportar os dados: {e}", ephemeral=True)
+            return
+
+        # discord.File reads the temp file while uploading, so the export is never held in memory
+        try:
+            file = discord.File(path, filename=f"xp_{interaction.guild.id}.{format}")
+            try:
+                await interaction.followup.send("📤 Exportação concluída.", file=file, ephemeral=True)
+            finally:
+                file.close()
+        finally:
+            os.remove(path)
+
+    @levelconfig.command(name="importxp", description="Importa XP de um arquivo CSV (user_id,xp) ou JSONL")
+    @app_commands.describe(file="Arquivo .csv ou .jsonl com as colunas user_id e xp", mode="Substituir o XP atual ou somar a ele")
+    @app_commands.choices(mode=[
+        app_commands.Choice(name="Substituir", value="set"),
+        app_commands.Choice(name="Somar", value="add"),
+    ])
+    @app_commands.checks.has_permissions(administrator=True)
+    async def importxp(self, interaction: discord.Interaction, file: discord.Attachment, mode: str = "set"):
+        guild_levels = await self.get_guild_levels(interaction.guild)
+        if guild_levels.bulk_running:
+            await interaction.response.send_message("Já existe uma importação ou recálculo em andamento neste servidor.", ephemeral=True)
+            return
+
+        await interaction.response.defer(ephemeral=True)
+        guild_levels.bulk_running = True
+        try:
+            data = await file.read()
+            entries, invalid = await asyncio.to_thread(parse_xp_import, data, file.filename)
+            if mode == "add":
+                entries = [(user_id, min(MAX_XP, guild_levels.users.get(user_id, {}).get("xp", 0) + xp)) for user_id, xp in entries]
+            changed = await self.bulk_update_xp(guild_levels, entries, self.make_progress_reporter(interaction, "Importando XP"))
+        except (UnicodeDecodeError, json.JSONDecodeError, csv.Error) as e:
+            await interaction.edit_original_response(content=f"❌ Não foi possível ler o arquivo: {e}")
+            return
+        except discord.HTTPException as e:
+            await interaction.edit_original_response(content=f"❌ Não foi possível baixar o arquivo: {e}")
+            return
+        finally:
+            guild_levels.bulk_running = False
+
+        message = f"✅ Importação concluída: {len(entries)} linhas lidas, {changed} membros alterados."
+        if invalid:
+            message += f" {invalid} linhas inválidas foram ignoradas."
+        await interaction.edit_original_response(content=message)
+
     @levelconfig.command(name="addrolebuff", description="Aplica um buff de ganho de XP a um cargo")
     @app_commands.describe(role="Cargo para aplicar o buff", multiplier="Multiplicador de XP (ex: 2 para dobro)", duration_minutes="Duração do buff em minutos")
     @app_commands.checks.has_permissions(administrator=True)
@@ -197,14 +1366,13 @@ class Levels(commands.Cog):
             await interaction.response.send_message("A duração deve ser maior que zero minutos.", ephemeral=True)
             return
 
+        guild_levels = await self.get_guild_levels(interaction.guild)
         role_id = str(role.id)
         current_time = time.time()
         expires_at = current_time + (duration_minutes * 60)
 
-        self.role_buffs[role_id] = {
-            "multiplier": multiplier,
-            "expires_at": expires_at,
-        }
+        guild_levels.set_role_buff(role_id, multiplier, expires_at)
+        self.schedule_buff_expiry(interaction.guild.id, "role", role_id, expires_at)
 
         expiry_datetime = datetime.fromtimestamp(expires_at)
         await interaction.response.send_message(
@@ -216,10 +1384,10 @@ class Levels(commands.Cog):
     @app_commands.describe(role="Cargo para remover o buff")
     @app_commands.checks.has_permissions(administrator=True)
     async def removerolebuff(self, interaction: discord.Interaction, role: discord.Role):
+        guild_levels = await self.get_guild_levels(interaction.guild)
         role_id = str(role.id)
 
-        if role_id in self.role_buffs:
-            del self.role_buffs[role_id]
+        if guild_levels.remove_role_buff(role_id):
             await interaction.response.send_message(f"✅ Buff de XP removido do cargo {role.name}.", ephemeral=True)
         else:
             await interaction.response.send_message(f"❌ O cargo {role.name} não possui um buff de XP ativo.", ephemeral=True)
@@ -231,48 +1399,32 @@ class Levels(commands.Cog):
             title="✨ Buffs de XP Ativos ✨",
             color=0x9932CC  # Purple
         )
-        current_time = time.time()
+        guild_levels = await self.get_guild_levels(interaction.guild)
         found_buffs = False
 
-        # List Role Buffs
+        # List Role Buffs (role_buffs only holds live buffs)
         role_buffs_text = ""
-        for role_id, buff_data in self.role_buffs.items():
-            expires_at = buff_data.get("expires_at", 0)
-            if expires_at > current_time:
-                found_buffs = True
-                try:
-                    # Fetch role name (requires bot to be in guild where role exists)
-                    guild = interaction.guild
-                    role = guild.get_role(int(role_id)) if guild else None
-                    role_name = role.name if role else f"Unknown Role ({role_id})"
-
-                    expiry_datetime = datetime.fromtimestamp(expires_at)
-                    role_buffs_text += f"**{role_name}**: {buff_data.get("multiplier", 1.0)}x (Expira em {expiry_datetime.strftime('%Y-%m-%d %H:%M:%S')})\n"
-                except Exception as e:
-                     print(f"Error fetching role for buff listing: {e}") # Log error but continue
-                     role_buffs_text += f"**Unknown Role ({role_id})**: {buff_data.get("multiplier", 1.0)}x (Expira em {datetime.fromtimestamp(expires_at).strftime('%Y-%m-%d %H:%M:%S')})\n"
+        for role_id, buff_data in guild_levels.role_buffs.items():
+            found_buffs = True
+            role = interaction.guild.get_role(int(role_id))
+            role_name = role.name if role else f"Unknown Role ({role_id})"
+            expiry_datetime = datetime.fromtimestamp(buff_data.get("expires_at", 0))
+            role_buffs_text += f"**{role_name}**: {buff_data.get('multiplier', 1.0)}x (Expira em {expiry_datetime.strftime('%Y-%m-%d %H:%M:%S')})\n"
 
         if role_buffs_text:
             embed.add_field(name="👥 Buffs de Cargo", value=role_buffs_text, inline=False)
 
-        # List User Buffs
+        # List User Buffs (only users tracked as buffed, not the whole partition)
         user_buffs_text = ""
-        for user_id, user_data in self.levels_data.items():
-            user_buff = user_data.get("buff")
-            if user_buff:
-                 expires_at = user_buff.get("expires_at", 0)
-                 if expires_at > current_time:
-                    found_buffs = True
-                    try:
-                        # Fetch user (requires user to be in bot's cache or guild)
-                        user = self.bot.get_user(int(user_id))
-                        user_name = user.display_name if user else f"Unknown User ({user_id})"
-
-                        expiry_datetime = datetime.fromtimestamp(expires_at)
-                        user_buffs_text += f"**{user_name}**: {user_buff.get("multiplier", 1.0)}x (Expira em {expiry_datetime.strftime('%Y-%m-%d %H:%M:%S')})\n"
-                    except Exception as e:
-                        print(f"Error fetching user for buff listing: {e}") # Log error but continue
-                        user_buffs_text += f"**Unknown User ({user_id})**: {user_buff.get("multiplier", 1.0)}x (Expira em {datetime.fromtimestamp(expires_at).strftime('%Y-%m-%d %H:%M:%S')})\n"
+        # Snapshot before awaiting: a buff can expire (and be set to None) while profiles are resolved
+        user_buffs = {user_id: dict(guild_levels.users[user_id]["buff"]) for user_id in guild_levels.buffed_users if guild_levels.users.get(user_id, {}).get("buff")}
+        profiles = await self.resolve_profiles(interaction.guild, guild_levels, [int(user_id) for user_id in user_buffs])
+        for user_id, user_buff in user_buffs.items():
+            found_buffs = True
+            profile = profiles.get(int(user_id))
+            user_name = profile["display_name"] if profile else f"Unknown User ({user_id})"
+            expiry_datetime = datetime.fromtimestamp(user_buff.get("expires_at", 0))
+            user_buffs_text += f"**{user_name}**: {user_buff.get('multiplier', 1.0)}x (Expira em {expiry_datetime.strftime('%Y-%m-%d %H:%M:%S')})\n"
 
         if user_buffs_text:
             embed.add_field(name="👤 Buffs de Membro", value=user_buffs_text, inline=False)
@@ -282,39 +1434,72 @@ class Levels(commands.Cog):
 
         await interaction.response.send_message(embed=embed, ephemeral=True)
 
+    @levelconfig.command(name="stats", description="Mostra métricas internas do sistema de níveis")
+    @app_commands.checks.has_permissions(administrator=True)
+    async def stats(self, interaction: discord.Interaction):
+        embed = discord.Embed(title="📊 Métricas do Sistema de Níveis", color=0x9932CC)
+        announcer_stats = self.announcer.stats
+        embed.add_field(
+            name="📣 Anúncios de Level Up",
+            value=(
+                f"**Recebidos:** {announcer_stats['queued']}\n"
+                f"**Agrupados:** {announcer_stats['merged']}\n"
+                f"**Descartados:** {announcer_stats['dropped']}\n"
+                f"**Mensagens enviadas:** {announcer_stats['sent']}"
+            ),
+            inline=False,
+        )
+        card_stats = self.rank_cards.stats
+        embed.add_field(
+            name="🖼️ Cache de Cartões de Nível",
+            value=(
+                f"**Acertos:** {card_stats['hits']} ({self.rank_cards.hit_rate:.1%})\n"
+                f"**Falhas:** {card_stats['misses']}\n"
+                f"**Remoções:** {card_stats['evictions']}\n"
+                f"**Em cache:** {len(self.rank_cards.entries)} cartões, {self.rank_cards.total_bytes / 1024:.0f} KiB"
+            ) if self.render_executor else "Desativado (Pillow não instalado)",
+            inline=False,
+        )
+        embed.add_field(name="🗂️ Servidores Carregados", value=str(len(self.guilds)), inline=True)
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+
     @levelconfig.command(name="togglelevelupmessage", description="Ativa/desativa mensagens de level up em um canal")
     @app_commands.describe(channel="Canal para alternar o estado das mensagens de level up")
     @app_commands.checks.has_permissions(administrator=True)
     async def togglelevelupmessage(self, interaction: discord.Interaction, channel: discord.TextChannel):
+        guild_levels = await self.get_guild_levels(interaction.guild)
         channel_id = channel.id
 
-        if channel_id in self.disabled_channels:
-            self.disabled_channels.remove(channel_id)
+        if channel_id in guild_levels.disabled_channels:
+            guild_levels.disabled_channels.remove(channel_id)
             await interaction.response.send_message(f"✅ Mensagens de level up ativadas no canal {channel.mention}.", ephemeral=True)
         else:
-            self.disabled_channels.add(channel_id)
+            guild_levels.disabled_channels.add(channel_id)
             await interaction.response.send_message(f"❌ Mensagens de level up desativadas no canal {channel.mention}.", ephemeral=True)
 
-        # Note: self.disabled_channels is saved by the background task.
+        # Note: disabled_channels is saved by the background task.
+        guild_levels.settings_dirty = True
 
     # --- User Commands ---
     @app_commands.command(name="level", description="Mostra seu nível e XP atual")
     @app_commands.describe(member="Membro para verificar o nível (opcional)")
+    @app_commands.guild_only()
     async def level(self, interaction: discord.Interaction, member: discord.Member = None):
+        guild_levels = await self.get_guild_levels(interaction.guild)
         user = member if member else interaction.user
         user_id = str(user.id)
 
-        if user_id not in self.levels_data or "xp" not in self.levels_data[user_id]:
+        if user_id not in guild_levels.users or "xp" not in guild_levels.users[user_id]:
             if user == interaction.user:
                 await interaction.response.send_message("Você ainda não ganhou nenhum XP. Comece a conversar para subir de nível!", ephemeral=True)
             else:
                 await interaction.response.send_message(f"{user.display_name} ainda não ganhou nenhum XP.", ephemeral=True)
             return
 
-        xp = self.get_user_xp(int(user_id))
-        level = self.get_user_level(int(user_id))
-        xp_for_current_level_start = self.get_xp_for_next_level(level - 1) if level > 0 else 0
-        xp_needed_for_next_level = self.get_xp_for_next_level(level)
+        xp = self.get_user_xp(guild_levels, int(user_id))
+        level = guild_levels.curve.level_for_xp(xp)
+        xp_for_current_level_start = guild_levels.curve.xp_for_level(level)
+        xp_needed_for_next_level = guild_levels.curve.xp_for_level(level + 1)
         xp_in_current_level = xp - xp_for_current_level_start
         total_xp_for_level = xp_needed_for_next_level - xp_for_current_level_start
 
@@ -334,37 +1519,73 @@ class Levels(commands.Cog):
             color=0x8B0000  # Dark Red color
         )
 
-        if user.display_avatar:
+        # Fetching the avatar and rendering can take longer than the 3s Discord gives to respond
+        await interaction.response.defer()
+        rank = guild_levels.ranking.rank(user.id)
+        card = await self.get_rank_card(guild_levels, user, level, rank, progress_percentage)
+
+        if card:
+            embed.set_image(url="attachment://rank_card.png")
+        elif user.display_avatar:
             embed.set_thumbnail(url=user.display_avatar.url)
 
         embed.add_field(name="🌟 Nível Atual", value=level, inline=True)  # Aesthetic field name
         embed.add_field(name="✨ XP Total", value=xp, inline=True)  # Aesthetic field name
-        embed.add_field(name="📈 Progresso para o Próximo Nível", value=f"{bar}\n{xp_in_current_level}/{total_xp_for_level} XP ({progress_percentage:.2f}%)", inline=False)  # Added progress bar to the value
+        if rank:
+            embed.add_field(name="🏅 Posição no Ranking", value=f"#{rank} de {len(guild_levels.ranking)}", inline=True)
+        progress_text = f"{xp_in_current_level}/{total_xp_for_level} XP ({progress_percentage:.2f}%)"
+        embed.add_field(name="📈 Progresso para o Próximo Nível", value=progress_text if card else f"{bar}\n{progress_text}", inline=False)  # Added progress bar to the value
 
         embed.set_footer(text="Continue conversando para subir de nível!", icon_url=self.bot.user.display_avatar.url)  # Add footer with bot avatar
 
-        await interaction.response.send_message(embed=embed)
+        if card:
+            await interaction.followup.send(embed=embed, file=discord.File(io.BytesIO(card), filename="rank_card.png"))
+        else:
+            await interaction.followup.send(embed=embed)
+
+    async def get_rank_card(self, guild_levels: GuildLevels, user: discord.abc.User, level: int, rank: Optional[int], progress_percentage: float) -> Optional[bytes]:
+        if not self.render_executor:
+            return None
+
+        progress_step = min(RANK_CARD_PROGRESS_STEPS, int(progress_percentage * RANK_CARD_PROGRESS_STEPS // 100))
+        avatar_key = user.display_avatar.key if user.display_avatar else None
+        # Only user, XP bucket and avatar go in the key: rank and name are drawn on top of the cached base
+        key = (guild_levels.guild_id, user.id, level, progress_step, avatar_key)
+        try:
+            base = self.rank_cards.get(key)
+            if base is None:
+                avatar_bytes = await user.display_avatar.replace(size=128, format="png").read() if user.display_avatar else None
+                base = await self.bot.loop.run_in_executor(self.render_executor, render_rank_card_base, avatar_bytes, level, progress_step)
+                self.rank_cards.put(key, base)
+            return await self.bot.loop.run_in_executor(self.render_executor, render_rank_card, base, user.display_name, rank)
+        except Exception as e:
+            print(f"Erro ao gerar o cartão de nível de {user.id}: {e}")
+            return None
 
     @app_commands.command(name="leaderboard", description="Mostra o ranking de níveis do servidor")
     @app_commands.guild_only()  # This command only makes sense in a guild
+    @app_commands.describe(limit="Quantidade de membros por página (máx. 25)")
     async def leaderboard(self, interaction: discord.Interaction, limit: int = 10):
-        if not self.levels_data:
+        guild_levels = await self.get_guild_levels(interaction.guild)
+        if not guild_levels.users:
             await interaction.response.send_message("Ainda não há dados de nível para exibir no ranking.", ephemeral=True)
             return
 
-        # Get users with XP and sort them by XP in descending order
-        sorted_users = sorted(
-            [(user_id, data["xp"]) for user_id, data in self.levels_data.items() if data["xp"] > 0],
-            key=lambda item: item[1],
-            reverse=True,
-        )
-
-        if not sorted_users:
-            await interaction.response.send_message("Ainda n��o há usuários com XP para exibir no ranking.", ephemeral=True)
+        if not len(guild_levels.ranking):
+            await interaction.response.send_message("Ainda não há usuários com XP para exibir no ranking.", ephemeral=True)
             return
 
-        # Limit the number of users to display
-        top_users = sorted_users[:limit]
+        # Embeds aceitam no máximo 25 campos
+        per_page = max(1, min(limit, 25))
+        view = LeaderboardView(self, guild_levels, per_page)
+        embed = await self.build_leaderboard_embed(interaction.guild, guild_levels, 0, per_page)
+        await interaction.response.send_message(embed=embed, view=view)
+
+    async def build_leaderboard_embed(self, guild: discord.Guild, guild_levels: GuildLevels, page: int, per_page: int) -> discord.Embed:
+        total_pages = max(1, -(-len(guild_levels.ranking) // per_page))
+        offset = page * per_page
+        page_users = guild_levels.ranking.page(offset, per_page)
+        profiles = await self.resolve_profiles(guild, guild_levels, [user_id for user_id, _ in page_users])
 
         embed = discord.Embed(
             title="🏆 Ranking de Níveis do Servidor 🏆",  # Título Estético
@@ -372,25 +1593,23 @@ class Levels(commands.Cog):
         )
 
         # Adiciona um campo para cada usuário no ranking
-        for rank, (user_id, xp) in enumerate(top_users, 1):
-            user = self.bot.get_user(int(user_id))
+        for rank, (user_id, xp) in enumerate(page_users, offset + 1):
+            profile = profiles.get(user_id)
 
-            if user:
-                level = self.get_user_level(int(user_id))
-                # Pega o avatar do usuário (se disponível)
-                avatar = user.display_avatar.url if user.display_avatar else None
+            if profile:
+                level = guild_levels.curve.level_for_xp(xp)
 
                 # Cria a descrição do campo com emoji, nome, nível e XP
                 description = f"**Nível:** {level}\n**XP:** {xp}"
 
                 # Adiciona o campo ao embed
                 embed.add_field(
-                    name=f"#{rank} - {user.display_name}",  # Título do campo: Posição - Nome
+                    name=f"#{rank} - {profile['display_name']}",  # Título do campo: Posição - Nome
                     value=description,  # Descrição: Nível e XP
                     inline=False,  # Garante que cada usuário fique em uma linha separada
                 )
-                if rank == 1 and user.display_avatar:  # apenas no primeiro lugar
-                    embed.set_thumbnail(url=user.display_avatar.url)
+                if rank == 1 and profile["avatar_url"]:  # apenas no primeiro lugar
+                    embed.set_thumbnail(url=profile["avatar_url"])
 
             else:
                 # Se o usuário não for encontrado
@@ -400,9 +1619,8 @@ class Levels(commands.Cog):
                     inline=False,
                 )
 
-        embed.set_footer(text=f"Exibindo os Top {len(top_users)}", icon_url=self.bot.user.display_avatar.url)
-
-        await interaction.response.send_message(embed=embed)
+        embed.set_footer(text=f"Página {page + 1}/{total_pages} • {len(guild_levels.ranking)} membros no ranking", icon_url=self.bot.user.display_avatar.url)
+        return embed
 
     level_rewards = {
         5: "Cargo VIP",
@@ -427,35 +1645,35 @@ class Levels(commands.Cog):
     @app_commands.command(name="addxp", description="Adiciona XP a um membro")
     @app_commands.describe(member="Membro para adicionar XP", xp="Quantidade de XP para adicionar")
     @app_commands.checks.has_permissions(administrator=True)
+    @app_commands.guild_only()
     async def addxp(self, interaction: discord.Interaction, member: discord.Member, xp: int):
+        guild_levels = await self.get_guild_levels(interaction.guild)
         user_id = str(member.id)
-        if user_id not in self.levels_data:
-            self.levels_data[user_id] = {"xp": 0, "level": 0}
+        user_data = guild_levels.get_user(user_id)
 
-        self.levels_data[user_id]["xp"] += xp
-        self.levels_data[user_id]["level"] = self.get_user_level(member.id)  # Recalculate level
+        guild_levels.set_xp(user_id, min(MAX_XP, user_data["xp"] + xp))
+        user_data["level"] = guild_levels.curve.level_for_xp(user_data["xp"])  # Recalculate level
 
-        await interaction.response.send_message(f"✅ Adicionado {xp} XP a {member.display_name}. Nível atual: {self.get_user_level(member.id)} ✅", ephemeral=True)
+        await interaction.response.send_message(f"✅ Adicionado {xp} XP a {member.display_name}. Nível atual: {user_data['level']} ✅", ephemeral=True)
 
     @app_commands.command(name="removexp", description="Remove XP de um membro")
     @app_commands.describe(member="Membro para remover XP", xp="Quantidade de XP para remover")
     @app_commands.checks.has_permissions(administrator=True)
+    @app_commands.guild_only()
     async def removexp(self, interaction: discord.Interaction, member: discord.Member, xp: int):
+        guild_levels = await self.get_guild_levels(interaction.guild)
         user_id = str(member.id)
-        if user_id not in self.levels_data:
-            self.levels_data[user_id] = {"xp": 0, "level": 0}
+        user_data = guild_levels.get_user(user_id)
 
-        self.levels_data[user_id]["xp"] -= xp
-        if self.levels_data[user_id]["xp"] < 0:
-            self.levels_data[user_id]["xp"] = 0  # Impede XP negativo
+        guild_levels.set_xp(user_id, max(0, user_data["xp"] - xp))  # Impede XP negativo
+        user_data["level"] = guild_levels.curve.level_for_xp(user_data["xp"])  # Recalculate level
 
-        self.levels_data[user_id]["level"] = self.get_user_level(member.id)  # Recalculate level
-
-        await interaction.response.send_message(f"✅ Removido {xp} XP de {member.display_name}. Nível atual: {self.get_user_level(member.id)} ✅", ephemeral=True)
+        await interaction.response.send_message(f"✅ Removido {xp} XP de {member.display_name}. Nível atual: {user_data['level']} ✅", ephemeral=True)
 
     @app_commands.command(name="applybuff", description="Aplica um buff de ganho de XP a um membro")
     @app_commands.describe(member="Membro para aplicar o buff", multiplier="Multiplicador de XP (ex: 2 para dobro)", duration_minutes="Duração do buff em minutos")
     @app_commands.checks.has_permissions(administrator=True)
+    @app_commands.guild_only()
     async def applybuff(self, interaction: discord.Interaction, member: discord.Member, multiplier: float, duration_minutes: int):
         if multiplier <= 0:
             await interaction.response.send_message("O multiplicador deve ser maior que zero.", ephemeral=True)
@@ -464,19 +1682,14 @@ class Levels(commands.Cog):
             await interaction.response.send_message("A duração deve ser maior que zero minutos.", ephemeral=True)
             return
 
+        guild_levels = await self.get_guild_levels(interaction.guild)
         user_id = str(member.id)
         current_time = time.time()
         expires_at = current_time + (duration_minutes * 60)
 
         # Store buff information
-        # Ensure user data exists
-        if user_id not in self.levels_data:
-            self.levels_data[user_id] = {"xp": 0, "level": 0, "buff": None}
-
-        self.levels_data[user_id]["buff"] = {
-            "multiplier": multiplier,
-            "expires_at": expires_at,
-        }
+        guild_levels.set_user_buff(user_id, multiplier, expires_at)
+        self.schedule_buff_expiry(interaction.guild.id, "user", user_id, expires_at)
 
         # Confirm to the admin
         expiry_datetime = datetime.fromtimestamp(expires_at)
@@ -486,5 +1699,39 @@ class Levels(commands.Cog):
         )
 
 
+class LeaderboardView(discord.ui.View):
+    """Paginação do /leaderboard: cada página é uma fatia do RankingIndex."""
+
+    def __init__(self, cog: Levels, guild_levels: GuildLevels, per_page: int):
+        super().__init__(timeout=180)
+        self.cog = cog
+        self.guild_levels = guild_levels
+        self.per_page = per_page
+        self.page = 0
+        self.update_buttons()
+
+    @property
+    def total_pages(self) -> int:
+        return max(1, -(-len(self.guild_levels.ranking) // self.per_page))
+
+    def update_buttons(self):
+        self.previous_page.disabled = self.page <= 0
+        self.next_page.disabled = self.page >= self.total_pages - 1
+
+    async def show_page(self, interaction: discord.Interaction, page: int):
+        self.page = max(0, min(page, self.total_pages - 1))
+        self.update_buttons()
+        embed = await self.cog.build_leaderboard_embed(interaction.guild, self.guild_levels, self.page, self.per_page)
+        await interaction.response.edit_message(embed=embed, view=self)
+
+    @discord.ui.button(label="Anterior", style=discord.ButtonStyle.secondary, emoji="◀️")
+    async def previous_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self.show_page(interaction, self.page - 1)
+
+    @discord.ui.button(label="Próxima", style=discord.ButtonStyle.secondary, emoji="▶️")
+    async def next_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self.show_page(interaction, self.page + 1)
+
+
 async def setup(bot: commands.Bot):
     await bot.add_cog(Levels(bot))
\ No newline at end of file
@@ -4,10 +4,13 @@ from discord.ext import commands
 from datetime import datetime, timedelta
 from typing import Optional
 import asyncio
+from src.modactions import get_moderation_actions
 
 class Moderation(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
+        # Executa as punições e registra no log de moderação / canal de log
+        self.actions = get_moderation_actions(bot)
 
     @app_commands.command(name="ban", description="Bane um usuário do servidor")
     @app_commands.checks.has_permissions(ban_members=True)
@@ -37,7 +40,10 @@ class Moderation(commands.Cog):
             embed.set_footer(text=f"ID do Usuário: {user.id}")
             
             # Executa o banimento
-            await user.ban(reason=f"{reason} | Banido por {interaction.user}")
+            await self.actions.dispatch(
+                interaction.guild, interaction.user, user, "ban", reason,
+                user.ban(reason=f"{reason} | Banido por {interaction.user}")
+            )
             await interaction.response.send_message(embed=embed)
             
         except discord.Forbidden:
@@ -76,7 +82,10 @@ class Moderation(commands.Cog):
             embed.set_footer(text=f"ID do Usuário: {user.id}")
             
             # Executa a expulsão
-            await user.kick(reason=f"{reason} | Expulso por {interaction.user}")
+            await self.actions.dispatch(
+                interaction.guild, interaction.user, user, "kick", reason,
+                user.kick(reason=f"{reason} | Expulso por {interaction.user}")
+            )
             await interaction.response.send_message(embed=embed)
             
         except discord.Forbidden:
@@ -133,7 +142,11 @@ class Moderation(commands.Cog):
                 return
                 
             # Aplica o timeout
-            await user.timeout(datetime.utcnow() + timedelta(seconds=duration_seconds), reason=reason)
+            await self.actions.dispatch(
+                interaction.guild, interaction.user, user, "mute", reason,
+                user.timeout(datetime.utcnow() + timedelta(seconds=duration_seconds), reason=reason),
+                details=f"**Duração:** {duration}"
+            )
             
             # Cria o embed de silenciamento
             embed = discord.Embed(
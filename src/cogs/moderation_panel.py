@@ -2,28 +2,21 @@ import discord
 from discord import app_commands
 from discord.ext import commands
 from datetime import datetime, timedelta
-import json
-import os
+from src.modactions import get_moderation_actions
+from src.usercache import get_user_cache
+
+# Quantos avisos (os mais recentes) o /warns mostra
+WARNS_SHOWN = 10
 
 class ModerationPanel(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
-        self.warns_file = "data/warns.json"
-        self.load_warns()
-
-    def load_warns(self):
-        if not os.path.exists("data"):
-            os.makedirs("data")
-        if os.path.exists(self.warns_file):
-            with open(self.warns_file, "r") as f:
-                self.warns = json.load(f)
-        else:
-            self.warns = {}
-            self.save_warns()
-
-    def save_warns(self):
-        with open(self.warns_file, "w") as f:
-            json.dump(self.warns, f, indent=4)
+        # Executa as punições e registra no log de moderação / canal de log
+        self.actions = get_moderation_actions(bot)
+        # Os avisos ficam na tabela warns do banco de moderação (o antigo warns.json é importado na migração)
+        self.moderation_log = self.actions.moderation_log
+        # Nomes dos moderadores no /warns (cache com TTL; buscas que faltam saem em paralelo)
+        self.user_cache = get_user_cache(bot)
 
     class ModerationView(discord.ui.View):
         def __init__(self, cog):
@@ -79,12 +72,17 @@ class ModerationPanel(commands.Cog):
             try:
                 user_id = int(self.user_input.value)
                 user = await self.cog.bot.fetch_user(user_id)
+                # User não tem cargos; a hierarquia só se aplica se ele ainda estiver no servidor
+                member = interaction.guild.get_member(user_id)
                 
-                if user.top_role >= interaction.user.top_role:
+                if member and member.top_role >= interaction.user.top_role:
                     await interaction.response.send_message("Você não pode banir alguém com cargo igual ou superior ao seu!", ephemeral=True)
                     return
 
-                await interaction.guild.ban(user, reason=f"{self.reason_input.value} | Banido por {interaction.user}")
+                await self.cog.actions.dispatch(
+                    interaction.guild, interaction.user, user, "ban", self.reason_input.value,
+                    interaction.guild.ban(user, reason=f"{self.reason_input.value} | Banido por {interaction.user}")
+                )
                 
                 embed = discord.Embed(
                     title="🔨 Usuário Banido",
@@ -132,7 +130,10 @@ class ModerationPanel(commands.Cog):
                     await interaction.response.send_message("Você não pode expulsar alguém com cargo igual ou superior ao seu!", ephemeral=True)
                     return
 
-                await member.kick(reason=f"{self.reason_input.value} | Expulso por {interaction.user}")
+                await self.cog.actions.dispatch(
+                    interaction.guild, interaction.user, member, "kick", self.reason_input.value,
+                    member.kick(reason=f"{self.reason_input.value} | Expulso por {interaction.user}")
+                )
                 
                 embed = discord.Embed(
                     title="👢 Usuário Expulso",
@@ -209,7 +210,11 @@ class ModerationPanel(commands.Cog):
                     await interaction.response.send_message("A duração máxima do silenciamento é 28 dias!", ephemeral=True)
                     return
                 
-                await member.timeout(datetime.utcnow() + timedelta(seconds=duration_seconds), reason=self.reason_input.value)
+                await self.cog.actions.dispatch(
+                    interaction.guild, interaction.user, member, "mute", self.reason_input.value,
+                    member.timeout(datetime.utcnow() + timedelta(seconds=duration_seconds), reason=self.reason_input.value),
+                    details=f"**Duração:** {duration}"
+                )
                 
                 embed = discord.Embed(
                     title="🔇 Usuário Silenciado",
@@ -253,17 +258,9 @@ class ModerationPanel(commands.Cog):
                 user_id = int(self.user_input.value)
                 member = await interaction.guild.fetch_member(user_id)
                 
-                # Adiciona o aviso
-                if str(member.id) not in self.cog.warns:
-                    self.cog.warns[str(member.id)] = []
-                
-                self.cog.warns[str(member.id)].append({
-                    "reason": self.reason_input.value,
-                    "moderator": str(interaction.user.id),
-                    "timestamp": datetime.utcnow().isoformat()
-                })
-                
-                self.cog.save_warns()
+                # Adiciona o aviso (enfileirado; gravado em lote pela thread do log de moderação)
+                self.cog.moderation_log.add_warn(interaction.guild.id, member.id, interaction.user.id, self.reason_input.value)
+                self.cog.actions.record(interaction.guild, interaction.user, member, "warn", self.reason_input.value)
                 
                 embed = discord.Embed(
                     title="⚠️ Usuário Avisado",
@@ -336,8 +333,13 @@ class ModerationPanel(commands.Cog):
     @app_commands.command(name="warns", description="Mostra os avisos de um usuário")
     @app_commands.checks.has_permissions(manage_messages=True)
     async def warns(self, interaction: discord.Interaction, user: discord.Member):
-        if str(user.id) not in self.warns or not self.warns[str(user.id)]:
-            await interaction.response.send_message(f"{user.mention} não possui avisos!", ephemeral=True)
+        # Flush, leitura e busca dos moderadores podem passar dos 3s que o Discord dá para responder
+        await interaction.response.defer()
+        # Garante que avisos recém-dados já estejam no banco antes de ler
+        await self.moderation_log.flush()
+        total = await self.moderation_log.warn_count(interaction.guild.id, user.id)
+        if not total:
+            await interaction.followup.send(f"{user.mention} não possui avisos!")
             return
 
         embed = discord.Embed(
@@ -347,29 +349,37 @@ class ModerationPanel(commands.Cog):
         )
         embed.set_thumbnail(url=user.display_avatar.url)
 
-        for i, warn in enumerate(self.warns[str(user.id)], 1):
-            moderator = await self.bot.fetch_user(int(warn["moderator"]))
-            timestamp = datetime.fromisoformat(warn["timestamp"])
+        warns = await self.moderation_log.recent_warns(interaction.guild.id, user.id, WARNS_SHOWN)
+        moderators = await self.user_cache.resolve_many(moderator_id for _, moderator_id, _, _ in warns)
+        for i, (warn_id, moderator_id, reason, timestamp) in enumerate(warns):
+            moderator = moderators.get(moderator_id)
+            if moderator_id is None:
+                moderator_text = "Desconhecido"
+            else:
+                moderator_text = f"<@{moderator_id}> (`{moderator}`)" if moderator else f"<@{moderator_id}>"
             
             embed.add_field(
-                name=f"Aviso #{i}",
-                value=f"**Motivo:** {warn['reason']}\n"
-                      f"**Moderador:** {moderator.mention}\n"
-                      f"**Data:** <t:{int(timestamp.timestamp())}:R>",
+                name=f"Aviso #{total - i}",
+                value=f"**Motivo:** {reason}\n"
+                      f"**Moderador:** {moderator_text}\n"
+                      f"**Data:** <t:{timestamp}:R>",
                 inline=False
             )
+        if total > len(warns):
+            embed.set_footer(text=f"Mostrando os {len(warns)} avisos mais recentes de {total}")
 
-        await interaction.response.send_message(embed=embed)
+        await interaction.followup.send(embed=embed)
 
     @app_commands.command(name="clearwarns", description="Limpa os avisos de um usuário")
     @app_commands.checks.has_permissions(manage_messages=True)
     async def clearwarns(self, interaction: discord.Interaction, user: discord.Member):
-        if str(user.id) not in self.warns:
-            await interaction.response.send_message(f"{user.mention} não possui avisos!", ephemeral=True)
+        await interaction.response.defer()
+        await self.moderation_log.flush()
+        if not await self.moderation_log.warn_count(interaction.guild.id, user.id):
+            await interaction.followup.send(f"{user.mention} não possui avisos!")
             return
 
-        del self.warns[str(user.id)]
-        self.save_warns()
+        self.moderation_log.clear_warns(interaction.guild.id, user.id)
 
         embed = discord.Embed(
             title="✅ Avisos Limpos",
@@ -377,7 +387,7 @@ class ModerationPanel(commands.Cog):
             color=discord.Color.green(),
             timestamp=datetime.utcnow()
         )
-        await interaction.response.send_message(embed=embed)
+        await interaction.followup.send(embed=embed)
 
 async def setup(bot: commands.Bot):
     await bot.add_cog(ModerationPanel(bot)) 
\ No newline at end of file
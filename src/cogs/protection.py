@@ -6,17 +6,563 @@ import json
 import os
 import time
 from datetime import datetime, timedelta
-from typing import Dict, Any, Set, List, Tuple # Importando Tuple
+from typing import Dict, Any, Set, List, Tuple, Deque, Optional # Importando Tuple
+from collections import deque
 import re
+import string
+import asyncio
 import sqlite3
+from array import array
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 import Levenshtein # Certifique-se de ter a biblioteca 'python-Levenshtein' instalada (pip install python-Levenshtein)
 from discord.ui import Button, View
 from discord import ButtonStyle
+from src.modlog import get_moderation_log
+from src.modactions import get_moderation_actions
 
 # Define a janela de tempo maior para manter membros recentes (em segundos, ex: 5 minutos)
 RECENT_JOINS_WINDOW = 300 # 5 minutos
 # Define a janela de tempo para detecção de pico (em segundos, ex: 60 segundos)
 SPIKE_DETECTION_WINDOW = 60
+# Intervalo mínimo entre duas análises de pico no mesmo servidor (em segundos).
+# A primeira análise roda no momento em que o threshold é cruzado; joins durante o intervalo só agendam mais uma.
+RAID_CHECK_DEBOUNCE = 2
+# Intervalo (segundos) entre snapshots do estado de proteção em disco
+STATE_SNAPSHOT_INTERVAL = 5
+# Linha de base de joins: média móvel exponencial (EWMA) de joins por janela de pico.
+# alpha = 2/(N+1) com N = 60 janelas de 1 minuto, ou seja, cerca de uma hora de memória.
+BASELINE_ALPHA = 2 / (60 + 1)
+# Padrões do lockdown de entrada (protection_config[guild]["join_lockdown"])
+DEFAULT_JOIN_LOCKDOWN = {
+    "enabled": False,
+    "multiplier": 5.0,       # Dispara quando os joins da janela de pico passam de multiplier x linha de base
+    "min_joins": 10,         # ...e de pelo menos min_joins (servidores novos ou parados têm linha de base ~0)
+    "duration": 600,         # Segundos sem novo pico até desfazer o lockdown
+    "lock_channels": False,  # Segundo estágio: trava os canais de texto quando o pico passa do dobro do limite
+}
+# Quantas edições de canal do lockdown rodam ao mesmo tempo
+LOCKDOWN_CHANNEL_CONCURRENCY = 10
+# Similaridade mínima (0-1) para dois nomes contarem como parecidos (padrão da regra similar_name)
+SIMILARITY_THRESHOLD = 0.8
+# Abaixo deste tamanho de lote o agrupamento roda no próprio loop; enviar para outro processo não compensa
+SIMILARITY_POOL_MIN_BATCH = 200
+# Quantas expulsões/banimentos de raid ficam em andamento ao mesmo tempo por servidor.
+# O discord.py já espera os buckets de rate limit; o limite evita enfileirar centenas de requisições de uma vez.
+RAID_ACTION_CONCURRENCY = 5
+# Máximo de membros listados no resumo enviado ao canal de log
+RAID_SUMMARY_MAX_MEMBERS = 30
+# Intervalo (segundos) em que a fila de punições do anti-spam é processada em lote
+SPAM_ACTION_INTERVAL = 1
+# Por quanto tempo (segundos) um membro já punido por spam não volta para a fila
+SPAM_PUNISH_COOLDOWN = 30
+# Punições aceitas no bloco anti_spam ("mute" aplica timeout por punishment_duration segundos)
+SPAM_PUNISHMENTS = ("mute", "kick", "ban", "delete")
+# Links de convite: discord.gg/<código>, discord.com/invite/<código> e discordapp.com/invite/<código>, com ou sem http(s):// e www.
+INVITE_RE = re.compile(r'(?:https?://)?(?:www\.)?(?:discord(?:app)?\.com/invite|discord\.gg)/([a-zA-Z0-9-]{2,32})', re.IGNORECASE)
+# Por quanto tempo (segundos) a resolução convite -> servidor fica em cache
+INVITE_CACHE_TTL = 3600
+# Resultado de resolve_invite_guild quando a consulta falhou (erro HTTP, cancelamento): não dá para decidir, a mensagem fica
+INVITE_UNRESOLVED = object()
+# Palavras que aumentam o nível de suspeita quando aparecem no nome de usuário (padrão da regra blacklist)
+USERNAME_BLACKLIST = ("raid", "bot", "free", "nitro", "hack") # Adicione palavras relevantes
+# Regras de pontuação anti-raid e seus parâmetros padrão.
+# Cada servidor pode sobrescrever qualquer valor em protection_config[guild]["rules"][regra]; peso 0 desativa a regra.
+DEFAULT_RAID_RULES: Dict[str, Dict[str, Any]] = {
+    "digits": {"weight": 2, "ratio": 0.5},                            # Nome com muitos números
+    "symbols": {"weight": 3, "ratio": 0.33},                          # Nome com muitos caracteres não alfanuméricos
+    "short_name": {"weight": 1, "min_length": 3},                     # Nome curto demais
+    "blacklist": {"weight": 4, "words": list(USERNAME_BLACKLIST)},    # Palavra da lista negra no nome
+    "unicode": {"weight": 2, "ratio": 0.25},                          # Nome com muitos caracteres não ASCII
+    "account_age": {"weight": 5, "max_age": 86400},                   # Conta criada há menos de max_age segundos
+    "default_avatar": {"weight": 3},                                  # Sem avatar próprio
+    "similar_name": {"weight": 5, "similarity": SIMILARITY_THRESHOLD},  # Por outro membro da janela com nome parecido
+    "duplicate_avatar": {"weight": 7},                                # Mesmo avatar de outro membro da janela
+}
+# Qual toggle do /raidmode liga/desliga cada regra
+RAID_RULE_TOGGLES = {
+    "digits": "check_username", "symbols": "check_username", "short_name": "check_username",
+    "blacklist": "check_username", "unicode": "check_username",
+    "account_age": "check_account_age", "default_avatar": "check_avatar",
+    "similar_name": "check_similarity", "duplicate_avatar": "check_similarity",
+}
+RAID_RULE_NAMES = tuple(DEFAULT_RAID_RULES)
+# Tabelas pré-compiladas do score de nome de usuário
+NON_ALPHANUMERIC_RE = re.compile(r'[^a-zA-Z0-9]')
+ASCII_DIGITS = string.digits.encode()
+
+
+class KeywordMatcher:
+    """Autômato de Aho-Corasick compilado em uma tabela de transições (DFA).
+
+    A busca lê cada caractere uma vez, independente de quantas palavras existem na lista.
+    """
+
+    def __init__(self, words):
+        goto: List[Dict[str, int]] = [{}]
+        terminal = [False]
+        for word in words:
+            state = 0
+            for char in word:
+                next_state = goto[state].get(char)
+                if next_state is None:
+                    goto.append({})
+                    terminal.append(False)
+                    next_state = goto[state][char] = len(goto) - 1
+                state = next_state
+            terminal[state] = True
+
+        # BFS calculando os links de falha e completando as transições de cada estado
+        fail = [0] * len(goto)
+        delta: List[Dict[str, int]] = [dict(goto[0])] + [{} for _ in goto[1:]]
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            terminal[state] = terminal[state] or terminal[fail[state]]
+            delta[state] = {**delta[fail[state]], **goto[state]}
+            for char, next_state in goto[state].items():
+                fail[next_state] = delta[fail[state]].get(char, 0) if state else 0
+                queue.append(next_state)
+        self.delta = delta
+        self.terminal = terminal
+
+    def search(self, text: str) -> bool:
+        delta, terminal = self.delta, self.terminal
+        state = 0
+        for char in text:
+            state = delta[state].get(char, 0)
+            if terminal[state]:
+                return True
+        return False
+
+
+class ScoringPlan:
+    """Regras anti-raid de um servidor compiladas em um plano de pontuação plano.
+
+    A configuração é lida e validada uma única vez, quando muda; a avaliação por membro só consulta atributos
+    já resolvidos. Regras com peso 0 (ou com o toggle do /raidmode desligado) ficam fora do plano.
+    Os contadores de acerto são passados de fora para sobreviverem a recompilações.
+    """
+
+    def __init__(self, config: Dict[str, Any]):
+        overrides = config.get("rules", {})
+        rules: Dict[str, Dict[str, Any]] = {}
+        for name, defaults in DEFAULT_RAID_RULES.items():
+            rule = dict(defaults)
+            custom = overrides.get(name)
+            if isinstance(custom, dict):
+                for key, value in custom.items():
+                    if key in defaults and self.valid_parameter(key, defaults[key], value):
+                        rule[key] = value
+            if not config.get(RAID_RULE_TOGGLES[name], True):
+                rule["weight"] = 0
+            rules[name] = rule
+        self.rules = rules
+
+        self.digits_weight = rules["digits"]["weight"]
+        self.digits_ratio = rules["digits"]["ratio"]
+        self.symbols_weight = rules["symbols"]["weight"]
+        self.symbols_ratio = rules["symbols"]["ratio"]
+        self.short_name_weight = rules["short_name"]["weight"]
+        self.short_name_length = rules["short_name"]["min_length"]
+        words = [str(word).lower() for word in rules["blacklist"]["words"] if word]
+        self.blacklist_weight = rules["blacklist"]["weight"] if words else 0
+        self.blacklist = KeywordMatcher(words) if self.blacklist_weight else None
+        self.unicode_weight = rules["unicode"]["weight"]
+        self.unicode_ratio = rules["unicode"]["ratio"]
+        self.account_age_weight = rules["account_age"]["weight"]
+        self.account_max_age = rules["account_age"]["max_age"]
+        self.default_avatar_weight = rules["default_avatar"]["weight"]
+        self.similar_name_weight = rules["similar_name"]["weight"]
+        self.similarity = rules["similar_name"]["similarity"]
+        self.duplicate_avatar_weight = rules["duplicate_avatar"]["weight"]
+        self.checks_username = bool(self.digits_weight or self.symbols_weight or self.short_name_weight or self.blacklist_weight or self.unicode_weight)
+
+    @staticmethod
+    def parameter_error(key: str, default, value) -> Optional[str]:
+        """Motivo pelo qual `value` não serve para o parâmetro `key`, ou None se for válido."""
+        if isinstance(default, list):
+            return None if isinstance(value, list) else "deve ser uma lista"
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or value < 0:
+            return "deve ser um número maior ou igual a 0"
+        if isinstance(default, int) and not isinstance(value, int):
+            return "deve ser um número inteiro"
+        # similarity 0 divide por zero no agrupamento de nomes e 1 ou mais nunca agrupa nada
+        if key == "similarity" and not 0 < value < 1:
+            return "deve estar entre 0 e 1 (exclusivo)"
+        if key == "ratio" and value > 1:
+            return "deve estar entre 0 e 1"
+        return None
+
+    @staticmethod
+    def valid_parameter(key: str, default, value) -> bool:
+        # Valores inválidos na configuração são ignorados e a regra fica com o padrão
+        return ScoringPlan.parameter_error(key, default, value) is None
+
+    def score_username(self, username: str, hits: Dict[str, int] = None) -> int:
+        """Heurísticas de nome de usuário com tabelas pré-compiladas; cada critério é um laço em C ou o autômato da lista negra."""
+        if not isinstance(username, str):
+            return 0 # Retorna 0 se não for uma string válida
+        length = len(username)
+        if not length:
+            return 0
+
+        suspect_level = 0
+        ascii_part = username.encode("ascii", "ignore")
+        unicode_count = length - len(ascii_part)
+        # Critério 1: Nomes de usuário com muitos números (str.isdigit só é necessário quando há caracteres Unicode)
+        if self.digits_weight:
+            if unicode_count:
+                num_digits = sum(map(str.isdigit, username))
+            else:
+                num_digits = length - len(ascii_part.translate(None, ASCII_DIGITS))
+            if num_digits / length > self.digits_ratio:
+                suspect_level += self.digits_weight
+                if hits is not None:
+                    hits["digits"] += 1
+        # Critério 2: Nomes de usuário com muitos caracteres não alfanuméricos
+        if self.symbols_weight and len(NON_ALPHANUMERIC_RE.findall(username)) / length > self.symbols_ratio:
+            suspect_level += self.symbols_weight
+            if hits is not None:
+                hits["symbols"] += 1
+        # Critério 3: Nomes de usuário curtos demais
+        if self.short_name_weight and length < self.short_name_length:
+            suspect_level += self.short_name_weight
+            if hits is not None:
+                hits["short_name"] += 1
+        # Critério 4: Lista negra de palavras
+        if self.blacklist_weight and self.blacklist.search(username.lower()):
+            suspect_level += self.blacklist_weight
+            if hits is not None:
+                hits["blacklist"] += 1
+        # Critério 5: Muitos caracteres Unicode (não ASCII)
+        if self.unicode_weight and unicode_count / length > self.unicode_ratio:
+            suspect_level += self.unicode_weight
+            if hits is not None:
+                hits["unicode"] += 1
+        return suspect_level
+
+    def score_batch(self, members, current_time: int, hits: Dict[str, int] = None, counted: List[bool] = None) -> List[int]:
+        """Calcula de uma vez o nível de suspeita (nome, idade da conta e avatar padrão) de um lote de membros.
+
+        Com `counted`, os acertos só entram em `hits` para os índices marcados (membros ainda não contados neste pico).
+        """
+        # IDs do Discord são snowflakes com o instante de criação nos bits altos:
+        # "conta criada há menos de max_age" vira uma comparação de inteiros com o snowflake do corte.
+        young_account_snowflake = ((current_time - self.account_max_age) * 1000 - discord.utils.DISCORD_EPOCH) << 22
+        check_username = self.checks_username
+        account_age_weight = self.account_age_weight
+        default_avatar_weight = self.default_avatar_weight
+        scores = [0] * len(members)
+        for index, member in enumerate(members):
+            member_hits = hits if counted is None or counted[index] else None
+            score = self.score_username(member.name, member_hits) if check_username else 0
+            if account_age_weight and member.id >= young_account_snowflake:
+                score += account_age_weight
+                if member_hits is not None:
+                    member_hits["account_age"] += 1
+            if default_avatar_weight and member.avatar is None: # Sem avatar próprio = avatar padrão do Discord
+                score += default_avatar_weight
+                if member_hits is not None:
+                    member_hits["default_avatar"] += 1
+            scores[index] = score
+        return scores
+
+    def score_peers(self, members, similar_counts: List[int], scores: List[int], hits: Dict[str, int] = None, counted: List[bool] = None):
+        """Soma as regras que comparam os membros da janela entre si (nomes parecidos e avatares idênticos)."""
+        if self.similar_name_weight:
+            for index, count in enumerate(similar_counts):
+                if count:
+                    # Cada outro membro da janela com nome parecido soma pontos
+                    scores[index] += self.similar_name_weight * count
+                    if hits is not None and (counted is None or counted[index]):
+                        hits["similar_name"] += 1
+        if self.duplicate_avatar_weight:
+            avatar_keys = [member.display_avatar.key for member in members]
+            avatar_counts: Dict[str, int] = {}
+            for avatar_key in avatar_keys:
+                avatar_counts[avatar_key] = avatar_counts.get(avatar_key, 0) + 1
+            for index, avatar_key in enumerate(avatar_keys):
+                if avatar_counts[avatar_key] > 1:
+                    scores[index] += self.duplicate_avatar_weight
+                    if hits is not None and (counted is None or counted[index]):
+                        hits["duplicate_avatar"] += 1
+
+
+DEFAULT_SCORING_PLAN = ScoringPlan({})
+
+
+def score_username(username: str) -> int:
+    return DEFAULT_SCORING_PLAN.score_username(username)
+
+
+def score_join_batch(members, current_time: int, plan: ScoringPlan = DEFAULT_SCORING_PLAN, hits: Dict[str, int] = None) -> List[int]:
+    return plan.score_batch(members, current_time, hits)
+
+
+def name_similarity(s1: str, s2: str) -> float:
+    if not isinstance(s1, str) or not isinstance(s2, str) or not s1 or not s2:
+        return 0.0
+    longer_length = max(len(s1), len(s2))
+    return (longer_length - Levenshtein.distance(s1, s2)) / longer_length
+
+
+class BKTree:
+    """Árvore BK sobre a distância de Levenshtein.
+
+    Cada filho fica pendurado pela distância até o pai, então uma busca com raio r só desce
+    nos filhos com distância em [d - r, d + r] em vez de comparar o nome com todos os outros.
+    """
+
+    def __init__(self):
+        self.root = None  # [index, name, {distância: nó filho}]
+
+    def add(self, index: int, name: str):
+        node = [index, name, {}]
+        if self.root is None:
+            self.root = node
+            return
+        current = self.root
+        while True:
+            distance = Levenshtein.distance(name, current[1])
+            child = current[2].get(distance)
+            if child is None:
+                current[2][distance] = node
+                return
+            current = child
+
+    def search(self, name: str, radius: int) -> List[int]:
+        results = []
+        stack = [self.root] if self.root is not None else []
+        while stack:
+            index, other, children = stack.pop()
+            distance = Levenshtein.distance(name, other)
+            if distance <= radius:
+                results.append(index)
+            low, high = distance - radius, distance + radius
+            for child_distance, child in children.items():
+                if low <= child_distance <= high:
+                    stack.append(child)
+        return results
+
+
+def cluster_similar_names(names: List[str], threshold: float = SIMILARITY_THRESHOLD) -> Tuple[List[int], List[List[int]]]:
+    """Agrupa nomes quase idênticos.
+
+    Retorna, para cada posição de `names`, quantos outros nomes têm similaridade acima de `threshold`
+    (o mesmo critério da comparação par a par), e os grupos conectados com mais de um nome, maiores primeiro.
+    Fica no nível do módulo para poder rodar em um ProcessPoolExecutor.
+    """
+    groups: Dict[str, List[int]] = {}
+    for index, name in enumerate(names):
+        groups.setdefault(name, []).append(index)
+    unique_names = list(groups)
+
+    tree = BKTree()
+    for unique_index, name in enumerate(unique_names):
+        if name:
+            tree.add(unique_index, name)
+
+    parent = list(range(len(unique_names)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    similar_counts = [0] * len(names)
+    # Para similaridade > t o nome mais longo tem no máximo len/t caracteres, logo a distância fica abaixo de len*(1-t)/t
+    radius_factor = (1 - threshold) / threshold
+    for unique_index, name in enumerate(unique_names):
+        if not name:
+            continue
+        copies = groups[name]
+        count = len(copies) - 1  # nomes idênticos
+        for other_index in tree.search(name, int(len(name) * radius_factor)):
+            if other_index == unique_index:
+                continue
+            other_name = unique_names[other_index]
+            if name_similarity(name, other_name) > threshold:
+                count += len(groups[other_name])
+                parent[find(other_index)] = find(unique_index)
+        for index in copies:
+            similar_counts[index] = count
+
+    clusters: Dict[int, List[int]] = {}
+    for unique_index, name in enumerate(unique_names):
+        clusters.setdefault(find(unique_index), []).extend(groups[name])
+    return similar_counts, sorted((c for c in clusters.values() if len(c) > 1), key=len, reverse=True)
+
+
+class JoinWindow:
+    """Janela deslizante das entradas recentes de um servidor.
+
+    As entradas chegam em ordem de tempo, então cada deque só precisa descartar pela frente:
+    inserir e podar custam O(1) amortizado e a contagem do pico é um len().
+    """
+
+    def __init__(self, retention: int = RECENT_JOINS_WINDOW, spike_window: int = SPIKE_DETECTION_WINDOW):
+        self.retention = retention
+        self.spike_window = spike_window
+        self.recent: Deque[Tuple[int, int]] = deque()  # (member_id, join_timestamp) dentro de `retention`
+        self.spike: Deque[Tuple[int, int]] = deque()  # (member_id, join_timestamp) dentro de `spike_window`
+        # Linha de base incremental: só o contador da janela atual e a EWMA das anteriores
+        self.baseline = 0.0
+        self.bucket_start = None
+        self.bucket_count = 0
+
+    def __len__(self) -> int:
+        return len(self.recent)
+
+    def add(self, member_id: int, join_time: int):
+        self.recent.append((member_id, join_time))
+        self.spike.append((member_id, join_time))
+        self.prune(join_time)
+        self.advance(join_time)
+        self.bucket_count += 1
+
+    def advance(self, current_time: int):
+        """Fecha as janelas de baseline que já terminaram, incorporando cada uma à EWMA em O(1)."""
+        start = current_time - current_time % self.spike_window
+        if self.bucket_start is None:
+            self.bucket_start = start
+            return
+        if start <= self.bucket_start:
+            return
+        self.baseline += BASELINE_ALPHA * (self.bucket_count - self.baseline)
+        empty_buckets = (start - self.bucket_start) // self.spike_window - 1
+        if empty_buckets > 0:
+            self.baseline *= (1 - BASELINE_ALPHA) ** empty_buckets
+        self.bucket_start = start
+        self.bucket_count = 0
+
+    def prune(self, current_time: int):
+        recent, spike = self.recent, self.spike
+        while recent and current_time - recent[0][1] > self.retention:
+            recent.popleft()
+        while spike and current_time - spike[0][1] > self.spike_window:
+            spike.popleft()
+
+    def spike_count(self, current_time: int) -> int:
+        self.prune(current_time)
+        return len(self.spike)
+
+    def snapshot(self) -> Tuple[float, Any, int, bytes]:
+        # As entradas vão como um array de int64 (member_id, timestamp, member_id, ...), sem JSON
+        joins = array("q")
+        for member_id, join_time in self.recent:
+            joins.append(member_id)
+            joins.append(join_time)
+        return self.baseline, self.bucket_start, self.bucket_count, joins.tobytes()
+
+    @classmethod
+    def restore(cls, baseline: float, bucket_start, bucket_count: int, joins_blob: bytes, current_time: int) -> "JoinWindow":
+        window = cls()
+        window.baseline, window.bucket_start, window.bucket_count = baseline, bucket_start, bucket_count
+        joins = array("q")
+        joins.frombytes(joins_blob or b"")
+        for i in range(0, len(joins), 2):
+            window.recent.append((joins[i], joins[i + 1]))
+            window.spike.append((joins[i], joins[i + 1]))
+        window.prune(current_time)
+        window.advance(current_time)
+        return window
+
+    def spike_members(self, current_time: int) -> List[Tuple[int, int]]:
+        self.prune(current_time)
+        return list(self.spike)
+
+
+class ProtectionStateStore:
+    """Snapshot em SQLite (WAL) do estado de proteção que só existia em memória.
+
+    Guarda o modo anti-raid, as janelas de joins, os lockdowns ativos e as ações ainda na fila,
+    para que um restart (por exemplo, pelo monitor.py no meio de uma raid) retome de onde parou.
+    Todos os métodos são bloqueantes; fora do carregamento inicial rodam no executor de estado da cog.
+    """
+
+    def __init__(self, db_file: str):
+        self.db_file = db_file
+        self.conn = None
+
+    def connect(self) -> sqlite3.Connection:
+        if self.conn is None:
+            os.makedirs(os.path.dirname(self.db_file), exist_ok=True)
+            self.conn = sqlite3.connect(self.db_file, check_same_thread=False)
+            self.conn.execute("PRAGMA journal_mode = WAL")
+            self.conn.execute("PRAGMA synchronous = NORMAL")
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS guild_state (
+                    guild_id INTEGER PRIMARY KEY,
+                    raid_mode_active INTEGER NOT NULL DEFAULT 0,
+                    lockdown TEXT
+                )
+            """)
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS join_windows (
+                    guild_id INTEGER PRIMARY KEY,
+                    baseline REAL NOT NULL DEFAULT 0,
+                    bucket_start INTEGER,
+                    bucket_count INTEGER NOT NULL DEFAULT 0,
+                    joins BLOB
+                )
+            """)
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS pending_actions (
+                    kind TEXT NOT NULL, -- 'delete' (mensagem) ou 'punish' (anti-spam)
+                    guild_id INTEGER NOT NULL,
+                    channel_id INTEGER NOT NULL,
+                    target_id INTEGER NOT NULL -- ID da mensagem ou do membro
+                )
+            """)
+            self.conn.commit()
+        return self.conn
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+    def load(self):
+        conn = self.connect()
+        guild_rows = {
+            guild_id: (bool(raid_mode), json.loads(lockdown) if lockdown else None)
+            for guild_id, raid_mode, lockdown in conn.execute("SELECT guild_id, raid_mode_active, lockdown FROM guild_state")
+        }
+        window_rows = {
+            row[0]: row[1:]
+            for row in conn.execute("SELECT guild_id, baseline, bucket_start, bucket_count, joins FROM join_windows")
+        }
+        pending_rows = conn.execute("SELECT kind, guild_id, channel_id, target_id FROM pending_actions").fetchall()
+        return guild_rows, window_rows, pending_rows
+
+    def write_snapshot(self, guild_rows, window_rows, removed_guilds, pending_rows=None):
+        """Grava só os guilds alterados desde o último snapshot, em uma transação."""
+        conn = self.connect()
+        with conn:
+            conn.executemany(
+                "INSERT INTO guild_state (guild_id, raid_mode_active, lockdown) VALUES (?, ?, ?) "
+                "ON CONFLICT(guild_id) DO UPDATE SET raid_mode_active = excluded.raid_mode_active, lockdown = excluded.lockdown",
+                guild_rows
+            )
+            conn.executemany(
+                "INSERT INTO join_windows (guild_id, baseline, bucket_start, bucket_count, joins) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(guild_id) DO UPDATE SET baseline = excluded.baseline, bucket_start = excluded.bucket_start, "
+                "bucket_count = excluded.bucket_count, joins = excluded.joins",
+                window_rows
+            )
+            # Guilds alterados que não têm mais janela (podada por ficar vazia) não podem voltar do snapshot antigo
+            windowless = {row[0] for row in guild_rows}.difference(row[0] for row in window_rows)
+            if windowless:
+                conn.executemany("DELETE FROM join_windows WHERE guild_id = ?", [(guild_id,) for guild_id in windowless])
+            if removed_guilds:
+                conn.executemany("DELETE FROM guild_state WHERE guild_id = ?", [(guild_id,) for guild_id in removed_guilds])
+                conn.executemany("DELETE FROM join_windows WHERE guild_id = ?", [(guild_id,) for guild_id in removed_guilds])
+            if pending_rows is not None:
+                conn.execute("DELETE FROM pending_actions")
+                conn.executemany("INSERT INTO pending_actions (kind, guild_id, channel_id, target_id) VALUES (?, ?, ?, ?)", pending_rows)
+
 
 class Protection(commands.Cog):
     def __init__(self, bot: commands.Bot):
@@ -25,12 +571,40 @@ class Protection(commands.Cog):
         self.protection_config: Dict[str, Any] = {}
         self.load_protection_config()
         # Armazena (membro.id, timestamp) para evitar problemas de pickle/serialização
-        self.recent_joins: Dict[int, List[Tuple[int, int]]] = {}  # Guild ID: List of (Member ID, Join Timestamp)
+        self.recent_joins: Dict[int, JoinWindow] = {}  # Guild ID: janela de (Member ID, Join Timestamp)
         self.raid_mode_active: Dict[int, bool] = {}  # Track raid mode status per guild
-        self.db_file = "data/moderation.db"
-        self.conn = sqlite3.connect(self.db_file)
-        self.cursor = self.conn.cursor()
-        self.create_table()
+        self.raid_check_tasks: Dict[int, asyncio.Task] = {}  # Guild ID: análise de pico em andamento
+        self.raid_check_pending: Set[int] = set()  # Guilds com joins novos durante o debounce
+        self.similarity_pool = None  # ProcessPoolExecutor criado no primeiro lote grande
+        self.scoring_plans: Dict[int, ScoringPlan] = {}  # Guild ID: regras compiladas, refeitas quando a configuração muda
+        self.rule_hits: Dict[int, Dict[str, int]] = {}  # Guild ID: {regra: membros pontuados}, mais "evaluated"
+        self.rule_hits_counted: Dict[int, Set[int]] = {}  # Guild ID: membros da janela de pico já contados em rule_hits
+        # Anti-spam: token bucket por (guild, membro) guardado como [tokens, último uso (monotonic)]
+        self.spam_buckets: Dict[Tuple[int, int], List[float]] = {}
+        self.spam_pending: Dict[int, Dict[int, Tuple[discord.Member, int]]] = {}  # Guild ID: {Member ID: (membro, canal)} a punir
+        self.pending_deletions: Dict[int, List[discord.Message]] = {}  # Channel ID: mensagens a apagar (spam e convites), em lote
+        self.spam_punished: Dict[Tuple[int, int], float] = {}  # (guild, membro): fim do cooldown de punição
+        self.spam_action_task = None
+        # Anti-invite: código do convite -> (ID do servidor ou None se inválido, expiração monotonic)
+        self.invite_cache: Dict[str, Tuple[Any, float]] = {}
+        self.invite_lookups: Dict[str, asyncio.Task] = {}  # Consultas REST em andamento, compartilhadas entre mensagens
+        # Lockdown de entrada ativo por guild: estágio, quando começou/último pico e o que restaurar ao desfazer
+        self.lockdowns: Dict[int, Dict[str, Any]] = {}
+        self.lockdown_tasks: Dict[int, asyncio.Task] = {}  # Transições de lockdown em andamento
+        # Log de moderação compartilhado (schema, thread de escrita e pool de leitura ficam em src/modlog.py)
+        self.moderation_log = get_moderation_log(bot)
+        # Kicks, bans e timeouts automáticos passam pela mesma camada dos comandos de moderação
+        self.actions = get_moderation_actions(bot)
+
+        # Snapshot do estado em memória: guilds alterados desde o último snapshot e guilds a apagar
+        self.state_store = ProtectionStateStore("data/protection_state.db")
+        self.state_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="protection-state")
+        self.dirty_state: Set[int] = set()
+        self.removed_state: Set[int] = set()
+        self.pending_state_dirty = False
+        self.restored_pending: List[Tuple[str, int, int, int]] = []
+        self.state_snapshot_task = None
+        self.restore_state()
 
         # Inicializa o estado do raid mode para os guilds atuais
         # O estado será gerenciado dinamicamente por guild join/leave e comandos
@@ -38,9 +612,195 @@ class Protection(commands.Cog):
              self.raid_mode_active.setdefault(guild.id, False)
 
 
-    @tasks.loop(seconds=SPIKE_DETECTION_WINDOW) # Loop roda a cada SPIKE_DETECTION_WINDOW segundos
+    def restore_state(self):
+        """Recarrega o último snapshot (chamado uma vez no __init__; é uma leitura local de poucos ms)."""
+        started = time.perf_counter()
+        try:
+            guild_rows, window_rows, pending_rows = self.state_store.load()
+        except Exception as e:
+            print(f"Erro ao carregar o estado de proteção salvo: {e}")
+            guild_rows, window_rows, pending_rows = {}, {}, []
+
+        # O raid_mode_active do protection_config.json serve de valor inicial para guilds sem snapshot
+        for key, config in self.protection_config.items():
+            if key.isdigit() and isinstance(config, dict) and "raid_mode_active" in config:
+                self.raid_mode_active[int(key)] = bool(config["raid_mode_active"])
+
+        current_time = int(time.time())
+        for guild_id, (raid_mode, lockdown) in guild_rows.items():
+            self.raid_mode_active[guild_id] = raid_mode
+            if lockdown:
+                self.lockdowns[guild_id] = lockdown
+        for guild_id, row in window_rows.items():
+            self.recent_joins[guild_id] = JoinWindow.restore(*row, current_time)
+        self.restored_pending = pending_rows
+
+        if guild_rows or window_rows or pending_rows:
+            print(f"Estado de proteção restaurado em {(time.perf_counter() - started) * 1000:.1f} ms: "
+                  f"{len(guild_rows)} servidor(es), {len(window_rows)} janela(s) de joins, {len(self.lockdowns)} lockdown(s), {len(pending_rows)} ação(ões) pendente(s).")
+
+
+    def mark_state_dirty(self, guild_id: int):
+        self.dirty_state.add(guild_id)
+        self.removed_state.discard(guild_id)
+
+
+    def collect_state_snapshot(self):
+        """Serializa no loop (barato) só o que mudou; a escrita em disco fica para o executor."""
+        guild_ids, self.dirty_state = self.dirty_state, set()
+        removed, self.removed_state = self.removed_state, set()
+        guild_rows, window_rows = [], []
+        for guild_id in guild_ids:
+            lockdown = self.lockdowns.get(guild_id)
+            guild_rows.append((guild_id, int(self.raid_mode_active.get(guild_id, False)), json.dumps(lockdown) if lockdown else None))
+            join_window = self.recent_joins.get(guild_id)
+            if join_window is not None:
+                window_rows.append((guild_id, *join_window.snapshot()))
+        pending_rows = None
+        if self.pending_state_dirty:
+            self.pending_state_dirty = False
+            pending_rows = [("delete", messages[0].guild.id if messages[0].guild else 0, channel_id, message.id)
+                            for channel_id, messages in self.pending_deletions.items() for message in messages]
+            pending_rows += [("punish", guild_id, channel_id, member_id)
+                             for guild_id, members in self.spam_pending.items() for member_id, (_, channel_id) in members.items()]
+            pending_rows += self.restored_pending
+        return guild_rows, window_rows, removed, pending_rows
+
+
+    async def write_state_snapshot(self):
+        guild_rows, window_rows, removed, pending_rows = self.collect_state_snapshot()
+        if not guild_rows and not window_rows and not removed and pending_rows is None:
+            return
+        try:
+            await self.bot.loop.run_in_executor(self.state_executor, self.state_store.write_snapshot, guild_rows, window_rows, removed, pending_rows)
+        except Exception as e:
+            print(f"Erro ao salvar o estado de proteção: {e}")
+            # Tenta de novo no próximo snapshot
+            self.dirty_state.update(row[0] for row in guild_rows)
+            self.removed_state.update(removed)
+            if pending_rows is not None:
+                self.pending_state_dirty = True
+
+
+    async def state_snapshot_loop(self):
+        while True:
+            await asyncio.sleep(STATE_SNAPSHOT_INTERVAL)
+            await self.write_state_snapshot()
+
+
+    def restore_pending_actions(self):
+        """Devolve às filas as ações que estavam pendentes quando o bot parou (precisa do cache de guilds pronto)."""
+        rows, self.restored_pending = self.restored_pending, []
+        for kind, guild_id, channel_id, target_id in rows:
+            guild = self.bot.get_guild(guild_id)
+            channel = guild.get_channel(channel_id) if guild else None
+            if channel is None:
+                continue
+            if kind == "delete":
+                self.pending_deletions.setdefault(channel_id, []).append(channel.get_partial_message(target_id))
+            elif kind == "punish":
+                member = guild.get_member(target_id)
+                if member:
+                    self.spam_pending.setdefault(guild_id, {})[target_id] = (member, channel_id)
+        if rows:
+            self.pending_state_dirty = True
+
+
+    async def cog_load(self):
+        self.check_raids.start()
+        self.spam_action_task = self.bot.loop.create_task(self.spam_action_loop())
+        self.state_snapshot_task = self.bot.loop.create_task(self.state_snapshot_loop())
+
+    async def cog_unload(self):
+        self.check_raids.cancel()
+        if self.spam_action_task:
+            self.spam_action_task.cancel()
+        if self.state_snapshot_task:
+            self.state_snapshot_task.cancel()
+        # Último snapshot antes de descarregar, para o próximo start retomar deste ponto
+        await self.write_state_snapshot()
+        await self.moderation_log.flush()
+        await self.bot.loop.run_in_executor(self.state_executor, self.state_store.close)
+        self.state_executor.shutdown(wait=False)
+        for task in list(self.raid_check_tasks.values()):
+            task.cancel()
+        self.raid_check_tasks.clear()
+        self.raid_check_pending.clear()
+        for task in list(self.lockdown_tasks.values()):
+            task.cancel()
+        self.lockdown_tasks.clear()
+        if self.similarity_pool is not None:
+            self.similarity_pool.shutdown(wait=False, cancel_futures=True)
+            self.similarity_pool = None
+
+
+    async def cluster_names(self, names: List[str], threshold: float = SIMILARITY_THRESHOLD) -> Tuple[List[int], List[List[int]]]:
+        if len(names) < SIMILARITY_POOL_MIN_BATCH:
+            return cluster_similar_names(names, threshold)
+        if self.similarity_pool is None:
+            self.similarity_pool = ProcessPoolExecutor(max_workers=1)
+        try:
+            return await self.bot.loop.run_in_executor(self.similarity_pool, cluster_similar_names, names, threshold)
+        except BrokenProcessPool:
+            print("Pool de processos da análise de similaridade falhou. Recriando e analisando no loop.")
+            self.similarity_pool = None
+            return cluster_similar_names(names, threshold)
+
+
+    def get_scoring_plan(self, guild_id: int) -> ScoringPlan:
+        plan = self.scoring_plans.get(guild_id)
+        if plan is None:
+            plan = self.scoring_plans[guild_id] = ScoringPlan(self.protection_config.get(str(guild_id), {}))
+        return plan
+
+    def get_rule_hits(self, guild_id: int) -> Dict[str, int]:
+        hits = self.rule_hits.get(guild_id)
+        if hits is None:
+            hits = self.rule_hits[guild_id] = dict.fromkeys(RAID_RULE_NAMES + ("evaluated",), 0)
+        return hits
+
+
+    def maybe_trigger_raid_check(self, guild: discord.Guild, current_time: int):
+        """Dispara a análise de pico assim que o threshold é cruzado, com debounce por servidor."""
+        guild_id = guild.id
+        if not self.raid_mode_active.get(guild_id, False):
+            return
+        join_window = self.recent_joins.get(guild_id)
+        if join_window is None:
+            return
+        threshold = self.protection_config.get(str(guild_id), {}).get("raid_threshold", 5)
+        if join_window.spike_count(current_time) < threshold:
+            return
+
+        if guild_id in self.raid_check_tasks:
+            # Já existe uma análise rodando ou em debounce: só marca que há joins novos
+            self.raid_check_pending.add(guild_id)
+            return
+        self.raid_check_tasks[guild_id] = self.bot.loop.create_task(self.run_raid_checks(guild_id))
+
+
+    async def run_raid_checks(self, guild_id: int):
+        try:
+            while True:
+                guild = self.bot.get_guild(guild_id)
+                if guild is None:
+                    return
+                self.raid_check_pending.discard(guild_id)
+                try:
+                    await self.process_spike(guild, int(time.time()))
+                except Exception as e:
+                    print(f"Erro ao analisar pico de junções no servidor {guild.name} ({guild_id}): {e}")
+                # Agrupa os joins que chegarem durante o debounce em uma única nova análise
+                await asyncio.sleep(RAID_CHECK_DEBOUNCE)
+                if guild_id not in self.raid_check_pending:
+                    return
+        finally:
+            self.raid_check_tasks.pop(guild_id, None)
+            self.raid_check_pending.discard(guild_id)
+
+
+    @tasks.loop(seconds=SPIKE_DETECTION_WINDOW) # Varredura de manutenção; a detecção em si acontece no on_member_join
     async def check_raids(self):
-        # print("Executando verificação de raids...")
         current_time = int(time.time())
 
         # Crie uma cópia das chaves para iterar de forma segura
@@ -54,104 +814,151 @@ class Protection(commands.Cog):
                     del self.recent_joins[guild_id]
                 if guild_id in self.raid_mode_active:
                     del self.raid_mode_active[guild_id]
+                self.removed_state.add(guild_id)
                 continue
 
-            config = self.protection_config.get(str(guild_id), {})
-            raid_mode_active = self.raid_mode_active.get(guild_id, False)
-            threshold = config.get("raid_threshold", 5)
-            log_channel_id = config.get("log_channel")
-            log_channel = guild.get_channel(log_channel_id) if log_channel_id else None
-
-            # FILTRA: Mantenha na lista self.recent_joins apenas membros que entraram DENTRO da janela RECENT_JOINS_WINDOW
-            # Limpa a lista antes de contar para a detecção de pico
-            if guild_id in self.recent_joins:
-                 self.recent_joins[guild_id] = [(member_id, ts) for member_id, ts in self.recent_joins[guild_id] if current_time - ts <= RECENT_JOINS_WINDOW]
-
-            # CONTA: Conta quantos membros na lista filtrada entraram DENTRO da janela SPIKE_DETECTION_WINDOW
-            recent_joins_in_spike_window = [(member_id, ts) for member_id, ts in self.recent_joins.get(guild_id, []) if current_time - ts <= SPIKE_DETECTION_WINDOW]
-            num_recent_joins = len(recent_joins_in_spike_window)
-
-            # Lógica de detecção de pico e processamento
-            if raid_mode_active and num_recent_joins >= threshold:
-                print(f"Potencial pico de junções detectado no servidor {guild.name} ({guild_id}). {num_recent_joins} membros juntaram nos últimos {SPIKE_DETECTION_WINDOW} segundos.")
-
-                suspect_members_info = [] # Armazena (Member object, suspect_level)
-                members_to_analyze = [] # Lista para buscar os objetos Member
-
-                # Coleta os IDs dos membros que entraram na janela de pico para análise
-                for member_id, ts in recent_joins_in_spike_window:
-                    member = guild.get_member(member_id)
-                    if member:
-                        members_to_analyze.append(member)
-
-                if members_to_analyze:
-                    # Realiza a análise e coleta suspeitos
-                    for member in members_to_analyze:
-                        suspect_level = 0
-                        # Aplicar verificações configuradas
-                        if config.get("check_username", True):
-                             suspect_level += self.analyze_username(member.name)
-
-                        if config.get("check_account_age", True):
-                             account_creation_time = int(member.created_at.timestamp())
-                             if current_time - account_creation_time <= 86400: # 86400 segundos = 1 dia
-                                 suspect_level += 5 # Peso ajustável
-
-                        if config.get("check_avatar", True):
-                             if member.avatar is None or (member.avatar and "embed/avatars/" in str(member.avatar.url)):
-                                  suspect_level += 3 # Peso ajustável
-
-                        if config.get("check_similarity", True):
-                            # Verifica similaridade com OUTROS membros que entraram NESTA JANELA DE PICO
-                            # Cria um conjunto de nomes e avatares para verificar duplicados/similares eficientemente
-                            recent_peers_data = [(m.name, str(m.display_avatar.url) if m.display_avatar else None) for m in members_to_analyze if m.id != member.id]
-                            member_avatar_url = str(member.display_avatar.url) if member.display_avatar else None
-
-                            for peer_name, peer_avatar_url in recent_peers_data:
-                                # Verifica similaridade de nome
-                                if self.similarity(member.name, peer_name) > 0.8: # Limite de similaridade ajustável
-                                    suspect_level += 5 # Peso ajustável
-
-                                # Verifica similaridade de avatar (exata)
-                                if member_avatar_url and peer_avatar_url and member_avatar_url == peer_avatar_url:
-                                    suspect_level += 7 # Peso ajustável
-                                    break # Assume que um avatar duplicado já é um forte indicador, pode parar de verificar outros peers para avatar
-
-
-                        # Se o suspect_level total exceder o threshold configurado para ações
-                        # Pode usar um threshold diferente para a ação do que para a detecção do pico
-                        action_threshold = config.get("action_threshold", threshold) # Usando o mesmo threshold por padrão, mas pode ser separado
-                        if suspect_level >= action_threshold:
-                            suspect_members_info.append((member, suspect_level))
-
-                    if suspect_members_info:
-                        action_taken = False
-                        for member, level in suspect_members_info:
-                             try:
-                                  reason = f"Potencial membro de raid (Suspect Level: {level})"
-                                  # Verifique se o membro ainda está no servidor antes de tentar kickar
-                                  if guild.get_member(member.id):
-                                      await guild.kick(member, reason=reason)
-                                      # Use self.bot.user.id como moderator_id para ações automáticas
-                                      self.log_action(member.id, self.bot.user.id, "kick", reason, f"{member.name}#{member.discriminator}")
-                                      print(f"Kickado membro {member.name} ({member.id}) no servidor {guild.name} por ser suspeito de raid.")
-                                      if log_channel:
-                                           await log_channel.send(f"🛡️ | Membro {member.mention} (`{member.name}#{member.discriminator}`) foi kickado por suspeita de raid (Suspect Level: {level}).")
-                                      action_taken = True
-                                  else:
-                                      print(f"Membro {member.name} ({member.id}) já saiu do servidor {guild.name}.")
-
-                             except Exception as e:
-                                  print(f"Não foi possível kickar membro {member.name} ({member.id}) no servidor {guild.name}: {e}")
-                                  if log_channel:
-                                       await log_channel.send(f"⚠️ | Não foi possível kickar membro {member.mention} (`{member.name}#{member.discriminator}`) no servidor {guild.name} por suspeita de raid: {e}")
-
-                        if action_taken and log_channel:
-                            await log_channel.send(f"🚨 | Múltiplos membros suspeitos de raid foram detectados e ações foram tomadas no servidor {guild.name}.")
-
-            # Opcional: Limpa completamente a lista de joins recentes de um guild se ela ficar vazia
-            if guild_id in self.recent_joins and not self.recent_joins[guild_id]:
+            # Cobre picos que já estavam acima do threshold quando o modo anti-raid foi ativado
+            self.maybe_trigger_raid_check(guild, current_time)
+
+            # Opcional: Limpa a janela de joins recentes de um guild se ela ficar vazia e a linha de base já tiver decaído
+            join_window = self.recent_joins[guild_id]
+            join_window.prune(current_time)
+            join_window.advance(current_time)
+            if not join_window and join_window.baseline < 0.01 and guild_id not in self.raid_check_tasks:
                  del self.recent_joins[guild_id]
+            if not join_window:
+                self.rule_hits_counted.pop(guild_id, None)
+            self.mark_state_dirty(guild_id) # A poda e o decaimento da linha de base também vão para o snapshot
+
+        # Desfaz os lockdowns de entrada cujo pico já passou
+        for guild_id, state in list(self.lockdowns.items()):
+            guild = self.bot.get_guild(guild_id)
+            if guild is None:
+                self.lockdowns.pop(guild_id, None)
+                self.mark_state_dirty(guild_id)
+                continue
+            settings = self.get_lockdown_settings(guild_id) or DEFAULT_JOIN_LOCKDOWN
+            if current_time - state["last_burst"] >= settings["duration"] and guild_id not in self.lockdown_tasks:
+                self.lockdown_tasks[guild_id] = self.bot.loop.create_task(self.end_join_lockdown(guild, "Pico de entradas encerrado"))
+
+
+    async def process_spike(self, guild: discord.Guild, current_time: int):
+        guild_id = guild.id
+        join_window = self.recent_joins.get(guild_id)
+        if join_window is None:
+            return
+
+        config = self.protection_config.get(str(guild_id), {})
+        raid_mode_active = self.raid_mode_active.get(guild_id, False)
+        threshold = config.get("raid_threshold", 5)
+        log_channel_id = config.get("log_channel")
+        log_channel = guild.get_channel(log_channel_id) if log_channel_id else None
+
+        # A janela descarta pela frente as entradas antigas; a contagem do pico é O(1)
+        num_recent_joins = join_window.spike_count(current_time)
+
+        # Lógica de detecção de pico e processamento
+        if raid_mode_active and num_recent_joins >= threshold:
+            print(f"Potencial pico de junções detectado no servidor {guild.name} ({guild_id}). {num_recent_joins} membros juntaram nos últimos {SPIKE_DETECTION_WINDOW} segundos.")
+
+            suspect_members_info = [] # Armazena (Member object, suspect_level)
+            members_to_analyze = [] # Lista para buscar os objetos Member
+
+            # Coleta os IDs dos membros que entraram na janela de pico para análise
+            for member_id, ts in join_window.spike_members(current_time):
+                member = guild.get_member(member_id)
+                if member:
+                    members_to_analyze.append(member)
+
+            if members_to_analyze:
+                # Realiza a análise com as regras compiladas do servidor e coleta suspeitos
+                plan = self.get_scoring_plan(guild_id)
+                hits = self.get_rule_hits(guild_id)
+                # Cada debounce reavalia a janela inteira; os contadores só recebem quem ainda não foi contado neste pico
+                window_ids = {member.id for member in members_to_analyze}
+                already_counted = self.rule_hits_counted.get(guild_id, set()) & window_ids
+                self.rule_hits_counted[guild_id] = window_ids
+                counted = [member.id not in already_counted for member in members_to_analyze]
+                hits["evaluated"] += len(window_ids) - len(already_counted)
+                scores = plan.score_batch(members_to_analyze, current_time, hits, counted)
+
+                similar_counts = [0] * len(members_to_analyze)
+                if plan.similar_name_weight:
+                    # Compara os nomes dos membros desta janela de pico entre si (BK-tree)
+                    similar_counts, name_clusters = await self.cluster_names([m.name for m in members_to_analyze], plan.similarity)
+                    if name_clusters:
+                        print(f"{len(name_clusters)} grupo(s) de nomes parecidos no servidor {guild.name} ({guild_id}); maior com {len(name_clusters[0])} membros.")
+                plan.score_peers(members_to_analyze, similar_counts, scores, hits, counted)
+
+                # Pode usar um threshold diferente para a ação do que para a detecção do pico
+                action_threshold = config.get("action_threshold", threshold) # Usando o mesmo threshold por padrão, mas pode ser separado
+                for member, suspect_level in zip(members_to_analyze, scores):
+                    if suspect_level >= action_threshold:
+                        suspect_members_info.append((member, suspect_level))
+
+                if suspect_members_info:
+                    await self.execute_raid_actions(guild, suspect_members_info, config.get("raid_action", "kick"), log_channel)
+
+
+    async def execute_raid_actions(self, guild: discord.Guild, suspects: List[Tuple[discord.Member, int]], action: str, log_channel=None):
+        """Expulsa ou bane um lote de suspeitos com concorrência limitada, grava o log em uma transação e envia um único resumo."""
+        if action not in ("kick", "ban"):
+            action = "kick"
+        semaphore = asyncio.Semaphore(RAID_ACTION_CONCURRENCY)
+        moderator = self.bot.user # O próprio bot é o moderador das ações automáticas
+
+        async def act(member: discord.Member, level: int):
+            reason = f"Potencial membro de raid (Suspect Level: {level})"
+            # Verifique se o membro ainda está no servidor antes de agir
+            if not guild.get_member(member.id):
+                return "gone", member, level, None
+            async with semaphore:
+                try:
+                    if action == "ban":
+                        execute = guild.ban(member, reason=reason, delete_message_seconds=3600)
+                    else:
+                        execute = guild.kick(member, reason=reason)
+                    # Registro no log vai pela camada de ações; o canal de log recebe só o resumo abaixo
+                    await self.actions.dispatch(guild, moderator, member, action, reason, execute, announce=False)
+                except discord.NotFound:
+                    return "gone", member, level, None
+                except Exception as e:
+                    return "failed", member, level, e
+            return "done", member, level, reason
+
+        results = await asyncio.gather(*(act(member, level) for member, level in suspects))
+
+        done = [(member, level, reason) for status, member, level, reason in results if status == "done"]
+        failed = [(member, level, error) for status, member, level, error in results if status == "failed"]
+        gone = sum(1 for status, *_ in results if status == "gone")
+
+        verb = "banido(s)" if action == "ban" else "kickado(s)"
+        print(f"Raid no servidor {guild.name} ({guild.id}): {len(done)} membro(s) {verb}, {len(failed)} falha(s), {gone} já tinham saído.")
+        for member, level, error in failed:
+            print(f"Não foi possível aplicar {action} em {member} ({member.id}) no servidor {guild.name}: {error}")
+
+        if log_channel and (done or failed):
+            embed = discord.Embed(
+                title="🚨 | Resposta automática a raid",
+                description=f"{len(done)} membro(s) {verb} por suspeita de raid.",
+                color=discord.Color.from_rgb(66, 0, 0)
+            )
+            if done:
+                lines = [f"{member.mention} (`{member}`) - Nível {level}" for member, level, _ in done[:RAID_SUMMARY_MAX_MEMBERS]]
+                if len(done) > RAID_SUMMARY_MAX_MEMBERS:
+                    lines.append(f"... e mais {len(done) - RAID_SUMMARY_MAX_MEMBERS}")
+                embed.add_field(name="Membros", value="\n".join(lines)[:1024], inline=False)
+            if failed:
+                lines = [f"{member.mention} (`{member}`): {error}" for member, _, error in failed[:10]]
+                if len(failed) > 10:
+                    lines.append(f"... e mais {len(failed) - 10}")
+                embed.add_field(name="⚠️ Falhas", value="\n".join(lines)[:1024], inline=False)
+            if gone:
+                embed.set_footer(text=f"{gone} suspeito(s) já tinham saído do servidor.")
+            try:
+                await log_channel.send(embed=embed)
+            except Exception as e:
+                print(f"Erro ao enviar resumo da raid para o canal de log: {e}")
 
 
     @check_raids.before_loop
@@ -167,11 +974,16 @@ class Protection(commands.Cog):
     async def on_member_join(self, member: discord.Member):
         guild_id = member.guild.id
         join_time = int(time.time())
-        # Armazena o ID do membro e o timestamp de entrada
-        self.recent_joins.setdefault(guild_id, []).append((member.id, join_time))
-        # Remove entradas antigas imediatamente ao adicionar uma nova, mantendo apenas dentro da janela maior
-        self.recent_joins[guild_id] = [(mid, ts) for mid, ts in self.recent_joins[guild_id] if join_time - ts <= RECENT_JOINS_WINDOW]
+        # Armazena o ID do membro e o timestamp de entrada; a janela já descarta as entradas antigas
+        join_window = self.recent_joins.get(guild_id)
+        if join_window is None:
+            join_window = self.recent_joins[guild_id] = JoinWindow()
+        join_window.add(member.id, join_time)
+        self.mark_state_dirty(guild_id)
         print(f"Membro {member.name} ({member.id}) juntou-se ao servidor {member.guild.name} ({guild_id}). Adicionado à lista de recentes com timestamp {join_time}.")
+        # Avalia o pico na hora em vez de esperar a próxima volta do check_raids
+        self.maybe_trigger_raid_check(member.guild, join_time)
+        self.check_join_burst(member.guild, join_time)
 
 
     @commands.Cog.listener()
@@ -187,9 +999,449 @@ class Protection(commands.Cog):
             del self.recent_joins[guild.id]
         if guild.id in self.raid_mode_active:
             del self.raid_mode_active[guild.id]
+        self.rule_hits_counted.pop(guild.id, None)
+        task = self.raid_check_tasks.pop(guild.id, None)
+        if task:
+            task.cancel()
+        task = self.lockdown_tasks.pop(guild.id, None)
+        if task:
+            task.cancel()
+        self.lockdowns.pop(guild.id, None)
+        self.dirty_state.discard(guild.id)
+        self.removed_state.add(guild.id)
         print(f"Bot saiu do servidor {guild.name} ({guild.id}). Limpando dados de proteção.")
 
 
+    def get_lockdown_settings(self, guild_id: int):
+        """Configuração do lockdown de entrada do servidor (padrões + join_lockdown do guild), ou None se desligado."""
+        settings = self.lockdown_settings.get(guild_id, False)
+        if settings is not False:
+            return settings
+
+        merged = dict(DEFAULT_JOIN_LOCKDOWN)
+        custom = self.protection_config.get(str(guild_id), {}).get("join_lockdown", {})
+        for key, default in DEFAULT_JOIN_LOCKDOWN.items():
+            value = custom.get(key)
+            if isinstance(value, bool) if isinstance(default, bool) else ScoringPlan.valid_parameter(key, default, value):
+                merged[key] = value
+        settings = merged if merged["enabled"] else None
+        self.lockdown_settings[guild_id] = settings
+        return settings
+
+
+    def check_join_burst(self, guild: discord.Guild, current_time: int):
+        """Compara os joins da janela de pico com a linha de base EWMA e escala o lockdown se preciso. O(1) por join."""
+        settings = self.lockdown_settings.get(guild.id, False)
+        if settings is False:
+            settings = self.get_lockdown_settings(guild.id)
+        if settings is None:
+            return
+        join_window = self.recent_joins.get(guild.id)
+        if join_window is None:
+            return
+
+        joins = join_window.spike_count(current_time)
+        limit = max(settings["min_joins"], settings["multiplier"] * join_window.baseline)
+        if joins < limit:
+            return
+
+        state = self.lockdowns.get(guild.id)
+        if state is not None:
+            state["last_burst"] = current_time
+        stage = 2 if settings["lock_channels"] and joins >= 2 * limit else 1
+        if (state is not None and state["stage"] >= stage) or guild.id in self.lockdown_tasks:
+            return
+        self.lockdown_tasks[guild.id] = self.bot.loop.create_task(
+            self.escalate_join_lockdown(guild, stage, joins, join_window.baseline, current_time)
+        )
+
+
+    async def escalate_join_lockdown(self, guild: discord.Guild, stage: int, joins: int, baseline: float, current_time: int):
+        try:
+            state = self.lockdowns.get(guild.id)
+            new_state = state is None
+            if new_state:
+                state = self.lockdowns[guild.id] = {
+                    "stage": 0, "started_at": current_time, "last_burst": current_time,
+                    "verification_level": None, "invites_paused": None, "channels": {}
+                }
+            reason = f"Lockdown anti-raid: {joins} entradas em {SPIKE_DETECTION_WINDOW}s (linha de base {baseline:.1f})"
+
+            if state["stage"] < 1:
+                # Estágio 1: verificação alta e convites pausados, guardando o estado anterior para restaurar
+                try:
+                    edits = {}
+                    if guild.verification_level < discord.VerificationLevel.high:
+                        state["verification_level"] = guild.verification_level.value
+                        edits["verification_level"] = discord.VerificationLevel.high
+                    # Guild.invites_paused() só existe a partir do discord.py 2.4; a feature vale para todas as versões
+                    if "INVITES_DISABLED" not in guild.features:
+                        state["invites_paused"] = False
+                        edits["invites_disabled"] = True
+                    if edits:
+                        await guild.edit(reason=reason, **edits)
+                except Exception as e:
+                    print(f"Erro ao aplicar lockdown de entrada no servidor {guild.name}: {e}")
+                state["stage"] = 1
+
+            if stage >= 2 and state["stage"] < 2:
+                # Estágio 2: trava os canais de texto em paralelo
+                state["channels"] = await self.set_channels_locked(guild, True, reason)
+                state["stage"] = 2
+
+            self.mark_state_dirty(guild.id)
+            print(f"Lockdown de entrada no servidor {guild.name} ({guild.id}) no estágio {state['stage']}: {reason}")
+            await self.send_lockdown_log(guild, f"🔒 | Lockdown de entrada ativado (estágio {state['stage']})" if new_state or stage >= 2 else None, reason)
+        finally:
+            self.lockdown_tasks.pop(guild.id, None)
+
+
+    async def end_join_lockdown(self, guild: discord.Guild, reason: str):
+        try:
+            state = self.lockdowns.get(guild.id)
+            if state is None:
+                return
+            edits = {}
+            if state.get("verification_level") is not None:
+                edits["verification_level"] = discord.VerificationLevel(state["verification_level"])
+            if state.get("invites_paused") is False:
+                edits["invites_disabled"] = False
+            if edits:
+                try:
+                    await guild.edit(reason=f"Fim do lockdown anti-raid: {reason}", **edits)
+                except Exception as e:
+                    print(f"Erro ao desfazer lockdown de entrada no servidor {guild.name}: {e}")
+            if state.get("channels"):
+                await self.set_channels_locked(guild, False, f"Fim do lockdown anti-raid: {reason}", state["channels"])
+            self.lockdowns.pop(guild.id, None)
+            self.mark_state_dirty(guild.id)
+            print(f"Lockdown de entrada encerrado no servidor {guild.name} ({guild.id}): {reason}")
+            await self.send_lockdown_log(guild, "🔓 | Lockdown de entrada encerrado", reason)
+        finally:
+            self.lockdown_tasks.pop(guild.id, None)
+
+
+    async def set_channels_locked(self, guild: discord.Guild, lock: bool, reason: str, previous: Dict[str, Any] = None) -> Dict[str, Any]:
+        """Trava (ou restaura) o send_messages do @everyone em todos os canais de texto, em paralelo.
+
+        Ao travar, retorna {channel_id: valor anterior} dos canais alterados; ao destravar, restaura a partir de `previous`.
+        """
+        default_role = guild.default_role
+        semaphore = asyncio.Semaphore(LOCKDOWN_CHANNEL_CONCURRENCY)
+        changed: Dict[str, Any] = {}
+        if lock:
+            targets = [(channel, False) for channel in guild.text_channels if channel.overwrites_for(default_role).send_messages is not False]
+        else:
+            # Só mexe nos canais que o próprio lockdown travou, devolvendo o valor que tinham antes
+            previous = previous or {}
+            targets = [(channel, previous[str(channel.id)]) for channel in guild.text_channels if str(channel.id) in previous]
+
+        async def apply(channel: discord.TextChannel, value):
+            async with semaphore:
+                overwrite = channel.overwrites_for(default_role)
+                old_value = overwrite.send_messages
+                overwrite.send_messages = value
+                try:
+                    await channel.set_permissions(default_role, overwrite=overwrite, reason=reason)
+                    if lock:
+                        changed[str(channel.id)] = old_value
+                except Exception as e:
+                    print(f"Erro ao {'travar' if lock else 'destravar'} o canal {channel.name}: {e}")
+
+        await asyncio.gather(*(apply(channel, value) for channel, value in targets))
+        return changed
+
+
+    async def send_lockdown_log(self, guild: discord.Guild, title, reason: str):
+        log_channel_id = self.protection_config.get(str(guild.id), {}).get("log_channel")
+        log_channel = guild.get_channel(log_channel_id) if log_channel_id else None
+        if not log_channel or not title:
+            return
+        embed = discord.Embed(title=title, description=reason, color=discord.Color.from_rgb(66, 0, 0))
+        try:
+            await log_channel.send(embed=embed)
+        except Exception as e:
+            print(f"Erro ao enviar log do lockdown de entrada: {e}")
+
+
+    def get_spam_settings(self, guild_id: int):
+        """Bloco anti_spam efetivo do servidor (global sobrescrito pelo do guild), compilado em uma tupla.
+
+        max_messages/time_window definem um token bucket, não uma janela deslizante: rajada de até max_messages
+        mensagens e depois um ritmo sustentado de max_messages a cada time_window segundos. Partindo do bucket cheio,
+        cabem até ~2x max_messages dentro da primeira janela antes de disparar.
+
+        Retorna (capacidade, tokens por segundo, janela, punição, duração) ou None se o anti-spam estiver desligado.
+        """
+        settings = self.spam_settings.get(guild_id, False)
+        if settings is not False:
+            return settings
+
+        merged = dict(self.protection_config.get("anti_spam", {}))
+        merged.update(self.protection_config.get(str(guild_id), {}).get("anti_spam", {}))
+        settings = None
+        try:
+            max_messages = int(merged.get("max_messages", 5))
+            time_window = float(merged.get("time_window", 5))
+            punishment = merged.get("punishment", "mute")
+            duration = int(merged.get("punishment_duration", 300))
+            if merged.get("enabled", False) and max_messages > 0 and time_window > 0:
+                if punishment not in SPAM_PUNISHMENTS:
+                    print(f"Punição de anti-spam desconhecida '{punishment}' no servidor {guild_id}. Usando 'delete'.")
+                    punishment = "delete"
+                settings = (float(max_messages), max_messages / time_window, time_window, punishment, max(1, min(duration, 28 * 86400)))
+        except (TypeError, ValueError):
+            print(f"Configuração de anti-spam inválida no servidor {guild_id}. Anti-spam desativado.")
+        self.spam_settings[guild_id] = settings
+        return settings
+
+
+    @commands.Cog.listener()
+    async def on_message(self, message: discord.Message):
+        if message.guild is None or message.author.bot:
+            return
+        guild_id = message.guild.id
+        settings = self.spam_settings.get(guild_id, False)
+        if settings is False:
+            settings = self.get_spam_settings(guild_id)
+        if settings is None:
+            return
+
+        # Token bucket: `capacidade` mensagens de uma vez, reabastecido a max_messages/time_window por segundo
+        # (limita rajada e ritmo; não é "no máximo max_messages em qualquer janela de time_window")
+        capacity, rate = settings[0], settings[1]
+        key = (guild_id, message.author.id)
+        now = time.monotonic()
+        bucket = self.spam_buckets.get(key)
+        if bucket is None:
+            self.spam_buckets[key] = [capacity - 1, now]
+            return
+        tokens = bucket[0] + (now - bucket[1]) * rate
+        if tokens > capacity:
+            tokens = capacity
+        bucket[1] = now
+        if tokens >= 1:
+            bucket[0] = tokens - 1
+            return
+        bucket[0] = tokens
+        self.queue_spam_violation(message, key, now)
+
+
+    def queue_spam_violation(self, message: discord.Message, key: Tuple[int, int], now: float):
+        member = message.author
+        if not isinstance(member, discord.Member) or member.guild_permissions.manage_messages:
+            return # Moderadores não são limitados
+        self.pending_deletions.setdefault(message.channel.id, []).append(message)
+        self.pending_state_dirty = True
+        if self.spam_punished.get(key, 0) > now:
+            return
+        self.spam_punished[key] = now + SPAM_PUNISH_COOLDOWN
+        self.spam_pending.setdefault(key[0], {})[member.id] = (member, message.channel.id)
+
+
+    def get_invite_settings(self, guild_id: int):
+        """Bloco anti_invite efetivo do servidor compilado em (códigos liberados, IDs de servidores liberados), ou None se desligado."""
+        settings = self.invite_settings.get(guild_id, False)
+        if settings is not False:
+            return settings
+
+        merged = dict(self.protection_config.get("anti_invite", {}))
+        merged.update(self.protection_config.get(str(guild_id), {}).get("anti_invite", {}))
+        settings = None
+        if merged.get("enabled", False):
+            if merged.get("punishment", "delete") != "delete":
+                print(f"Punição de anti-invite '{merged.get('punishment')}' não suportada no servidor {guild_id}. Usando 'delete'.")
+            # A whitelist aceita IDs de servidor, códigos de convite ou links completos
+            codes, guild_ids = set(), {guild_id}
+            for entry in merged.get("whitelist", []):
+                entry = str(entry).strip()
+                if entry.isdigit() and len(entry) >= 15:
+                    guild_ids.add(int(entry))
+                elif entry:
+                    match = INVITE_RE.search(entry)
+                    codes.add(match.group(1) if match else entry)
+            settings = (frozenset(codes), frozenset(guild_ids))
+        self.invite_settings[guild_id] = settings
+        return settings
+
+
+    async def resolve_invite_guild(self, code: str):
+        """ID do servidor de um convite (None se inválido), com cache TTL; consultas simultâneas ao mesmo código compartilham uma requisição.
+
+        Retorna INVITE_UNRESOLVED se a consulta falhar, para quem chama não tratar a falha como convite externo.
+        """
+        cached = self.invite_cache.get(code)
+        if cached and cached[1] > time.monotonic():
+            return cached[0]
+
+        lookup = self.invite_lookups.get(code)
+        if lookup is None:
+            lookup = self.invite_lookups[code] = self.bot.loop.create_task(self.fetch_invite_guild(code))
+            lookup.add_done_callback(lambda _, code=code: self.invite_lookups.pop(code, None))
+        try:
+            # shield: se uma mensagem for cancelada, a consulta continua para as outras que esperam o mesmo código
+            return await asyncio.shield(lookup)
+        except asyncio.CancelledError:
+            if lookup.cancelled():
+                return INVITE_UNRESOLVED # A consulta em si foi cancelada (ex.: descarregando a cog)
+            raise
+
+
+    async def fetch_invite_guild(self, code: str):
+        try:
+            invite = await self.bot.fetch_invite(code, with_counts=False)
+            guild_id = invite.guild.id if invite.guild else None
+        except discord.NotFound:
+            guild_id = None # Convite inválido ou expirado: cacheia como None
+        except Exception as e:
+            print(f"Erro ao consultar convite {code}: {e}")
+            return INVITE_UNRESOLVED # Não cacheia falhas temporárias
+        self.invite_cache[code] = (guild_id, time.monotonic() + INVITE_CACHE_TTL)
+        return guild_id
+
+
+    @commands.Cog.listener("on_message")
+    async def check_invites(self, message: discord.Message):
+        if message.guild is None or message.author.bot:
+            return
+        codes = INVITE_RE.findall(message.content)
+        if not codes:
+            return
+        settings = self.get_invite_settings(message.guild.id)
+        if settings is None:
+            return
+        member = message.author
+        if isinstance(member, discord.Member) and member.guild_permissions.manage_messages:
+            return # Moderadores podem divulgar convites
+
+        allowed_codes, allowed_guilds = settings
+        for code in codes:
+            if code in allowed_codes:
+                continue
+            guild_id = await self.resolve_invite_guild(code)
+            if guild_id is INVITE_UNRESOLVED:
+                continue # Sem resposta da API: na dúvida, não apaga
+            if guild_id not in allowed_guilds:
+                # Apagada em lote pelo mesmo processador da fila do anti-spam
+                self.pending_deletions.setdefault(message.channel.id, []).append(message)
+                self.pending_state_dirty = True
+                print(f"Convite {code} de {member} ({member.id}) removido no servidor {message.guild.name}.")
+                return
+
+
+    async def spam_action_loop(self):
+        await self.bot.wait_until_ready()
+        self.restore_pending_actions()
+        last_sweep = time.monotonic()
+        while True:
+            await asyncio.sleep(SPAM_ACTION_INTERVAL)
+            try:
+                await self.process_spam_actions()
+            except Exception as e:
+                print(f"Erro ao processar fila do anti-spam: {e}")
+            now = time.monotonic()
+            if now - last_sweep >= 60:
+                last_sweep = now
+                self.sweep_spam_buckets(now)
+
+
+    def sweep_spam_buckets(self, now: float):
+        # Um bucket parado por mais que a janela já está cheio: equivale a não ter bucket
+        stale = []
+        for key, (tokens, last_used) in self.spam_buckets.items():
+            settings = self.spam_settings.get(key[0])
+            if not settings or now - last_used >= settings[2]:
+                stale.append(key)
+        for key in stale:
+            del self.spam_buckets[key]
+        for key in [key for key, until in self.spam_punished.items() if until <= now]:
+            del self.spam_punished[key]
+        for code in [code for code, (_, expires) in self.invite_cache.items() if expires <= now]:
+            del self.invite_cache[code]
+
+
+    async def process_spam_actions(self):
+        deletions, self.pending_deletions = self.pending_deletions, {}
+        pending, self.spam_pending = self.spam_pending, {}
+        if not deletions and not pending:
+            return
+        self.pending_state_dirty = True
+
+        async def delete_batch(messages: List[discord.Message]):
+            channel = messages[0].channel
+            # A mesma mensagem pode ter entrado pelo anti-spam e pelo anti-invite
+            messages = list({message.id: message for message in messages}.values())
+            # delete_messages apaga até 100 mensagens por requisição
+            for i in range(0, len(messages), 100):
+                chunk = messages[i:i + 100]
+                try:
+                    if len(chunk) == 1:
+                        await chunk[0].delete()
+                    else:
+                        await channel.delete_messages(chunk, reason="Anti-spam")
+                except discord.NotFound:
+                    pass
+                except Exception as e:
+                    print(f"Erro ao apagar mensagens de spam em #{getattr(channel, 'name', channel.id)}: {e}")
+
+        await asyncio.gather(*(delete_batch(messages) for messages in deletions.values()))
+
+        for guild_id, members in pending.items():
+            guild = self.bot.get_guild(guild_id)
+            settings = self.get_spam_settings(guild_id)
+            if guild is None or settings is None:
+                continue
+            await self.punish_spammers(guild, list(members.values()), settings)
+
+
+    async def punish_spammers(self, guild: discord.Guild, spammers: List[Tuple[discord.Member, int]], settings):
+        max_messages, _, time_window, punishment, duration = settings
+        reason = f"Spam: rajada acima de {int(max_messages)} mensagens ou ritmo acima de {int(max_messages)} mensagens a cada {time_window:g} segundos"
+        semaphore = asyncio.Semaphore(RAID_ACTION_CONCURRENCY)
+
+        async def punish(member: discord.Member):
+            async with semaphore:
+                try:
+                    if punishment == "mute":
+                        execute = member.timeout(timedelta(seconds=duration), reason=reason)
+                    elif punishment == "kick":
+                        execute = guild.kick(member, reason=reason)
+                    elif punishment == "ban":
+                        execute = guild.ban(member, reason=reason, delete_message_seconds=3600)
+                    else:
+                        return member, None # "delete": as mensagens já foram apagadas, nada a registrar
+                    await self.actions.dispatch(guild, self.bot.user, member, punishment, reason, execute, announce=False)
+                    return member, None
+                except Exception as e:
+                    return member, e
+
+        results = await asyncio.gather(*(punish(member) for member, _ in spammers))
+        done = [member for member, error in results if error is None]
+        failed = [(member, error) for member, error in results if error is not None]
+        for member, error in failed:
+            print(f"Não foi possível punir {member} ({member.id}) por spam no servidor {guild.name}: {error}")
+
+        log_channel_id = self.protection_config.get(str(guild.id), {}).get("log_channel")
+        log_channel = guild.get_channel(log_channel_id) if log_channel_id else None
+        if log_channel and (done or failed):
+            action_text = {"mute": f"silenciado(s) por {duration} segundos", "kick": "kickado(s)", "ban": "banido(s)", "delete": "com mensagens apagadas"}[punishment]
+            embed = discord.Embed(
+                title="🛡️ | Anti-spam",
+                description=f"{len(done)} membro(s) {action_text}.\nMotivo: {reason}",
+                color=discord.Color.from_rgb(66, 0, 0)
+            )
+            done_ids = {member.id for member in done}
+            lines = [f"{member.mention} em <#{channel_id}>" for member, channel_id in spammers if member.id in done_ids][:RAID_SUMMARY_MAX_MEMBERS]
+            if lines:
+                embed.add_field(name="Membros", value="\n".join(lines)[:1024], inline=False)
+            if failed:
+                embed.add_field(name="⚠️ Falhas", value="\n".join(f"{member.mention}: {error}" for member, error in failed[:10])[:1024], inline=False)
+            try:
+                await log_channel.send(embed=embed)
+            except Exception as e:
+                print(f"Erro ao enviar resumo do anti-spam para o canal de log: {e}")
+
+
     def load_protection_config(self):
         if os.path.exists(self.protection_config_file):
             with open(self.protection_config_file, "r", encoding="utf-8") as f:
@@ -201,9 +1453,19 @@ class Protection(commands.Cog):
         else:
             self.protection_config = {}
             print(f"Arquivo de configuração {self.protection_config_file} não encontrado. Usando configuração vazia.")
+        # As regras e o anti-spam são recompilados sob demanda a partir da nova configuração
+        self.scoring_plans = {}
+        self.spam_settings = {}
+        self.invite_settings = {}
+        self.lockdown_settings = {}
 
 
     def save_protection_config(self):
+        # Toda alteração de configuração passa por aqui: descarta os planos compilados para refletir a mudança
+        self.scoring_plans.clear()
+        self.spam_settings.clear()
+        self.invite_settings.clear()
+        self.lockdown_settings.clear()
         try:
             # Certifica-se de que o diretório 'data' existe antes de salvar
             os.makedirs(os.path.dirname(self.protection_config_file), exist_ok=True)
@@ -215,104 +1477,6 @@ class Protection(commands.Cog):
         except Exception as e:
             print(f"Erro ao salvar a configuração de proteção em {self.protection_config_file}: {e}")
 
-    def create_table(self):
-        try:
-            self.cursor.execute("""
-                CREATE TABLE IF NOT EXISTS moderation_log (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER,
-                    moderator_id INTEGER,
-                    action TEXT,
-                    reason TEXT,
-                    username TEXT, -- Armazena o nome de usuário na hora da ação
-                    timestamp INTEGER,
-                    guild_id INTEGER -- Adiciona coluna para o ID do guild
-                )
-            """)
-            self.conn.commit()
-        except Exception as e:
-            print(f"Erro ao criar tabela moderation_log: {e}")
-
-
-    def log_action(self, user_id: int, moderator_id: int, action: str, reason: str, username: str, guild_id: int):
-        timestamp = int(time.time())
-        try:
-            self.cursor.execute("INSERT INTO moderation_log (user_id, moderator_id, action, reason, username, timestamp, guild_id) VALUES (?, ?, ?, ?, ?, ?, ?)",
-                                (user_id, moderator_id, action, reason, username, timestamp, guild_id))
-            self.conn.commit()
-        except Exception as e:
-            print(f"Erro ao logar ação de moderação: {e}")
-
-    def analyze_username(self, username: str) -> int:
-        suspect_level = 0
-
-        if not isinstance(username, str):
-             return 0 # Retorna 0 se não for uma string válida
-
-        # Critério 1: Nomes de usuário com muitos números
-        num_digits = sum(c.isdigit() for c in username)
-        if len(username) > 0 and num_digits / len(username) > 0.5:
-            suspect_level += 2
-
-        # Critério 2: Nomes de usuário com muitos caracteres não alfanuméricos
-        non_alphanumeric_count = len(re.findall(r'[^a-zA-Z0-9]', username))
-        if len(username) > 0 and non_alphanumeric_count / len(username) > 0.33:
-            suspect_level += 3
-
-        # Critério 3: Nomes de usuário curtos demais
-        if 0 < len(username) < 3:
-            suspect_level += 1
-
-        # Critério 4: Lista negra de palavras
-        blacklist = ["raid", "bot", "free", "nitro", "hack"] # Adicione palavras relevantes
-        for word in blacklist:
-            if word in username.lower():
-                suspect_level += 4
-                break # Não precisa verificar outras palavras da blacklist se uma já foi encontrada
-
-        # Critério 5: Muitos caracteres Unicode (não ASCII)
-        unicode_count = 0
-        for char in username:
-            if ord(char) > 127:
-                unicode_count += 1
-        if len(username) > 0 and unicode_count / len(username) > 0.25:
-            suspect_level += 2
-
-        return suspect_level
-
-    def similarity(self, s1, s2):
-        if not isinstance(s1, str) or not isinstance(s2, str) or not s1 or not s2:
-            return 0.0
-        longer = s1 if len(s1) > len(s2) else s2
-        shorter = s1 if len(s1) < len(s2) else s2
-        # Já tratamos o caso de string vazia acima, mas esta verificação é redundante
-        # if len(shorter) == 0:
-        #     return 0.0
-
-        longer_length = len(longer)
-        # Adiciona um try-except caso Levenshtein falhe por algum motivo inesperado
-        try:
-            distance = Levenshtein.distance(longer, shorter)
-            return (longer_length - distance) / longer_length
-        except Exception as e:
-            print(f"Erro ao calcular similaridade entre '{s1}' e '{s2}': {e}")
-            return 0.0 # Retorna 0 em caso de erro
-
-    # A função assess_similarity original não é usada diretamente na check_raids corrigida,
-    # pois a lógica de similaridade foi integrada para comparar apenas membros na janela de pico atual.
-    # Mantendo-a caso seja usada em outro lugar ou para referência, mas pode ser removida se não for mais necessária.
-    # async def assess_similarity(self, member: discord.Member) -> int:
-    #     suspect_level = 0
-    #     for other_member_id, other_ts in self.recent_joins.get(member.guild.id, []):
-    #         other_member = member.guild.get_member(other_member_id)
-    #         if other_member and member.id != other_member_id:
-    #             name_sim = self.similarity(member.name, other_member.name)
-    #             if name_sim > 0.8:
-    #                 suspect_level += 5
-    #             if member.display_avatar and other_member.display_avatar and str(member.display_avatar.url) == str(other_member.display_avatar.url):
-    #                  suspect_level += 7
-    #     return suspect_level
-
 
     @app_commands.command(name="raidmode", description="Configurações avançadas de anti-raid")
     @app_commands.checks.has_permissions(administrator=True)
@@ -394,6 +1558,10 @@ class Protection(commands.Cog):
                  # Toggle o estado in-memory diretamente
                  self.raid_mode_active[guild_id] = not self.raid_mode_active.get(guild_id, False)
                  current_state = self.raid_mode_active[guild_id]
+                 # Mantém o protection_config.json em sincronia e grava o snapshot na próxima volta
+                 config["raid_mode_active"] = current_state
+                 self.save_protection_config()
+                 self.mark_state_dirty(guild_id)
                  await interaction.response.send_message(f"Modo Anti-Raid {'ativado' if current_state else 'desativado'}.", ephemeral=True)
             elif setting_key in ["check_username", "check_account_age", "check_avatar", "check_similarity"]:
                  # Toggle settings in config
@@ -505,6 +1673,110 @@ class Protection(commands.Cog):
              print(f"Erro ao editar a mensagem original: {e}")
 
 
+    @app_commands.command(name="raidrules", description="Mostra as regras de pontuação anti-raid e quantas vezes cada uma pontuou.")
+    @app_commands.describe(reset_hits="Zera os contadores de acerto depois de mostrar")
+    @app_commands.checks.has_permissions(administrator=True)
+    async def raidrules(self, interaction: discord.Interaction, reset_hits: bool = False):
+        if not interaction.guild:
+            await interaction.response.send_message("Este comando só pode ser usado em um servidor.", ephemeral=True)
+            return
+
+        guild_id = interaction.guild.id
+        plan = self.get_scoring_plan(guild_id)
+        hits = self.get_rule_hits(guild_id)
+        evaluated = hits["evaluated"]
+
+        embed = discord.Embed(title="Regras Anti-Raid", color=discord.Color.from_rgb(66, 0, 0))
+        embed.description = f"Membros avaliados desde o último reset: **{evaluated}**"
+        for name in RAID_RULE_NAMES:
+            rule = plan.rules[name]
+            params = ", ".join(f"{key}: {value if not isinstance(value, list) else len(value)}" for key, value in rule.items() if key != "weight")
+            rate = f" ({hits[name] / evaluated:.0%})" if evaluated else ""
+            status = f"Peso {rule['weight']}" if rule["weight"] else "Desativada"
+            embed.add_field(name=name, value=f"{status}\nAcertos: {hits[name]}{rate}" + (f"\n{params}" if params else ""), inline=True)
+
+        if reset_hits:
+            self.rule_hits.pop(guild_id, None)
+            self.rule_hits_counted.pop(guild_id, None)
+            embed.set_footer(text="Contadores zerados.")
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+
+
+    @app_commands.command(name="setraidrule", description="Ajusta o peso ou um parâmetro de uma regra anti-raid.")
+    @app_commands.describe(rule="Regra a ajustar", weight="Novo peso (0 desativa a regra)", parameter="Parâmetro da regra (ratio, min_length, max_age, similarity)", value="Novo valor do parâmetro")
+    @app_commands.choices(rule=[app_commands.Choice(name=name, value=name) for name in RAID_RULE_NAMES])
+    @app_commands.checks.has_permissions(administrator=True)
+    async def setraidrule(self, interaction: discord.Interaction, rule: app_commands.Choice[str], weight: app_commands.Range[int, 0, 100] = None, parameter: str = None, value: float = None):
+        if not interaction.guild:
+            await interaction.response.send_message("Este comando só pode ser usado em um servidor.", ephemeral=True)
+            return
+        if weight is None and parameter is None:
+            await interaction.response.send_message("Informe um peso ou um parâmetro para ajustar.", ephemeral=True)
+            return
+
+        defaults = DEFAULT_RAID_RULES[rule.value]
+        rule_config = self.protection_config.setdefault(str(interaction.guild.id), {}).setdefault("rules", {}).setdefault(rule.value, {})
+        if parameter is not None:
+            if parameter == "weight" or parameter not in defaults or isinstance(defaults[parameter], list):
+                options = ", ".join(key for key, default in defaults.items() if key != "weight" and not isinstance(default, list)) or "nenhum"
+                await interaction.response.send_message(f"Parâmetro inválido para `{rule.value}`. Opções: {options}.", ephemeral=True)
+                return
+            if value is None:
+                await interaction.response.send_message("Informe o valor do parâmetro.", ephemeral=True)
+                return
+            if isinstance(defaults[parameter], int):
+                value = int(value)
+            error = ScoringPlan.parameter_error(parameter, defaults[parameter], value)
+            if error:
+                await interaction.response.send_message(f"Valor inválido para `{parameter}`: {error}.", ephemeral=True)
+                return
+            rule_config[parameter] = value
+        if weight is not None:
+            rule_config["weight"] = weight
+
+        self.save_protection_config()
+        rule_now = self.get_scoring_plan(interaction.guild.id).rules[rule.value]
+        summary = ", ".join(f"{key}: {current}" for key, current in rule_now.items() if not isinstance(current, list))
+        await interaction.response.send_message(f"Regra `{rule.value}` atualizada ({summary}).", ephemeral=True)
+
+
+    @app_commands.command(name="joinlockdown", description="Configura o lockdown automático de entrada durante picos de joins.")
+    @app_commands.describe(
+        enabled="Ativa ou desativa o lockdown automático",
+        multiplier="Dispara quando os joins por minuto passam deste múltiplo da média do servidor",
+        min_joins="Mínimo de joins por minuto para disparar",
+        duration="Segundos sem novo pico até desfazer o lockdown",
+        lock_channels="Trava os canais de texto quando o pico passa do dobro do limite"
+    )
+    @app_commands.checks.has_permissions(administrator=True)
+    async def joinlockdown(self, interaction: discord.Interaction, enabled: bool, multiplier: app_commands.Range[float, 1.5, 100.0] = None,
+                           min_joins: app_commands.Range[int, 2, 1000] = None, duration: app_commands.Range[int, 60, 86400] = None, lock_channels: bool = None):
+        if not interaction.guild:
+            await interaction.response.send_message("Este comando só pode ser usado em um servidor.", ephemeral=True)
+            return
+
+        guild_id = interaction.guild.id
+        lockdown_config = self.protection_config.setdefault(str(guild_id), {}).setdefault("join_lockdown", {})
+        lockdown_config["enabled"] = enabled
+        for key, value in (("multiplier", multiplier), ("min_joins", min_joins), ("duration", duration), ("lock_channels", lock_channels)):
+            if value is not None:
+                lockdown_config[key] = float(value) if key == "multiplier" else value
+        self.save_protection_config()
+
+        settings = self.get_lockdown_settings(guild_id) or {**DEFAULT_JOIN_LOCKDOWN, **lockdown_config}
+        join_window = self.recent_joins.get(guild_id)
+        baseline = join_window.baseline if join_window else 0.0
+        message = (
+            f"Lockdown de entrada {'ativado' if enabled else 'desativado'}.\n"
+            f"Limite: {settings['multiplier']:g}x a média ({baseline:.1f} joins/min), mínimo {settings['min_joins']} joins/min; "
+            f"desfaz após {settings['duration']}s sem pico; travar canais: {'sim' if settings['lock_channels'] else 'não'}."
+        )
+        if not enabled and guild_id in self.lockdowns and guild_id not in self.lockdown_tasks:
+            self.lockdown_tasks[guild_id] = self.bot.loop.create_task(self.end_join_lockdown(interaction.guild, "Desativado manualmente"))
+            message += "\nO lockdown ativo está sendo desfeito."
+        await interaction.response.send_message(message, ephemeral=True)
+
+
     @app_commands.command(name="setlogchannel", description="Define o canal para logs de moderação e proteção anti-raid.")
     @app_commands.describe(channel="Canal para logs")
     @app_commands.checks.has_permissions(administrator=True)
@@ -530,3 +1802,74 @@ async def setup(bot: commands.Bot):
     # async def on_ready():
     #     cog.task.start()
     # bot.add_listener(on_ready)
+
+
+if __name__ == "__main__":
+    # Microbenchmark do score em lote: python -m src.cogs.protection [quantidade]
+    import random
+    import sys
+    from types import SimpleNamespace
+
+    def legacy_analyze_username(username: str) -> int:
+        # Versão anterior (um laço Python por critério), mantida só como referência
+        suspect_level = 0
+        num_digits = sum(c.isdigit() for c in username)
+        if len(username) > 0 and num_digits / len(username) > 0.5:
+            suspect_level += 2
+        non_alphanumeric_count = len(re.findall(r'[^a-zA-Z0-9]', username))
+        if len(username) > 0 and non_alphanumeric_count / len(username) > 0.33:
+            suspect_level += 3
+        if 0 < len(username) < 3:
+            suspect_level += 1
+        for word in ["raid", "bot", "free", "nitro", "hack"]:
+            if word in username.lower():
+                suspect_level += 4
+                break
+        unicode_count = 0
+        for char in username:
+            if ord(char) > 127:
+                unicode_count += 1
+        if len(username) > 0 and unicode_count / len(username) > 0.25:
+            suspect_level += 2
+        return suspect_level
+
+    def legacy_score(member, current_time: int) -> int:
+        # A versão anterior usava member.created_at, derivado do snowflake
+        member.created_at = discord.utils.snowflake_time(member.id)
+        suspect_level = legacy_analyze_username(member.name)
+        if current_time - int(member.created_at.timestamp()) <= 86400:
+            suspect_level += 5
+        if member.avatar is None:
+            suspect_level += 3
+        return suspect_level
+
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    random.seed(42)
+    now = int(time.time())
+    alphabet = string.ascii_letters + string.digits + "_.-éãç★ツ"
+    members = []
+    for i in range(count):
+        if i % 10 == 0:
+            name = f"{random.choice(USERNAME_BLACKLIST)}{random.randint(0, 99999)}"
+        else:
+            name = "".join(random.choices(alphabet, k=random.randint(2, 24)))
+        created_ms = (now - random.randint(0, 86400 * 30)) * 1000
+        members.append(SimpleNamespace(
+            id=((created_ms - discord.utils.DISCORD_EPOCH) << 22) | i % 4096,
+            name=name,
+            avatar=None if i % 3 == 0 else "avatar"
+        ))
+
+    start = time.perf_counter()
+    legacy_scores = [legacy_score(member, now) for member in members]
+    legacy_elapsed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    batch_scores = score_join_batch(members, now)
+    batch_elapsed = time.perf_counter() - start
+
+    assert batch_scores == legacy_scores, "score_join_batch diverge da implementação anterior"
+    print(f"{count} membros")
+    print(f"anterior:  {legacy_elapsed * 1000:8.1f} ms ({count / legacy_elapsed:,.0f} membros/s)")
+    print(f"em lote:   {batch_elapsed * 1000:8.1f} ms ({count / batch_elapsed:,.0f} membros/s)")
+    print(f"speedup:   {legacy_elapsed / batch_elapsed:.2f}x")
@@ -0,0 +1,82 @@
+"""
+Camada central das ações de moderação.
+
+Todo caminho que pune um usuário (comandos da Moderation, modais do painel, avisos) passa por aqui:
+a ação é executada no Discord, o registro entra na fila do log de moderação (src/modlog.py, gravado
+em lote por tamanho ou tempo) e o aviso no canal de log é enviado em segundo plano. Nenhuma etapa
+faz I/O de disco no event loop nem atrasa a resposta do comando.
+"""
+
+import asyncio
+from datetime import datetime
+from typing import Awaitable, Optional, Set
+
+import discord
+
+from src.modlog import get_moderation_log
+
+# Título e cor do embed enviado ao canal de log para cada tipo de ação
+ACTION_LOG_STYLES = {
+    "ban": ("🔨 | Usuário Banido", discord.Color.red()),
+    "kick": ("👢 | Usuário Expulso", discord.Color.orange()),
+    "mute": ("🔇 | Usuário Silenciado", discord.Color.blue()),
+    "warn": ("⚠️ | Usuário Avisado", discord.Color.yellow()),
+}
+
+
+class ModerationActions:
+    def __init__(self, bot):
+        self.bot = bot
+        self.moderation_log = get_moderation_log(bot)
+        # Referências aos envios para o canal de log, para as tasks não serem coletadas antes de terminar
+        self.log_tasks: Set[asyncio.Task] = set()
+
+    async def dispatch(self, guild: discord.Guild, moderator: discord.abc.User, target: discord.abc.User, action: str, reason: str,
+                       execute: Optional[Awaitable] = None, details: str = None, announce: bool = True):
+        """Executa a ação no Discord (`execute`) e, se ela der certo, registra no log e no canal de log.
+
+        Exceções de `execute` (Forbidden, NotFound...) sobem sem registrar nada, para cada comando tratar como já tratava.
+        Ações em massa (raid, anti-spam) passam announce=False e mandam um único resumo ao canal de log.
+        """
+        if execute is not None:
+            await execute
+        self.record(guild, moderator, target, action, reason, details, announce)
+
+    def record(self, guild: discord.Guild, moderator: discord.abc.User, target: discord.abc.User, action: str, reason: str,
+               details: str = None, announce: bool = True):
+        """Registra uma ação já executada; retorna na hora."""
+        self.moderation_log.log(target.id, moderator.id, action, reason, str(target), guild.id)
+
+        log_channel = self.get_log_channel(guild) if announce else None
+        if log_channel is None:
+            return
+        task = asyncio.create_task(self.send_log(log_channel, moderator, target, action, reason, details))
+        self.log_tasks.add(task)
+        task.add_done_callback(self.log_tasks.discard)
+
+    def get_log_channel(self, guild: discord.Guild):
+        # O canal de log é configurado pelo /setlogchannel da Protection; a config já está em memória na cog
+        protection = self.bot.get_cog("Protection")
+        config = getattr(protection, "protection_config", None) or {}
+        log_channel_id = config.get(str(guild.id), {}).get("log_channel")
+        return guild.get_channel(log_channel_id) if log_channel_id else None
+
+    async def send_log(self, log_channel, moderator: discord.abc.User, target: discord.abc.User, action: str, reason: str, details: str = None):
+        title, color = ACTION_LOG_STYLES.get(action, (f"🛡️ | {action.capitalize()}", discord.Color.dark_grey()))
+        description = f"**Usuário:** {target.mention} (`{target}`)\n**Moderador:** {moderator.mention}\n**Motivo:** {reason}"
+        if details:
+            description += f"\n{details}"
+        embed = discord.Embed(title=title, description=description[:4096], color=color, timestamp=datetime.utcnow())
+        embed.set_footer(text=f"ID do Usuário: {target.id}")
+        try:
+            await log_channel.send(embed=embed)
+        except Exception as e:
+            print(f"Erro ao enviar {action} de {target} ({target.id}) para o canal de log: {e}")
+
+
+def get_moderation_actions(bot) -> ModerationActions:
+    """Instância compartilhada da camada de ações, criada na primeira cog que pedir."""
+    moderation_actions = getattr(bot, "moderation_actions", None)
+    if moderation_actions is None or moderation_actions.moderation_log.closed:
+        moderation_actions = bot.moderation_actions = ModerationActions(bot)
+    return moderation_actions
@@ -0,0 +1,367 @@
+"""
+Serviço compartilhado do log de moderação (data/moderation.db).
+
+Uma única instância por bot é dona do schema e das migrações das tabelas moderation_log e warns.
+As escritas vão para uma thread dedicada que agrupa vários registros por commit, e as
+leituras rodam em um pequeno pool de conexões, então nenhuma cog faz I/O de disco no event loop.
+"""
+
+import asyncio
+import atexit
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+DB_FILE = "data/moderation.db"
+# A thread de escrita faz commit quando junta este número de registros...
+WRITE_BATCH_SIZE = 200
+# ...ou quando o registro mais antigo da fila espera este tempo (segundos)
+WRITE_FLUSH_INTERVAL = 1.0
+# Tempo máximo (segundos) que flush() espera pela thread de escrita
+FLUSH_TIMEOUT = 10.0
+# Conexões de leitura simultâneas (WAL permite leitores em paralelo com o escritor)
+READ_POOL_SIZE = 3
+# Avisos importados do warns.json não tinham servidor; aparecem em todos os servidores, como antes
+LEGACY_GUILD_ID = 0
+
+# Migrações em ordem; PRAGMA user_version guarda quantas já foram aplicadas.
+# Cada item é uma função que recebe a conexão, para poder inspecionar o schema antes de alterar.
+# Pode retornar uma função a ser chamada só depois do commit (efeitos fora do banco, como mexer em arquivos).
+
+
+def _migration_create_table(conn: sqlite3.Connection):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS moderation_log (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            moderator_id INTEGER,
+            action TEXT,
+            reason TEXT,
+            timestamp INTEGER
+        )
+    """)
+
+
+def _migration_add_username_guild(conn: sqlite3.Connection):
+    # Bancos criados pela History não têm estas colunas; os criados pela Protection já têm
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(moderation_log)")}
+    if "username" not in columns:
+        conn.execute("ALTER TABLE moderation_log ADD COLUMN username TEXT")
+    if "guild_id" not in columns:
+        conn.execute("ALTER TABLE moderation_log ADD COLUMN guild_id INTEGER")
+
+
+def _migration_history_index_and_summary(conn: sqlite3.Connection):
+    # Índice da consulta do /history (guild, usuário, mais recentes primeiro); o id desempata a paginação
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_moderation_log_guild_user_time ON moderation_log (guild_id, user_id, timestamp, id)")
+    # Contagem por tipo de ação mantida por triggers, para não precisar de COUNT(*) sobre o histórico inteiro.
+    # Registros antigos sem guild_id ficam sob o guild 0.
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS moderation_summary (
+            guild_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            action TEXT NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (guild_id, user_id, action)
+        ) WITHOUT ROWID
+    """)
+    conn.execute("DELETE FROM moderation_summary")
+    conn.execute("""
+        INSERT INTO moderation_summary (guild_id, user_id, action, count)
+        SELECT COALESCE(guild_id, 0), user_id, action, COUNT(*) FROM moderation_log
+        WHERE user_id IS NOT NULL AND action IS NOT NULL
+        GROUP BY COALESCE(guild_id, 0), user_id, action
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS moderation_summary_insert AFTER INSERT ON moderation_log
+        WHEN NEW.user_id IS NOT NULL AND NEW.action IS NOT NULL
+        BEGIN
+            INSERT INTO moderation_summary (guild_id, user_id, action, count) VALUES (COALESCE(NEW.guild_id, 0), NEW.user_id, NEW.action, 1)
+            ON CONFLICT (guild_id, user_id, action) DO UPDATE SET count = count + 1;
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS moderation_summary_delete AFTER DELETE ON moderation_log
+        WHEN OLD.user_id IS NOT NULL AND OLD.action IS NOT NULL
+        BEGIN
+            UPDATE moderation_summary SET count = count - 1
+            WHERE guild_id = COALESCE(OLD.guild_id, 0) AND user_id = OLD.user_id AND action = OLD.action;
+        END
+    """)
+
+
+def _migration_warns(conn: sqlite3.Connection):
+    # Avisos só recebem INSERT (e DELETE no /clearwarns); o índice cobre contagem e "mais recentes" por (guild, usuário)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS warns (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            guild_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            moderator_id INTEGER,
+            reason TEXT,
+            timestamp INTEGER NOT NULL
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_warns_guild_user_time ON warns (guild_id, user_id, timestamp, id)")
+
+    # Importa o antigo data/warns.json (um dict usuário -> lista, sem servidor); esses avisos ficam sob o guild 0
+    db_file = conn.execute("PRAGMA database_list").fetchone()[2]
+    warns_file = os.path.join(os.path.dirname(db_file), "warns.json")
+    if not os.path.exists(warns_file):
+        return
+    try:
+        with open(warns_file, "r") as f:
+            legacy = json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        print(f"Erro ao ler {warns_file} para migração dos avisos: {e}")
+        return
+    rows = []
+    for user_id, warns in legacy.items():
+        for warn in warns:
+            try:
+                timestamp = int(datetime.fromisoformat(warn["timestamp"]).replace(tzinfo=timezone.utc).timestamp())
+            except (KeyError, TypeError, ValueError):
+                timestamp = int(time.time())
+            rows.append((LEGACY_GUILD_ID, int(user_id), int(warn.get("moderator") or 0) or None, warn.get("reason"), timestamp))
+    conn.executemany("INSERT INTO warns (guild_id, user_id, moderator_id, reason, timestamp) VALUES (?, ?, ?, ?, ?)", rows)
+    # O arquivo fica como backup, mas com outro nome para ninguém voltar a escrever nele.
+    # Só renomeia depois do commit: se a migração falhar, o warns.json continua lá para a próxima tentativa.
+    return lambda: os.replace(warns_file, warns_file + ".migrated")
+
+
+MIGRATIONS = [
+    _migration_create_table,
+    _migration_add_username_guild,
+    _migration_history_index_and_summary,
+    _migration_warns,
+]
+
+LogRow = Tuple[int, int, str, str, Optional[str], Optional[int], int]  # user_id, moderator_id, action, reason, username, guild_id, timestamp
+
+
+class ModerationLog:
+    def __init__(self, db_file: str = DB_FILE):
+        self.db_file = db_file
+        os.makedirs(os.path.dirname(db_file), exist_ok=True)
+        self.migrate()
+
+        self.write_queue: "queue.Queue[Any]" = queue.Queue()
+        self.writer = threading.Thread(target=self.writer_loop, name="modlog-writer", daemon=True)
+        self.writer.start()
+
+        self.read_local = threading.local()
+        self.read_connections: List[sqlite3.Connection] = []
+        self.read_lock = threading.Lock()
+        self.read_executor = ThreadPoolExecutor(max_workers=READ_POOL_SIZE, thread_name_prefix="modlog-read")
+        self.closed = False
+
+    def connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_file, check_same_thread=False, timeout=30)
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        return conn
+
+    def migrate(self):
+        conn = self.connect()
+        try:
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            for index in range(version, len(MIGRATIONS)):
+                with conn:
+                    # BEGIN explícito: o sqlite3 não abre transação sozinho antes de DDL
+                    conn.execute("BEGIN")
+                    after_commit = MIGRATIONS[index](conn)
+                    conn.execute(f"PRAGMA user_version = {index + 1}")
+                if after_commit is not None:
+                    after_commit()
+        finally:
+            conn.close()
+
+    # ---- Escrita ----
+
+    def log(self, user_id: int, moderator_id: int, action: str, reason: str, username: str = None, guild_id: int = None, timestamp: int = None):
+        """Enfileira um registro; retorna na hora, sem tocar no disco."""
+        self.write_queue.put((user_id, moderator_id, action, reason, username, guild_id, timestamp or int(time.time())))
+
+    def log_many(self, rows: List[Tuple[int, int, str, str, Optional[str], Optional[int]]]):
+        """Enfileira vários registros (user_id, moderator_id, action, reason, username, guild_id) com o mesmo timestamp."""
+        timestamp = int(time.time())
+        for user_id, moderator_id, action, reason, username, guild_id in rows:
+            self.write_queue.put((user_id, moderator_id, action, reason, username, guild_id, timestamp))
+
+    def add_warn(self, guild_id: int, user_id: int, moderator_id: int, reason: str, timestamp: int = None):
+        """Enfileira um aviso; é só um INSERT no índice, sem reescrever os avisos existentes."""
+        self.write_queue.put(("warn", (guild_id, user_id, moderator_id, reason, timestamp or int(time.time()))))
+
+    def clear_warns(self, guild_id: int, user_id: int):
+        """Enfileira a remoção de todos os avisos do usuário no servidor (inclusive os importados do warns.json)."""
+        self.write_queue.put(("clear_warns", (guild_id, user_id)))
+
+    async def flush(self, timeout: float = FLUSH_TIMEOUT) -> bool:
+        """Espera até que tudo o que foi enfileirado antes desta chamada esteja gravado.
+
+        Retorna False (sem travar quem chamou) se a thread de escrita não estiver rodando ou não responder a tempo.
+        """
+        if not self.writer.is_alive():
+            print("Thread de escrita do log de moderação não está rodando; flush ignorado.")
+            return False
+        loop = asyncio.get_running_loop()
+        done = loop.create_future()
+        self.write_queue.put(("flush", loop, done))
+        try:
+            await asyncio.wait_for(done, timeout)
+        except asyncio.TimeoutError:
+            print(f"Flush do log de moderação não terminou em {timeout:g}s (thread de escrita {'ativa' if self.writer.is_alive() else 'parada'}).")
+            return False
+        return True
+
+    def writer_loop(self):
+        conn = self.connect()
+        stopping = False
+        while not stopping:
+            item = self.write_queue.get()
+            batch: List[LogRow] = []
+            # Operações de avisos ("warn"/"clear_warns") na ordem em que chegaram
+            warn_ops = []
+            waiters = []
+            deadline = time.monotonic() + WRITE_FLUSH_INTERVAL
+            while True:
+                if item is None:
+                    stopping = True
+                elif item[0] == "flush":
+                    waiters.append(item)
+                elif item[0] in ("warn", "clear_warns"):
+                    warn_ops.append(item)
+                else:
+                    batch.append(item)
+                # Um pedido de flush ou de parada grava o que já está na fila sem esperar o intervalo
+                if stopping or waiters or len(batch) + len(warn_ops) >= WRITE_BATCH_SIZE:
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self.write_queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+            if batch or warn_ops:
+                self.write_batch(conn, batch, warn_ops)
+            for _, loop, done in waiters:
+                try:
+                    loop.call_soon_threadsafe(lambda future=done: future.done() or future.set_result(None))
+                except RuntimeError:
+                    pass # Loop já fechado: ninguém mais espera por este flush
+        conn.close()
+
+    def write_batch(self, conn: sqlite3.Connection, batch: List[LogRow], warn_ops: list = ()):
+        try:
+            with conn:
+                if batch:
+                    conn.executemany(
+                        "INSERT INTO moderation_log (user_id, moderator_id, action, reason, username, guild_id, timestamp) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        batch
+                    )
+                for op, row in warn_ops:
+                    if op == "warn":
+                        conn.execute("INSERT INTO warns (guild_id, user_id, moderator_id, reason, timestamp) VALUES (?, ?, ?, ?, ?)", row)
+                    else:
+                        conn.execute("DELETE FROM warns WHERE guild_id IN (?, ?) AND user_id = ?", (row[0], LEGACY_GUILD_ID, row[1]))
+        except Exception as e:
+            print(f"Erro ao gravar {len(batch) + len(warn_ops)} registro(s) no log de moderação: {e}")
+
+    # ---- Leitura ----
+
+    def read_connection(self) -> sqlite3.Connection:
+        conn = getattr(self.read_local, "conn", None)
+        if conn is None:
+            conn = self.read_local.conn = self.connect()
+            with self.read_lock:
+                self.read_connections.append(conn)
+        return conn
+
+    def query(self, sql: str, params: tuple = ()) -> List[tuple]:
+        return self.read_connection().execute(sql, params).fetchall()
+
+    async def fetch(self, sql: str, params: tuple = ()) -> List[tuple]:
+        """Executa uma consulta em uma conexão do pool de leitura, fora do event loop."""
+        return await asyncio.get_running_loop().run_in_executor(self.read_executor, self.query, sql, params)
+
+    async def history_page(self, guild_id: int, user_id: int, limit: int, before: Tuple[int, int] = None, after: Tuple[int, int] = None) -> List[tuple]:
+        """Uma página do histórico (id, moderator_id, action, reason, timestamp), mais recentes primeiro.
+
+        Paginação por chave: `before`/`after` são o (timestamp, id) do último/primeiro registro da página atual,
+        então cada página é uma busca direta no índice, sem OFFSET.
+        """
+        if after is not None:
+            rows = await self.fetch(
+                "SELECT id, moderator_id, action, reason, timestamp FROM moderation_log "
+                "WHERE guild_id = ? AND user_id = ? AND (timestamp, id) > (?, ?) ORDER BY timestamp ASC, id ASC LIMIT ?",
+                (guild_id, user_id, after[0], after[1], limit)
+            )
+            rows.reverse()
+            return rows
+        if before is not None:
+            return await self.fetch(
+                "SELECT id, moderator_id, action, reason, timestamp FROM moderation_log "
+                "WHERE guild_id = ? AND user_id = ? AND (timestamp, id) < (?, ?) ORDER BY timestamp DESC, id DESC LIMIT ?",
+                (guild_id, user_id, before[0], before[1], limit)
+            )
+        return await self.fetch(
+            "SELECT id, moderator_id, action, reason, timestamp FROM moderation_log "
+            "WHERE guild_id = ? AND user_id = ? ORDER BY timestamp DESC, id DESC LIMIT ?",
+            (guild_id, user_id, limit)
+        )
+
+    async def action_counts(self, guild_id: int, user_id: int) -> Dict[str, int]:
+        """Quantas ações de cada tipo o usuário tem no servidor, lidas da tabela de resumo."""
+        rows = await self.fetch(
+            "SELECT action, count FROM moderation_summary WHERE guild_id = ? AND user_id = ? AND count > 0",
+            (guild_id, user_id)
+        )
+        return dict(rows)
+
+    async def warn_count(self, guild_id: int, user_id: int = None) -> int:
+        """Quantos avisos o usuário (ou o servidor inteiro, sem user_id) tem; conta só no índice."""
+        if user_id is None:
+            rows = await self.fetch("SELECT COUNT(*) FROM warns WHERE guild_id = ?", (guild_id,))
+        else:
+            rows = await self.fetch("SELECT COUNT(*) FROM warns WHERE guild_id IN (?, ?) AND user_id = ?", (guild_id, LEGACY_GUILD_ID, user_id))
+        return rows[0][0]
+
+    async def recent_warns(self, guild_id: int, user_id: int, limit: int) -> List[tuple]:
+        """Os `limit` avisos mais recentes do usuário (id, moderator_id, reason, timestamp), mais recentes primeiro."""
+        return await self.fetch(
+            "SELECT id, moderator_id, reason, timestamp FROM warns "
+            "WHERE guild_id IN (?, ?) AND user_id = ? ORDER BY timestamp DESC, id DESC LIMIT ?",
+            (guild_id, LEGACY_GUILD_ID, user_id, limit)
+        )
+
+    # ---- Encerramento ----
+
+    def close(self):
+        """Grava o que ainda está na fila e fecha as conexões (bloqueante)."""
+        if self.closed:
+            return
+        self.closed = True
+        self.write_queue.put(None)
+        self.writer.join(timeout=10)
+        self.read_executor.shutdown(wait=True)
+        with self.read_lock:
+            for conn in self.read_connections:
+                conn.close()
+            self.read_connections.clear()
+
+
+def get_moderation_log(bot) -> ModerationLog:
+    """Instância compartilhada do log de moderação, criada na primeira cog que pedir."""
+    moderation_log = getattr(bot, "moderation_log", None)
+    if moderation_log is None or moderation_log.closed:
+        moderation_log = bot.moderation_log = ModerationLog()
+        # Garante que a fila de escrita seja gravada mesmo se o processo encerrar sem descarregar as cogs
+        atexit.register(moderation_log.close)
+    return moderation_log
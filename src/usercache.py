@@ -0,0 +1,94 @@
+"""
+Cache de identidade de usuários (moderadores) para os embeds de moderação.
+
+Resolve IDs primeiro pelo cache do próprio discord.py, depois por um LRU com TTL e, só para o que faltar,
+com fetch_user em paralelo (um por ID, mesmo que vários comandos peçam o mesmo usuário ao mesmo tempo).
+"""
+
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional, Tuple
+
+import discord
+
+# Por quanto tempo (segundos) um usuário buscado via API fica em cache
+USER_CACHE_TTL = 3600
+# Máximo de usuários guardados; os menos usados recentemente saem primeiro
+USER_CACHE_SIZE = 1024
+
+
+class UserCache:
+    def __init__(self, bot, ttl: float = USER_CACHE_TTL, max_size: int = USER_CACHE_SIZE):
+        self.bot = bot
+        self.ttl = ttl
+        self.max_size = max_size
+        # user_id -> (expira em, usuário ou None se a conta não existe mais)
+        self.entries: "OrderedDict[int, Tuple[float, Optional[discord.User]]]" = OrderedDict()
+        # Buscas em andamento, para pedidos simultâneos do mesmo ID esperarem a mesma chamada
+        self.pending: Dict[int, asyncio.Task] = {}
+
+    def get_cached(self, user_id: int) -> Tuple[bool, Optional[discord.User]]:
+        user = self.bot.get_user(user_id)
+        if user is not None:
+            return True, user
+        entry = self.entries.get(user_id)
+        if entry is None:
+            return False, None
+        if entry[0] < time.monotonic():
+            del self.entries[user_id]
+            return False, None
+        self.entries.move_to_end(user_id)
+        return True, entry[1]
+
+    def store(self, user_id: int, user: Optional[discord.User]):
+        self.entries[user_id] = (time.monotonic() + self.ttl, user)
+        self.entries.move_to_end(user_id)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    async def fetch(self, user_id: int) -> Optional[discord.User]:
+        task = self.pending.get(user_id)
+        if task is None:
+            task = self.pending[user_id] = asyncio.create_task(self.fetch_uncached(user_id))
+            task.add_done_callback(lambda _, user_id=user_id: self.pending.pop(user_id, None))
+        # shield: se um comando for cancelado, a busca continua para os outros que esperam o mesmo ID
+        return await asyncio.shield(task)
+
+    async def fetch_uncached(self, user_id: int) -> Optional[discord.User]:
+        try:
+            user = await self.bot.fetch_user(user_id)
+        except discord.NotFound:
+            user = None # Conta apagada: guarda o "não existe" também, para não perguntar de novo
+        except discord.HTTPException as e:
+            print(f"Erro ao buscar o usuário {user_id}: {e}")
+            return None
+        self.store(user_id, user)
+        return user
+
+    async def resolve(self, user_id: int) -> Optional[discord.User]:
+        hit, user = self.get_cached(user_id)
+        return user if hit else await self.fetch(user_id)
+
+    async def resolve_many(self, user_ids: Iterable[Optional[int]]) -> Dict[int, Optional[discord.User]]:
+        """Resolve vários IDs de uma vez; os que não estão em cache são buscados em paralelo, cada ID uma única vez."""
+        resolved: Dict[int, Optional[discord.User]] = {}
+        missing = []
+        for user_id in dict.fromkeys(user_id for user_id in user_ids if user_id):
+            hit, user = self.get_cached(user_id)
+            if hit:
+                resolved[user_id] = user
+            else:
+                missing.append(user_id)
+        if missing:
+            users = await asyncio.gather(*(self.fetch(user_id) for user_id in missing))
+            resolved.update(zip(missing, users))
+        return resolved
+
+
+def get_user_cache(bot) -> UserCache:
+    """Instância compartilhada do cache de usuários, criada na primeira cog que pedir."""
+    user_cache = getattr(bot, "user_cache", None)
+    if user_cache is None:
+        user_cache = bot.user_cache = UserCache(bot)
+    return user_cache